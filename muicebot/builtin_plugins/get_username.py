@@ -1,7 +1,7 @@
 from nonebot.adapters import Bot, Event
 
 from muicebot.plugin import PluginMetadata
-from muicebot.plugin.func_call import on_function_call
+from muicebot.plugin.func_call import CachePolicy, on_function_call
 from muicebot.utils.utils import get_username as get_username_
 
 __plugin_meta__ = PluginMetadata(
@@ -9,7 +9,7 @@ __plugin_meta__ = PluginMetadata(
 )
 
 
-@on_function_call(description="获取当前对话的用户名字")
+@on_function_call(description="获取当前对话的用户名字", cache=CachePolicy(ttl=300, scope="user"))
 async def get_username(bot: Bot, event: Event) -> str:
     user_id = event.get_user_id()
     return await get_username_(user_id)
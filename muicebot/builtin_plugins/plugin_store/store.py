@@ -3,11 +3,12 @@ import shutil
 from pathlib import Path
 from typing import Optional
 
-import aiohttp
+import httpx
 from nonebot import logger
 from nonebot_plugin_alconna import UniMessage
 
 from muicebot.plugin import load_plugin
+from muicebot.utils.http import get_http_client
 
 from .config import config
 from .models import PluginInfo
@@ -23,11 +24,10 @@ async def get_index() -> Optional[dict[str, PluginInfo]]:
     """
     logger.info("获取插件索引文件...")
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(config.store_index) as response:
-                response.raise_for_status()
-                return await response.json(content_type=None)
-    except aiohttp.ClientError as e:
+        response = await get_http_client().get(config.store_index)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError as e:
         logger.error(f"获取插件索引失败: {e}")
     except Exception as e:
         logger.exception(f"解析插件索引时发生意外错误: {e}")
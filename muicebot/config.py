@@ -35,6 +35,33 @@ class PluginConfig(BaseModel):
     """启用内嵌插件"""
     max_history_epoch: int = 0
     """最大历史轮数"""
+    max_history_tokens: int = 0
+    """
+    对话历史的最大 token 数（估算值），为 0 时不限制。对所有模型生效；
+    若模型配置中同时设置了 `history_token_budget`，取两者中较小的非零值
+    """
+    enable_history_summary: bool = False
+    """启用对话摘要：将滑出历史窗口的对话压缩为摘要（需要设置 max_history_epoch）"""
+    summary_trigger_turns: int = 10
+    """滑出历史窗口的对话累计达到该轮数时更新一次摘要"""
+    enable_memory_retrieval: bool = False
+    """启用检索式长期记忆：嵌入滑出历史窗口的对话，并检索与当前消息相关的对话（需要设置 max_history_epoch 和嵌入模型）"""
+    memory_embedding_config: Optional[str] = None
+    """长期记忆使用的嵌入模型配置名，为空时使用默认嵌入模型配置"""
+    memory_top_k: int = 3
+    """每次检索的最大对话轮数"""
+    memory_min_score: float = 0.5
+    """检索结果的最低余弦相似度"""
+    memory_token_budget: int = 512
+    """注入的早期对话的最大 token 数（估算值），为 0 时不限制"""
+    memory_max_indexes: int = 64
+    """内存中保留的最大记忆索引数（每个用户存档一个），超出时淘汰最久未使用的索引，为 0 时不限制"""
+    function_call_max_workers: int = 4
+    """运行同步工具函数的线程池大小"""
+    function_call_process_workers: int = 0
+    """运行 CPU 密集型工具函数的进程池大小，为 0 时使用 CPU 核心数"""
+    prepare_timeout: float = 0
+    """模型请求准备阶段（提示词、对话历史、工具列表）的截止时间（秒），为 0 时不限制"""
     enable_adapters: list = ["nonebot.adapters.onebot.v11", "nonebot.adapters.onebot.v12"]
     """启用的 Nonebot 适配器"""
     input_timeout: int = 0
@@ -45,6 +72,42 @@ class PluginConfig(BaseModel):
     """针对 Deepseek-R1 等思考模型的思考过程提取模式"""
     enable_embedding_cache: bool = True
     """启用嵌入缓存"""
+    embedding_cache_max_rows: int = 0
+    """整理嵌入缓存时每个嵌入模型最多保留的向量数量（保留最近写入的），为 0 时不限制"""
+    enable_request_coalescing: bool = True
+    """合并同时进行的相同模型请求（非流式且不含工具）与嵌入请求，共享同一次服务商调用的结果"""
+    db_write_batch_size: int = 64
+    """后台写入队列单次提交的最大记录数"""
+    db_write_interval: float = 1.0
+    """后台写入队列的最长提交间隔（秒）"""
+    db_write_queue_size: int = 2048
+    """后台写入队列的最大长度，队列已满时写入方将等待"""
+    db_write_max_retries: int = 5
+    """后台写入失败（例如数据库被锁定）时的最大重试次数，重试间隔指数增长，全部失败后丢弃该批次"""
+    http_timeout: float = 30
+    """共享 HTTP 连接池的默认请求超时时间（秒）"""
+    http_connect_timeout: float = 10
+    """共享 HTTP 连接池的连接超时时间（秒）"""
+    http_host_timeouts: dict[str, float] = {}
+    """按主机名覆盖的请求超时时间（秒），例如 `{"api.openai.com": 120}`"""
+    http_max_connections: int = 100
+    """共享 HTTP 连接池的最大连接数"""
+    http_max_keepalive_connections: int = 20
+    """共享 HTTP 连接池保持的最大空闲连接数"""
+    http_keepalive_expiry: float = 30
+    """空闲连接的保持时间（秒）"""
+    http2: bool = True
+    """启用 HTTP/2（依赖 `httpx[http2]` 安装的 `h2`，缺失时回退到 HTTP/1.1）"""
+    download_max_size: int = 50 * 1024 * 1024
+    """下载文件的最大大小（字节），为 0 时不限制"""
+    download_allowed_types: list[str] = ["image/", "audio/", "video/", "application/", "text/plain"]
+    """允许下载的 Content-Type 前缀，为空时不限制（响应未提供 Content-Type 时总是允许）"""
+    download_concurrency: int = 4
+    """全局同时进行的文件下载数量"""
+    media_gc_interval: float = 24
+    """清理未被引用的多模态文件的间隔（小时），为 0 时不自动清理"""
+    media_gc_grace: int = 3600
+    """多模态文件的保护期（秒），修改时间在保护期内的文件不会被清理（其所属消息可能尚未入库）"""
 
 
 plugin_config = get_plugin_config(PluginConfig)
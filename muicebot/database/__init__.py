@@ -1,4 +1,4 @@
-from .crud import MessageORM, UserORM
-from .orm_models import Msg, User
+from .crud import MessageORM, SummaryORM, UserORM
+from .orm_models import Msg, Summary, User
 
-__all__ = ["MessageORM", "UserORM", "Msg", "User"]
+__all__ = ["MessageORM", "SummaryORM", "UserORM", "Msg", "Summary", "User"]
@@ -0,0 +1,202 @@
+"""
+对话历史的内存缓存
+
+在 `MessageORM` 之前维护一层按 (userid, profile) 和 groupid 划分的环形缓冲区，
+长度与 `max_history_epoch` 一致。缓冲区在首次读取时从数据库填充，此后由 `add_item` 追加，
+并在 `mark_history_as_unavailable` 和 `UserORM.set_profile` 时失效。
+
+从开始查询数据库到填充缓冲区之间追加的消息会被单独记录，填充时按 ID 去重后合并，避免查询结果中缺少这些消息
+"""
+
+from collections import deque
+from dataclasses import replace
+from typing import Deque, Dict, List, Optional, Tuple, Union
+
+from ..models import Message
+
+
+def _copy(message: Message) -> Message:
+    """
+    返回一个浅拷贝，避免调用方（例如 `_prepare_history`）修改缓存中的对象
+    """
+    return replace(message, resources=list(message.resources))
+
+
+_Key = Union[Tuple[str, str], str]
+"""缓冲区键: (userid, profile) 或 groupid"""
+
+
+class HistoryCache:
+    def __init__(self) -> None:
+        self._user_history: Dict[Tuple[str, str], Deque[Message]] = {}
+        """用户对话历史缓存: (userid, profile) -> 环形缓冲区"""
+        self._group_history: Dict[str, Deque[Message]] = {}
+        """群组对话历史缓存: groupid -> 环形缓冲区"""
+        self._profiles: Dict[str, str] = {}
+        """用户当前存档缓存: userid -> profile"""
+        self._filling: Dict[_Key, List[Message]] = {}
+        """正在从数据库填充的缓冲区: 键 -> 查询期间追加的消息"""
+
+    @property
+    def maxlen(self) -> int:
+        """
+        缓冲区长度（为 0 时表示不限制历史轮数，此时不启用缓存）
+        """
+        from ..config import plugin_config
+
+        return max(plugin_config.max_history_epoch, 0)
+
+    def _acceptable(self, limit: int) -> bool:
+        """
+        判断一次查询是否可以由缓存满足
+        """
+        return 0 < limit <= self.maxlen
+
+    def get_profile(self, userid: str) -> Optional[str]:
+        return self._profiles.get(userid)
+
+    def set_profile(self, userid: str, profile: str):
+        self._profiles[userid] = profile
+
+    def get_user_history(self, userid: str, profile: str, limit: int) -> Optional[List[Message]]:
+        """
+        获取用户对话历史，未命中时返回 None
+        """
+        if not self._acceptable(limit):
+            return None
+        history = self._user_history.get((userid, profile))
+        if history is None:
+            return None
+        return [_copy(item) for item in list(history)[-limit:]]
+
+    def get_group_history(self, groupid: str, limit: int) -> Optional[List[Message]]:
+        """
+        获取群组对话历史，未命中时返回 None
+        """
+        if not self._acceptable(limit):
+            return None
+        history = self._group_history.get(groupid)
+        if history is None:
+            return None
+        return [_copy(item) for item in list(history)[-limit:]]
+
+    def begin_fill(self, key: _Key, limit: int) -> Optional[List[Message]]:
+        """
+        在查询数据库前调用，此后追加到该缓冲区的消息会被记录下来，在填充时合并
+
+        只有查询长度与缓冲区长度一致时才会填充，否则无法保证缓存的完整性
+
+        :param key: (userid, profile) 或 groupid
+        :return: 记录查询期间追加的消息的列表，该查询不能用于填充时返回 None
+        """
+        if limit != self.maxlen or not limit:
+            return None
+        return self._filling.setdefault(key, [])
+
+    def end_fill(self, key: _Key, pending: Optional[List[Message]]):
+        """
+        结束填充（查询失败时也需要调用）
+        """
+        if pending is not None and self._filling.get(key) is pending:
+            del self._filling[key]
+
+    def _fill(self, key: _Key, messages: List[Message], pending: Optional[List[Message]]) -> Optional[Deque[Message]]:
+        """
+        合并查询结果与查询期间追加的消息
+
+        :return: 填充后的缓冲区。填充已被其他查询完成或在查询期间缓存失效时返回 None
+        """
+        if pending is None or self._filling.get(key) is not pending:
+            return None
+        del self._filling[key]
+
+        ids = {item.id for item in messages}
+        history = deque((_copy(item) for item in messages), maxlen=self.maxlen)
+        # 追加的消息与缓存共享同一对象，若已落库则已回填 ID，可与查询结果去重
+        history.extend(item for item in pending if item.id is None or item.id not in ids)
+        return history
+
+    def fill_user_history(self, userid: str, profile: str, messages: List[Message], pending: Optional[List[Message]]):
+        """
+        使用数据库查询结果填充用户对话历史缓存
+
+        :param pending: `begin_fill` 的返回值
+        """
+        if (history := self._fill((userid, profile), messages, pending)) is not None:
+            self._user_history[(userid, profile)] = history
+
+    def fill_group_history(self, groupid: str, messages: List[Message], pending: Optional[List[Message]]):
+        """
+        使用数据库查询结果填充群组对话历史缓存
+
+        :param pending: `begin_fill` 的返回值
+        """
+        if (history := self._fill(groupid, messages, pending)) is not None:
+            self._group_history[groupid] = history
+
+    def append(self, message: Message) -> Message:
+        """
+        追加一条新消息（只追加到已经填充过的缓冲区，正在填充的缓冲区会在填充时合并）
+
+        :return: 缓存中保存的副本，对其回填的 ID 对缓存同样可见
+        """
+        cached = _copy(message)
+        if not message.history:
+            return cached
+
+        if (history := self._user_history.get((message.userid, message.profile))) is not None:
+            history.append(cached)
+        elif (pending := self._filling.get((message.userid, message.profile))) is not None:
+            pending.append(cached)
+
+        if message.groupid != "-1":
+            if (history := self._group_history.get(message.groupid)) is not None:
+                history.append(cached)
+            elif (pending := self._filling.get(message.groupid)) is not None:
+                pending.append(cached)
+
+        return cached
+
+    def invalidate_user(self, userid: str, profile: Optional[str] = None):
+        """
+        使某个用户的对话历史缓存失效
+
+        由于群组历史中也包含了该用户的消息，所有包含该用户消息的群组缓存也一并失效
+
+        :param userid: 用户id
+        :param profile: (可选)存档名，为空时使该用户的全部存档失效
+        """
+        for key in [key for key in self._user_history if key[0] == userid and profile in (None, key[1])]:
+            del self._user_history[key]
+
+        # 正在进行的查询可能读到了失效前的数据，取消这些填充（无法判断群组查询是否包含该用户，因此全部取消）
+        for key in [
+            key for key in self._filling if isinstance(key, str) or (key[0] == userid and profile in (None, key[1]))
+        ]:
+            del self._filling[key]
+
+        for groupid in [
+            groupid
+            for groupid, history in self._group_history.items()
+            if any(item.userid == userid for item in history)
+        ]:
+            del self._group_history[groupid]
+
+    def invalidate_profile(self, userid: str):
+        """
+        使用户存档缓存以及其对话历史缓存失效 (适用于切换存档)
+        """
+        self._profiles.pop(userid, None)
+        for key in [key for key in self._user_history if key[0] == userid]:
+            del self._user_history[key]
+        for key in [key for key in self._filling if isinstance(key, tuple) and key[0] == userid]:
+            del self._filling[key]
+
+    def clear(self):
+        self._user_history.clear()
+        self._group_history.clear()
+        self._profiles.clear()
+        self._filling.clear()
+
+
+history_cache = HistoryCache()
@@ -3,10 +3,12 @@ from datetime import datetime
 from typing import List, Literal, Optional
 
 from nonebot_plugin_orm import async_scoped_session
-from sqlalchemy import desc, func, select, update
+from sqlalchemy import delete, desc, func, select, update
 
 from ..models import Message, Resource
-from .orm_models import Msg, Usage, User
+from .cache import history_cache
+from .orm_models import DailyStats, Msg, Summary, Usage, User
+from .writer import persistence_queue
 
 
 class MessageORM:
@@ -16,6 +18,7 @@ class MessageORM:
         反序列化为 Message 实例
         """
         return Message(
+            id=row.id,
             time=row.time,
             userid=row.userid,
             groupid=row.groupid,
@@ -24,6 +27,24 @@ class MessageORM:
             resources=[Resource(**r) for r in json.loads(row.resources or "[]")],
             usage=row.usage,
             profile=row.profile,
+            timestamp=row.timestamp or 0,
+        )
+
+    @staticmethod
+    def to_orm(message: Message) -> Msg:
+        """
+        序列化为 ORM 对象（`message.profile` 需已确定）
+        """
+        return Msg(
+            time=message.time,
+            userid=message.userid,
+            groupid=message.groupid,
+            message=message.message,
+            respond=message.respond,
+            resources=json.dumps([r.to_dict() for r in message.resources], ensure_ascii=False),
+            usage=message.usage,
+            profile=message.profile,
+            timestamp=message.timestamp,
         )
 
     @staticmethod
@@ -34,7 +55,7 @@ class MessageORM:
         # 只查三个属性即可
         result = await session.execute(
             select(Msg).where(
-                Msg.time == message.time,
+                Msg.timestamp == message.timestamp,
                 Msg.message == message.message,
                 Msg.respond == message.respond,
             )
@@ -46,20 +67,21 @@ class MessageORM:
         """
         将消息保存到数据库
         """
-        resources = json.dumps([r.to_dict() for r in message.resources], ensure_ascii=False)
-        profile = await UserORM.get_user_profile(session, message.userid)
-        session.add(
-            Msg(
-                time=message.time,
-                userid=message.userid,
-                groupid=message.groupid,
-                message=message.message,
-                respond=message.respond,
-                resources=resources,
-                usage=message.usage,
-                profile=profile,
-            )
-        )
+        message.profile = await UserORM.get_user_profile(session, message.userid)
+        session.add(MessageORM.to_orm(message))
+        if message.usage != -1:
+            await DailyStatsORM.add_stats(session, message.time[:10], 1, message.usage)
+        history_cache.append(message)
+
+    @staticmethod
+    async def queue_item(session: async_scoped_session, message: Message):
+        """
+        将消息加入后台写入队列，由 `persistence_queue` 批量落库
+
+        消息会立即进入对话历史缓存，因此后续请求无需等待写入完成即可读到
+        """
+        message.profile = await UserORM.get_user_profile(session, message.userid)
+        await persistence_queue.put_message(history_cache.append(message))
 
     @staticmethod
     async def get_user_history(session: async_scoped_session, userid: str, limit: int = 0) -> List[Message]:
@@ -72,12 +94,27 @@ class MessageORM:
         :return: 消息列表
         """
         profile = await UserORM.get_user_profile(session, userid)
-        stmt = select(Msg).where(Msg.userid == userid, Msg.history == 1, Msg.profile == profile).order_by(desc(Msg.id))
-        if limit:
-            stmt = stmt.limit(limit)
-        result = await session.execute(stmt)
-        rows = result.scalars().all()
-        return [MessageORM._convert(msg) for msg in rows][::-1]
+
+        if (cached := history_cache.get_user_history(userid, profile, limit)) is not None:
+            return cached
+
+        pending = history_cache.begin_fill((userid, profile), limit)
+        try:
+            await persistence_queue.flush()
+            stmt = (
+                select(Msg).where(Msg.userid == userid, Msg.history == 1, Msg.profile == profile).order_by(desc(Msg.id))
+            )
+            if limit:
+                stmt = stmt.limit(limit)
+            result = await session.execute(stmt)
+            rows = result.scalars().all()
+            history = [MessageORM._convert(msg) for msg in rows][::-1]
+
+            history_cache.fill_user_history(userid, profile, history, pending)
+        finally:
+            history_cache.end_fill((userid, profile), pending)
+
+        return history
 
     @staticmethod
     async def get_group_history(session: async_scoped_session, groupid: str, limit: int = 0) -> List[Message]:
@@ -89,12 +126,80 @@ class MessageORM:
 
         :return: 消息列表
         """
-        stmt = select(Msg).where(Msg.groupid == groupid, Msg.history == 1).order_by(desc(Msg.id))
+        if (cached := history_cache.get_group_history(groupid, limit)) is not None:
+            return cached
+
+        pending = history_cache.begin_fill(groupid, limit)
+        try:
+            await persistence_queue.flush()
+            stmt = select(Msg).where(Msg.groupid == groupid, Msg.history == 1).order_by(desc(Msg.id))
+            if limit:
+                stmt = stmt.limit(limit)
+            result = await session.execute(stmt)
+            rows = result.scalars().all()
+            history = [MessageORM._convert(msg) for msg in rows][::-1]
+
+            history_cache.fill_group_history(groupid, history, pending)
+        finally:
+            history_cache.end_fill(groupid, pending)
+
+        return history
+
+    @staticmethod
+    async def get_evicted_history(
+        session: async_scoped_session, userid: str, profile: str, after_id: int, window: int, limit: int = 0
+    ) -> List[Message]:
+        """
+        获取已滑出对话历史窗口的消息（即最近 window 条之前的消息）
+
+        :param userid: 用户id
+        :param profile: 存档名
+        :param after_id: 只返回 ID 大于该值的消息
+        :param window: 对话历史窗口长度
+        :param limit: (可选) 返回的最大长度，当该变量设为0时表示全部返回
+
+        :return: 按时间升序排列的消息列表
+        """
+        await persistence_queue.flush()
+
+        window_ids = (
+            select(Msg.id)
+            .where(Msg.userid == userid, Msg.history == 1, Msg.profile == profile)
+            .order_by(desc(Msg.id))
+            .limit(window)
+        )
+        stmt = (
+            select(Msg)
+            .where(
+                Msg.userid == userid,
+                Msg.history == 1,
+                Msg.profile == profile,
+                Msg.id > after_id,
+                Msg.id.not_in(window_ids.scalar_subquery()),
+            )
+            .order_by(Msg.id)
+        )
         if limit:
             stmt = stmt.limit(limit)
         result = await session.execute(stmt)
-        rows = result.scalars().all()
-        return [MessageORM._convert(msg) for msg in rows][::-1]
+        return [MessageORM._convert(msg) for msg in result.scalars().all()]
+
+    @staticmethod
+    async def get_messages_by_ids(session: async_scoped_session, ids: List[int]) -> List[Message]:
+        """
+        按消息 ID 获取仍可用的消息
+
+        :param ids: 消息 ID 列表
+        :return: 消息列表（顺序不定，已被标记为不可用的消息不会返回）
+        """
+        if not ids:
+            return []
+
+        await persistence_queue.flush()
+
+        stmt = select(Msg).where(Msg.id.in_(ids), Msg.history == 1)
+        result = await session.execute(stmt)
+        return [MessageORM._convert(msg) for msg in result.scalars().all()]
 
     @staticmethod
     async def mark_history_as_unavailable(
@@ -110,6 +215,7 @@ class MessageORM:
         :param limit: (可选)最大操作数
         """
         profile = await UserORM.get_user_profile(session, userid)
+        await persistence_queue.flush()
         if limit:
             subq = (
                 select(Msg.id)
@@ -123,6 +229,22 @@ class MessageORM:
         else:
             await session.execute(update(Msg).where(Msg.userid == userid, Msg.profile == profile).values(history=0))
 
+        history_cache.invalidate_user(userid, profile)
+
+    @staticmethod
+    async def get_referenced_resources(session: async_scoped_session) -> set[str]:
+        """
+        获取仍可用的对话记录（`history=1`）所引用的全部本地文件路径
+        """
+        await persistence_queue.flush()
+        stmt = select(Msg.resources).where(Msg.history == 1, Msg.resources != "[]")
+
+        paths = set()
+        for resources in (await session.execute(stmt)).scalars():
+            paths.update(r["path"] for r in json.loads(resources or "[]") if r.get("path"))
+
+        return paths
+
     @staticmethod
     async def get_model_usage(session: async_scoped_session) -> tuple[int, int]:
         """
@@ -130,11 +252,8 @@ class MessageORM:
 
         :return: today_usage, total_usage
         """
-        total = await session.execute(select(func.sum(Msg.usage)).where(Msg.usage != -1))
-        today = await session.execute(
-            select(func.sum(Msg.usage)).where(Msg.usage != -1, Msg.time.like(f"{datetime.now().strftime('%Y.%m.%d')}%"))
-        )
-        return (today.scalar() or 0), (total.scalar() or 0)
+        await persistence_queue.flush()
+        return await DailyStatsORM.get_stats(session, "tokens")
 
     @staticmethod
     async def get_conv_count(session: async_scoped_session) -> tuple[int, int]:
@@ -143,11 +262,8 @@ class MessageORM:
 
         :return: today_count, total_count
         """
-        total = await session.execute(select(func.count()).where(Msg.usage != -1))
-        today = await session.execute(
-            select(func.count()).where(Msg.usage != -1, Msg.time.like(f"{datetime.now().strftime('%Y.%m.%d')}%"))
-        )
-        return (today.scalar() or 0), (total.scalar() or 0)
+        await persistence_queue.flush()
+        return await DailyStatsORM.get_stats(session, "conversations")
 
 
 class UserORM:
@@ -182,15 +298,21 @@ class UserORM:
         :param nickname: 消息存档名
         """
         await session.execute(update(User).where(User.userid == userid).values(profile=profile))
+        history_cache.invalidate_profile(userid)
 
     @staticmethod
     async def get_user_profile(session: async_scoped_session, userid: str) -> str:
+        if (profile := history_cache.get_profile(userid)) is not None:
+            return profile
+
         result = await session.execute(select(User.profile).where(User.userid == userid).limit(1))
         profile = result.scalar_one_or_none()
-        if profile is not None:
-            return profile
-        await UserORM.create_user(session, userid)
-        return "_default"
+        if profile is None:
+            await UserORM.create_user(session, userid)
+            profile = "_default"
+
+        history_cache.set_profile(userid, profile)
+        return profile
 
 
 class UsageORM:
@@ -213,7 +335,8 @@ class UsageORM:
         if plugin:
             query = query.where(Usage.plugin == plugin)
         if date:
-            query = query.where(Usage.date.like(date))
+            # 仅在传入通配符时使用 LIKE，否则使用等值查询以命中索引
+            query = query.where(Usage.date.like(date) if "%" in date else Usage.date == date)
         if type:
             query = query.where(Usage.type == type)
         result = await session.execute(query)
@@ -221,15 +344,21 @@ class UsageORM:
 
     @staticmethod
     async def save_usage(
-        session: async_scoped_session, plugin: str, total_tokens: int, type: Literal["chat", "embedding"] = "chat"
+        session: async_scoped_session,
+        plugin: str,
+        total_tokens: int,
+        type: Literal["chat", "embedding"] = "chat",
+        date: Optional[str] = None,
     ):
         """
         保存用量信息
+
+        :param date: (可选)日期(`%Y.%m.%d`)，默认为今天
         """
         if total_tokens < 0:
             return
 
-        date = datetime.now().strftime("%Y.%m.%d")
+        date = date or datetime.now().strftime("%Y.%m.%d")
         stmt = await session.execute(
             select(Usage).where(Usage.plugin == plugin, Usage.type == type, Usage.date == date).limit(1)
         )
@@ -240,3 +369,87 @@ class UsageORM:
             return
 
         session.add(Usage(plugin=plugin, type=type, date=date, tokens=total_tokens))
+
+
+class SummaryORM:
+    @staticmethod
+    async def get_summary(session: async_scoped_session, userid: str, profile: str) -> Optional[Summary]:
+        """
+        获取用户某一存档的对话摘要
+        """
+        result = await session.execute(
+            select(Summary).where(Summary.userid == userid, Summary.profile == profile).limit(1)
+        )
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def save_summary(session: async_scoped_session, userid: str, profile: str, content: str, last_msg_id: int):
+        """
+        保存对话摘要
+
+        :param content: 摘要内容
+        :param last_msg_id: 摘要所覆盖的最后一条消息 ID
+        """
+        summary = await SummaryORM.get_summary(session, userid, profile)
+
+        if summary is not None:
+            summary.content = content
+            summary.last_msg_id = last_msg_id
+            return
+
+        session.add(Summary(userid=userid, profile=profile, content=content, last_msg_id=last_msg_id))
+
+    @staticmethod
+    async def delete_summary(session: async_scoped_session, userid: str, profile: Optional[str] = None):
+        """
+        删除对话摘要
+
+        :param profile: (可选)存档名，为空时删除该用户的全部摘要
+        """
+        stmt = delete(Summary).where(Summary.userid == userid)
+        if profile is not None:
+            stmt = stmt.where(Summary.profile == profile)
+        await session.execute(stmt)
+
+
+class DailyStatsORM:
+    """
+    按日汇总的对话统计，随每条对话记录增量维护，避免 `.status` 全表扫描 `Msg`
+    """
+
+    @staticmethod
+    async def add_stats(session: async_scoped_session, date: str, conversations: int, tokens: int):
+        """
+        累加某日的对话统计
+
+        :param date: 日期(`%Y.%m.%d`)
+        :param conversations: 新增对话次数
+        :param tokens: 新增模型用量
+        """
+        stats = await session.get(DailyStats, date)
+
+        if stats is not None:
+            stats.conversations += conversations
+            stats.tokens += tokens
+            return
+
+        session.add(DailyStats(date=date, conversations=conversations, tokens=tokens))
+
+    @staticmethod
+    async def get_stats(
+        session: async_scoped_session, column: Literal["conversations", "tokens"], date: Optional[str] = None
+    ) -> tuple[int, int]:
+        """
+        获取某日与全部日期的统计值
+
+        :param column: 统计项
+        :param date: (可选)日期(`%Y.%m.%d`)，默认为今天
+
+        :return: 当日统计值，总统计值
+        """
+        date = date or datetime.now().strftime("%Y.%m.%d")
+        target = getattr(DailyStats, column)
+
+        today = await session.execute(select(target).where(DailyStats.date == date))
+        total = await session.execute(select(func.sum(target)))
+        return (today.scalar() or 0), (total.scalar() or 0)
@@ -1,5 +1,5 @@
 from nonebot_plugin_orm import Model
-from sqlalchemy import Integer, String, Text
+from sqlalchemy import Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column
 
 
@@ -14,6 +14,13 @@ class Msg(Model):
     resources: Mapped[str] = mapped_column(Text, nullable=True, default="[]")
     usage: Mapped[int] = mapped_column(Integer, nullable=True, default=-1)
     profile: Mapped[str] = mapped_column(String, nullable=True, default="_default")
+    timestamp: Mapped[int] = mapped_column(Integer, nullable=True, default=0)
+
+    __table_args__ = (
+        Index("ix_muicebot_msg_userid_profile_history", "userid", "profile", "history"),
+        Index("ix_muicebot_msg_groupid_history", "groupid", "history"),
+        Index("ix_muicebot_msg_timestamp", "timestamp"),
+    )
 
 
 class User(Model):
@@ -22,6 +29,8 @@ class User(Model):
     nickname: Mapped[str] = mapped_column(String, nullable=True, default="_default")
     profile: Mapped[str] = mapped_column(String, nullable=True, default="_default")
 
+    __table_args__ = (Index("ix_muicebot_user_userid", "userid"),)
+
 
 class Usage(Model):
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
@@ -29,3 +38,21 @@ class Usage(Model):
     type: Mapped[str] = mapped_column(String, nullable=False)
     date: Mapped[str] = mapped_column(String, nullable=False)
     tokens: Mapped[int] = mapped_column(Integer, nullable=True, default=0)
+
+    __table_args__ = (Index("ix_muicebot_usage_plugin_type_date", "plugin", "type", "date"),)
+
+
+class Summary(Model):
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    userid: Mapped[str] = mapped_column(String, nullable=False)
+    profile: Mapped[str] = mapped_column(String, nullable=False, default="_default")
+    content: Mapped[str] = mapped_column(Text, nullable=False, default="")
+    last_msg_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_muicebot_summary_userid_profile", "userid", "profile", unique=True),)
+
+
+class DailyStats(Model):
+    date: Mapped[str] = mapped_column(String, primary_key=True)
+    conversations: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    tokens: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
@@ -0,0 +1,256 @@
+"""
+后台写入队列
+
+将对话记录 (`Msg`) 的插入和用量 (`Usage`) 的累加放到后台协程中批量提交，
+使得模型回复无需等待磁盘写入。队列满足批量大小或达到提交间隔时写入一次，并在关闭时全部落库。
+提交失败时以指数退避重试，多次失败后才丢弃该批次，并使相关的对话历史缓存失效
+"""
+
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Literal, Optional, Union
+
+from nonebot import logger
+from nonebot_plugin_orm import get_session
+
+from ..models import Message
+
+
+@dataclass
+class UsageRecord:
+    """用量累加记录"""
+
+    plugin: str
+    tokens: int
+    type: Literal["chat", "embedding"] = "chat"
+    date: str = ""
+
+    def __post_init__(self):
+        self.date = self.date or datetime.now().strftime("%Y.%m.%d")
+
+
+_Job = Union[Message, UsageRecord]
+
+_RETRY_BASE_DELAY = 0.2
+"""首次重试的等待时间（秒），之后每次翻倍"""
+
+
+class PersistenceQueue:
+    def __init__(self) -> None:
+        self._queue: Optional[asyncio.Queue[_Job]] = None
+        """待写入队列（有界，满时写入方等待）"""
+        self._pending: List[_Job] = []
+        """已从队列取出但尚未提交的记录"""
+        self._task: Optional[asyncio.Task] = None
+        """后台写入任务"""
+        self._write_lock: Optional[asyncio.Lock] = None
+        """保证同一时间只有一个批次在提交"""
+        self._wakeup: Optional[asyncio.Event] = None
+        """有新记录入队时唤醒正在凑批的后台任务"""
+        self._stopping = False
+        """是否正在停止（`wait_for` 可能吞掉取消信号，因此需要额外的标志位）"""
+
+    @property
+    def batch_size(self) -> int:
+        from ..config import plugin_config
+
+        return max(plugin_config.db_write_batch_size, 1)
+
+    @property
+    def interval(self) -> float:
+        from ..config import plugin_config
+
+        return max(plugin_config.db_write_interval, 0)
+
+    @property
+    def max_retries(self) -> int:
+        from ..config import plugin_config
+
+        return max(plugin_config.db_write_max_retries, 0)
+
+    def _ensure_started(self) -> asyncio.Queue[_Job]:
+        """
+        确保后台写入任务正在运行
+        """
+        from ..config import plugin_config
+
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=max(plugin_config.db_write_queue_size, 0))
+            self._write_lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+        return self._queue
+
+    @property
+    def pending(self) -> int:
+        """
+        尚未落库的记录数量
+        """
+        return len(self._pending) + (self._queue.qsize() if self._queue else 0)
+
+    async def put_message(self, message: Message):
+        """
+        将一条对话记录加入写入队列
+        """
+        await self._put(message)
+
+    async def put_usage(self, plugin: str, tokens: int, type: Literal["chat", "embedding"] = "chat"):
+        """
+        将一条用量记录加入写入队列
+        """
+        if tokens < 0:
+            return
+        await self._put(UsageRecord(plugin, tokens, type))
+
+    async def _put(self, job: _Job):
+        await self._ensure_started().put(job)
+        assert self._wakeup is not None
+        self._wakeup.set()
+
+    async def _run(self):
+        assert self._queue is not None and self._wakeup is not None
+        loop = asyncio.get_running_loop()
+
+        while not self._stopping:
+            # 记录出队后必须在同一步内加入 `_pending`，否则 `flush` 可能在此期间替换列表或先行提交之后的记录，
+            # 导致记录丢失或乱序（因此凑批时不使用 `wait_for(queue.get())`，而是等待入队事件后同步取出）
+            job = await self._queue.get()
+            self._pending.append(job)
+            deadline = loop.time() + self.interval
+
+            while not self._stopping:
+                while not self._queue.empty() and len(self._pending) < self.batch_size:
+                    self._pending.append(self._queue.get_nowait())
+
+                timeout = deadline - loop.time()
+                if len(self._pending) >= self.batch_size or timeout <= 0:
+                    break
+
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            # 停止时任务可能在提交途中被取消，屏蔽取消使得当前批次写完，避免中断数据库连接
+            await asyncio.shield(self._write_pending())
+
+    async def _write_pending(self):
+        """
+        在一个事务中提交所有已取出的记录，失败时重试
+        """
+        assert self._write_lock is not None
+
+        async with self._write_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+
+            for attempt in range(self.max_retries + 1):
+                try:
+                    await self._commit(batch)
+                    return
+                except Exception as e:
+                    if attempt >= self.max_retries:
+                        self._discard(batch, e)
+                        return
+                    delay = _RETRY_BASE_DELAY * 2**attempt
+                    logger.warning(f"后台写入数据库失败，{delay:.1f}s 后重试 ({attempt + 1}/{self.max_retries}): {e}")
+
+                try:
+                    await asyncio.sleep(delay)
+                except asyncio.CancelledError:
+                    # 放回待写入列表，由之后的 `flush` 写入
+                    self._pending[:0] = batch
+                    raise
+
+    def _discard(self, batch: List[_Job], error: Exception):
+        """
+        丢弃无法写入的批次，并使包含这些消息的对话历史缓存失效（缓存中的消息已无法落库）
+        """
+        from .cache import history_cache
+
+        logger.opt(exception=error).error(f"后台写入数据库多次失败，已丢弃 {len(batch)} 条记录: {error}")
+
+        for job in batch:
+            if isinstance(job, Message):
+                history_cache.invalidate_user(job.userid, job.profile)
+
+    async def _commit(self, batch: List[_Job]):
+        """
+        在一个事务中提交一个批次
+        """
+        from .crud import DailyStatsORM, MessageORM, UsageORM
+
+        messages = [job for job in batch if isinstance(job, Message)]
+        usages: dict[tuple[str, str, str], int] = defaultdict(int)
+        for job in batch:
+            if isinstance(job, UsageRecord):
+                usages[(job.plugin, job.type, job.date)] += job.tokens
+
+        stats: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+        for message in messages:
+            if message.usage != -1:
+                stats[message.time[:10]][0] += 1
+                stats[message.time[:10]][1] += message.usage
+
+        async with get_session() as session:
+            rows = [MessageORM.to_orm(message) for message in messages]
+            session.add_all(rows)
+            for (plugin, type, date), tokens in usages.items():
+                await UsageORM.save_usage(session, plugin, tokens, type, date=date)  # type:ignore
+            for date, (conversations, tokens) in stats.items():
+                await DailyStatsORM.add_stats(session, date, conversations, tokens)
+            await session.flush()
+
+            # 在提交前回填自增 ID，使得缓存中的同一对象在记录对其他查询可见之前就已获得 ID（填充缓存时依此去重）
+            # 提交失败时重试会重新分配并回填 ID
+            for message, row in zip(messages, rows):
+                message.id = row.id
+
+            await session.commit()
+
+        logger.debug(f"后台写入完成: {len(messages)} 条对话记录, {len(usages)} 条用量记录")
+
+    async def flush(self):
+        """
+        立即将队列中的全部记录写入数据库
+        """
+        if self._queue is None or self._write_lock is None:
+            return
+
+        while not self._queue.empty():
+            self._pending.append(self._queue.get_nowait())
+
+        # 调用方被取消时（例如准备阶段超时）仍需完成写入，否则已取出的记录将会丢失
+        await asyncio.shield(self._write_pending())
+
+    async def start(self):
+        """
+        启动后台写入任务
+        """
+        self._ensure_started()
+
+    async def stop(self):
+        """
+        停止后台写入任务，并将剩余记录全部落库
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await self.flush()
+
+
+persistence_queue = PersistenceQueue()
@@ -4,6 +4,15 @@ from ._dependencies import MODEL_DEPENDENCY_MAP, get_missing_dependencies
 from ._schema import ModelCompletions, ModelRequest, ModelStreamCompletions
 from .loader import load_embedding_model, load_model
 from .registry import get_embedding_class, get_llm_class, register
+from .vector_index import (
+    FlatIndex,
+    IVFIndex,
+    SearchHit,
+    VectorIndex,
+    create_vector_index,
+    evaluate_recall,
+    load_vector_index,
+)
 
 __all__ = [
     "BaseLLM",
@@ -20,4 +29,11 @@ __all__ = [
     "get_embedding_class",
     "load_model",
     "load_embedding_model",
+    "VectorIndex",
+    "FlatIndex",
+    "IVFIndex",
+    "SearchHit",
+    "create_vector_index",
+    "load_vector_index",
+    "evaluate_recall",
 ]
@@ -1,18 +1,23 @@
 from __future__ import annotations
 
-import hashlib
-import json
+import asyncio
 from abc import ABC, abstractmethod
-from functools import lru_cache
-from pathlib import Path
-from typing import Any, AsyncGenerator, Literal, Optional, Union, overload
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    Literal,
+    Optional,
+    Sequence,
+    Union,
+    overload,
+)
 
-import numpy as np
 from nonebot import logger
 from nonebot_plugin_localstore import get_plugin_data_dir
-from numpy import ndarray
 
 from ._config import EmbeddingConfig, ModelConfig
+from ._embedding_store import EmbeddingStore, get_embedding_store
 from ._schema import (
     EmbeddingsBatchResult,
     ModelCompletions,
@@ -20,6 +25,10 @@ from ._schema import (
     ModelStreamCompletions,
 )
 
+if TYPE_CHECKING:
+    from ._tool_loop import ToolLoop
+    from .vector_index import SearchHit, VectorIndex
+
 
 class BaseLLM(ABC):
     """
@@ -39,9 +48,9 @@ class BaseLLM(ABC):
 
     def __init_subclass__(cls, **kwargs):
         """
-        对实现类中的 `ask` 函数包装 `record_plugin_usage` 装饰器
+        对实现类中的 `ask` 函数包装 `coalesce_ask` 和 `record_plugin_usage` 装饰器
         """
-        from ._wrapper import record_plugin_usage
+        from ._wrapper import coalesce_ask, record_plugin_usage
 
         super().__init_subclass__(**kwargs)
 
@@ -49,7 +58,7 @@ class BaseLLM(ABC):
         original_ask = cls.ask
 
         # 2. Wrap it with the decorator
-        decorated_ask = record_plugin_usage(original_ask)
+        decorated_ask = record_plugin_usage(coalesce_ask(original_ask))
 
         # 3. Replace the original method on the subclass with the decorated version
         setattr(cls, "ask", decorated_ask)
@@ -80,18 +89,22 @@ class BaseLLM(ABC):
         return True
 
     async def _ask_sync(
-        self, messages: list, tools: Any, response_format: Any, total_tokens: int = 0
+        self, messages: list, tools: Any, response_format: Any, tool_loop: Optional["ToolLoop"] = None
     ) -> "ModelCompletions":
         """
         同步模型调用
+
+        :param tool_loop: 工具调用循环，模型请求工具调用时在循环中继续请求而非递归调用
         """
         raise NotImplementedError
 
     def _ask_stream(
-        self, messages: list, tools: Any, response_format: Any, total_tokens: int = 0
+        self, messages: list, tools: Any, response_format: Any, tool_loop: Optional["ToolLoop"] = None
     ) -> AsyncGenerator["ModelStreamCompletions", None]:
         """
         流式输出
+
+        :param tool_loop: 工具调用循环，模型请求工具调用时在循环中继续请求而非递归调用
         """
         raise NotImplementedError
 
@@ -125,6 +138,9 @@ class EmbeddingModel(ABC):
     推荐使用该基类中定义的方法构建模型加载器类，但无论如何都必须实现 `embed` 方法
     """
 
+    max_batch_size: int = 32
+    """服务商允许单次请求嵌入的最大文本数量（可被 `EmbeddingConfig.batch_size` 覆盖）"""
+
     def __init__(self, config: EmbeddingConfig):
         from ..config import plugin_config
 
@@ -134,19 +150,25 @@ class EmbeddingModel(ABC):
         if self.enable_embedding_cache:
             self.cache_dir = get_plugin_data_dir() / "embedding"
             self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._store: Optional[EmbeddingStore] = get_embedding_store(
+                self.cache_dir, self.__class__.__name__, config.api_host, config.model
+            )
         else:
             self.cache_dir = None
+            self._store = None
 
     def __init_subclass__(cls, **kwargs):
         """
-        对实现类中的 `embed` 函数包装 `record_plugin_embedding_usage` 装饰器
+        对实现类中的 `embed` 函数包装 `cache`、`coalesce_embed` 和 `record_plugin_embedding_usage` 装饰器
+
+        用量记录位于最外层：`cache` 会在新任务中并发请求各批次，此时调用栈中已无法找到调用方插件
         """
-        from ._wrapper import cache, record_plugin_embedding_usage
+        from ._wrapper import cache, coalesce_embed, record_plugin_embedding_usage
 
         super().__init_subclass__(**kwargs)
 
         original_embed = cls.embed
-        decorated_embed = cache(record_plugin_embedding_usage(original_embed))
+        decorated_embed = record_plugin_embedding_usage(coalesce_embed(cache(original_embed)))
         setattr(cls, "embed", decorated_embed)
 
     def _require(self, *require_fields: str):
@@ -159,90 +181,65 @@ class EmbeddingModel(ABC):
         if missing_fields:
             raise ValueError(f"对于 {self.config.provider} 嵌入模型，以下配置是必需的: {', '.join(missing_fields)}")
 
-    def _get_embedding_cache_path(self, text: str) -> Optional[Path]:
-        """
-        获取嵌入缓存文件路径
-
-        :param text: 查询文本
-        """
-        if not self.cache_dir:
-            return None
-
-        # 根据文本和模型名称生成缓存键
-        content = f"{self.config.model}:{text}"
-        cache_key = hashlib.md5(content.encode("utf-8"), usedforsecurity=False).hexdigest()
-
-        return self.cache_dir / cache_key
-
-    @lru_cache(maxsize=256)
-    def _load_embedding_from_cache(self, text: str) -> Optional[ndarray]:
+    def _load_embedding_from_cache(self, text: str) -> Optional[list[float]]:
         """
-        从缓存文件中加载嵌入向量
+        从缓存中加载嵌入向量
 
         :param text: 查询文本
         """
-        if not self.enable_embedding_cache:
+        if self._store is None:
             return None
 
         try:
-            cache_path = self._get_embedding_cache_path(text)
-            if not cache_path:
-                return None
-
-            meta_path = cache_path.with_suffix(".json")
-            npy_path = cache_path.with_suffix(".npy")
-
-            if not (meta_path.exists() and npy_path.exists()):
-                return None
-
-            with open(meta_path, "r", encoding="utf-8") as f:
-                meta = json.load(f)
-
-            if (
-                isinstance(meta, dict)
-                and meta.get("provider", None) == self.__class__.__name__
-                and meta.get("api_host", None) == self.config.api_host
-                and meta.get("model", None) == self.config.model
-                and meta.get("text_hash", "") == hashlib.sha256(text.encode("utf-8")).hexdigest()
-            ):
-                embedding = np.load(npy_path)
-                logger.debug(f"从缓存加载嵌入向量: {text[:50]}...")
-                return embedding
-            return None
-
+            return self._store.get(text)
         except Exception as e:
             logger.warning(f"加载缓存失败: {e}")
             return None
 
-    def _save_to_cache(self, text: str, embedding: list[float]) -> None:
+    async def _save_to_cache(self, texts: list[str], embeddings: list[list[float]]) -> None:
         """
-        将嵌入向量保存到缓存文件
+        将一批嵌入向量追加到缓存中（在线程池中写入，不阻塞事件循环）
         """
-        if not self.enable_embedding_cache or not self.cache_dir:
+        if self._store is None:
             return
 
         try:
-            cache_path = self._get_embedding_cache_path(text)
-            if not cache_path:
-                return
+            await asyncio.to_thread(self._store.append, texts, embeddings)
+            logger.debug(f"已缓存 {len(texts)} 条嵌入向量")
+        except Exception as e:
+            logger.warning(f"保存缓存失败: {e}")
 
-            meta_path = cache_path.with_suffix(".json")
-            npy_path = cache_path.with_suffix(".npy")
+    async def build_index(
+        self, texts: list[str], ids: Optional[Sequence[str]] = None, index: Optional["VectorIndex"] = None
+    ) -> "VectorIndex":
+        """
+        嵌入文本并添加到向量索引中
 
-            meta_data = {
-                "provider": self.__class__.__name__,
-                "api_host": self.config.api_host,
-                "model": self.config.model,
-                "text_hash": hashlib.sha256(text.encode("utf-8")).hexdigest(),
-            }
+        :param texts: 文本列表
+        :param ids: 向量 ID，默认为文本本身
+        :param index: 要添加到的索引，为空时按文本数量创建 `FlatIndex` 或 `IVFIndex`
+        :return: 向量索引
+        """
+        from .vector_index import create_vector_index
 
-            with open(meta_path, "w", encoding="utf-8") as f:
-                json.dump(meta_data, f)
-            np.save(npy_path, np.array(embedding), allow_pickle=False)
+        result = await self.embed(texts)
+        if index is None:
+            index = create_vector_index(len(result.embeddings[0]), len(texts))
 
-            logger.debug(f"嵌入向量已缓存: {text[:50]}...")
-        except Exception as e:
-            logger.warning(f"保存缓存失败: {e}")
+        index.add(ids if ids is not None else texts, result.embeddings)
+        return index
+
+    async def search(self, index: "VectorIndex", queries: Union[str, list[str]], k: int = 5) -> list[list["SearchHit"]]:
+        """
+        嵌入查询文本并在向量索引中检索最相似的 k 项
+
+        :param index: 向量索引
+        :param queries: 单个或多个查询文本
+        :param k: 每个查询返回的结果数量
+        :return: 每个查询的结果列表（按相似度降序）
+        """
+        result = await self.embed([queries] if isinstance(queries, str) else queries)
+        return index.search(result.embeddings, k)
 
     @abstractmethod
     async def embed(self, texts: list[str]) -> "EmbeddingsBatchResult":
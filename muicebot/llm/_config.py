@@ -2,7 +2,7 @@ from importlib.util import find_spec
 from typing import Any, List, Literal, Optional
 from warnings import warn
 
-from pydantic import BaseModel, field_validator, model_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 
 
 class ModelConfig(BaseModel):
@@ -20,6 +20,13 @@ class ModelConfig(BaseModel):
 
     max_tokens: int = 4096
     """最大回复 Tokens """
+    context_window: int = 0
+    """模型上下文窗口大小 (Tokens)，超出时依次裁剪对话历史、工具列表和系统提示。为 0 时不限制"""
+    history_token_budget: int = 0
+    """
+    该模型对话历史的最大 Tokens（估算值），为 0 时不单独限制。
+    与全局配置 `max_history_tokens` 同时设置时，取两者中较小的非零值
+    """
     temperature: float = 0.75
     """模型的温度系数"""
     top_p: float = 0.95
@@ -38,6 +45,12 @@ class ModelConfig(BaseModel):
     """是否启用联网搜索（原生实现）"""
     function_call: bool = False
     """是否启用工具调用"""
+    tool_max_steps: int = 8
+    """单次请求中最多执行的工具调用轮数"""
+    tool_token_budget: int = 0
+    """工具调用循环的总 Tokens 预算，超出后不再执行新的工具调用。为 0 时不限制"""
+    tool_loop_timeout: float = 0
+    """工具调用循环的截止时间（秒），超出后不再执行新的工具调用。为 0 时不限制"""
     content_security: bool = False
     """是否启用内容安全"""
 
@@ -111,6 +124,11 @@ class EmbeddingConfig(BaseModel):
     api_host: str = ""
     """自定义 API 地址"""
 
+    batch_size: int = Field(default=0, ge=0)
+    """单次请求嵌入的最大文本数量，为 0 时使用模型加载器的默认值"""
+    max_concurrency: int = Field(default=4, gt=0)
+    """同时进行的嵌入请求数量"""
+
     # binding_model_config: Optional[str] = None
     # """
     # 绑定的模型配置。如果切换模型，会查找该模型所绑定的嵌入配置。如果不指定绑定配置，则不切换。
@@ -0,0 +1,387 @@
+"""
+嵌入向量缓存存储
+
+每个 (提供者, API 地址, 模型) 对应一个目录，目录中只有三个文件:
+
+- `vectors-{generation}.f32`: 只追加写入的 float32 矩阵，每行一个向量
+- `index-{generation}.bin`: 与矩阵行一一对应的文本 SHA-256 摘要（每条 32 字节）
+- `meta.json`: 提供者、API 地址、模型、向量维度和当前使用的文件代数
+
+追加时先写入并同步向量，再写入索引；加载时按两者中较短的一方截断，因此崩溃后索引中的每一行都有完整的向量。
+写入失败时将两个文件截断回写入前的长度，避免之后追加的索引行与向量错位。
+追加会阻塞在磁盘同步上，应在线程池中调用；写入期间查询不受影响，只能读到已提交的行。
+整理（compact）时写入新一代文件，最后原子替换 `meta.json` 切换代数。查询结果从内存映射矩阵复制为列表，不持有映射
+"""
+
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+from nonebot import logger
+from numpy import ndarray
+
+_DIGEST_SIZE = 32
+"""SHA-256 摘要长度"""
+_COPY_ROWS = 4096
+"""整理时每次复制的行数"""
+
+_stores: dict[Path, "EmbeddingStore"] = {}
+"""存储目录 -> 已打开的存储"""
+
+
+@dataclass
+class CompactReport:
+    """
+    嵌入缓存整理报告
+    """
+
+    stores: int = 0
+    """整理的存储数量"""
+    rows_before: int = 0
+    """整理前的总行数"""
+    rows_after: int = 0
+    """整理后的总行数"""
+    migrated: int = 0
+    """从旧版逐文本缓存文件迁移的向量数量"""
+    reclaimed: int = 0
+    """回收的空间（字节）"""
+
+    def __str__(self) -> str:
+        return (
+            f"整理 {self.stores} 个存储, 行数 {self.rows_before} -> {self.rows_after}, "
+            f"迁移旧缓存 {self.migrated} 条, 回收 {self.reclaimed / 1024 / 1024:.2f} MB"
+        )
+
+
+def text_digest(text: str) -> bytes:
+    """
+    计算文本的索引键
+    """
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def _store_name(provider: str, api_host: str, model: str) -> str:
+    key = hashlib.sha256(f"{provider}\0{api_host}\0{model}".encode("utf-8")).hexdigest()[:16]
+    return f"{provider}-{key}"
+
+
+def _fsync_write(path: Path, data: bytes):
+    with open(path, "ab") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class EmbeddingStore:
+    """
+    单个嵌入模型的向量缓存
+    """
+
+    def __init__(self, directory: Path, provider: str, api_host: str, model: str) -> None:
+        self.directory = directory
+        self.provider = provider
+        self.api_host = api_host
+        self.model = model
+
+        self.dim: Optional[int] = None
+        """向量维度，首次写入时确定"""
+        self.generation = 0
+        """当前使用的文件代数"""
+
+        self._index: dict[bytes, int] = {}
+        """文本摘要 -> 矩阵行号"""
+        self._rows = 0
+        self._matrix: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        """保护索引与行数；整理期间持有，此时查询视为未命中"""
+        self._write_lock = threading.Lock()
+        """串行化追加与整理（追加在线程池中进行，写入磁盘时不持有 `_lock`）"""
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.directory / f"vectors-{self.generation}.f32"
+
+    @property
+    def _index_path(self) -> Path:
+        return self.directory / f"index-{self.generation}.bin"
+
+    @property
+    def rows(self) -> int:
+        """
+        矩阵行数（包含被覆盖的重复行）
+        """
+        return self._rows
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _write_meta(self):
+        meta = {
+            "provider": self.provider,
+            "api_host": self.api_host,
+            "model": self.model,
+            "dim": self.dim,
+            "generation": self.generation,
+        }
+        temp_path = self._meta_path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self._meta_path)
+
+    def _load(self):
+        """
+        加载索引，截断崩溃时未写完的尾部并清理其他代的文件
+        """
+        if self._meta_path.exists():
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim = meta.get("dim")
+            self.generation = meta.get("generation", 0)
+
+        for file in self.directory.glob("*-*.*"):
+            if file not in (self._vectors_path, self._index_path):
+                file.unlink(missing_ok=True)
+
+        if not self.dim:
+            self._index, self._rows, self._matrix = {}, 0, None
+            return
+
+        index_bytes = self._index_path.read_bytes() if self._index_path.exists() else b""
+        vectors_size = self._vectors_path.stat().st_size if self._vectors_path.exists() else 0
+        rows = min(len(index_bytes) // _DIGEST_SIZE, vectors_size // (self.dim * 4))
+
+        if len(index_bytes) != rows * _DIGEST_SIZE or vectors_size != rows * self.dim * 4:
+            logger.warning(f"嵌入缓存 {self.directory.name} 存在未写完的记录，已截断至 {rows} 行")
+            with open(self._index_path, "ab") as f:
+                f.truncate(rows * _DIGEST_SIZE)
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(rows * self.dim * 4)
+
+        # 重复的摘要以最后写入的一行为准
+        self._index = {index_bytes[i * _DIGEST_SIZE : (i + 1) * _DIGEST_SIZE]: i for i in range(rows)}
+        self._rows = rows
+        self._matrix = None
+
+    def _get_matrix(self) -> Optional[np.memmap]:
+        """
+        获取映射到当前全部行的矩阵（追加后重新映射）
+        """
+        if self._rows == 0 or self.dim is None:
+            return None
+        if self._matrix is None or self._matrix.shape[0] < self._rows:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+        return self._matrix
+
+    def get(self, text: str) -> Optional[list[float]]:
+        """
+        查询文本的嵌入向量
+
+        :return: 嵌入向量（复制自缓存矩阵），未命中时返回 None
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+
+        try:
+            row = self._index.get(text_digest(text))
+            if row is None:
+                return None
+            matrix = self._get_matrix()
+            return matrix[row].tolist() if matrix is not None else None
+        finally:
+            self._lock.release()
+
+    def append(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]]) -> None:
+        """
+        追加一批嵌入向量
+        """
+        self.append_digests([text_digest(text) for text in texts], embeddings)
+
+    def _rollback(self):
+        """
+        将向量与索引文件截断回已提交的行数
+        """
+        assert self.dim is not None
+        sizes = {self._vectors_path: self._rows * self.dim * 4, self._index_path: self._rows * _DIGEST_SIZE}
+        for path, size in sizes.items():
+            if path.exists() and path.stat().st_size > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def append_digests(self, digests: Sequence[bytes], embeddings: Sequence[Sequence[float]]) -> None:
+        """
+        以文本摘要追加一批嵌入向量（阻塞至数据同步到磁盘）
+        """
+        if not digests:
+            return
+
+        array = np.asarray(embeddings, dtype=np.float32)
+        if array.ndim != 2 or array.shape[0] != len(digests):
+            logger.warning(f"嵌入向量形状 {array.shape} 无效，不写入缓存")
+            return
+
+        with self._write_lock:
+            if self.dim is None:
+                self.dim = int(array.shape[1])
+                self._write_meta()
+            elif array.shape[1] != self.dim:
+                logger.warning(f"嵌入向量维度 {array.shape[1]} 与缓存维度 {self.dim} 不一致，不写入缓存")
+                return
+
+            # 先落盘向量再写索引，保证索引中的每一行都有对应的完整向量
+            # 新行位于已映射的行之后，写入期间查询仍可读取已提交的行
+            try:
+                _fsync_write(self._vectors_path, array.tobytes())
+                _fsync_write(self._index_path, b"".join(digests))
+            except BaseException:
+                self._rollback()
+                raise
+
+            with self._lock:
+                for offset, digest in enumerate(digests):
+                    self._index[digest] = self._rows + offset
+                self._rows += len(digests)
+
+    def compact(self, max_rows: int = 0) -> tuple[int, int, int]:
+        """
+        去除重复行并写入新一代文件
+
+        :param max_rows: 最多保留的行数（保留最近写入的行），为 0 时不限制
+        :return: (整理前行数, 整理后行数, 回收字节数)
+        """
+        with self._write_lock, self._lock:
+            rows_before = self._rows
+            live = sorted(self._index.items(), key=lambda item: item[1])
+            if max_rows and len(live) > max_rows:
+                live = live[-max_rows:]
+
+            if len(live) == rows_before or self.dim is None:
+                return rows_before, rows_before, 0
+
+            old_files = [self._vectors_path, self._index_path]
+            old_size = sum(file.stat().st_size for file in old_files if file.exists())
+            matrix = self._get_matrix()
+            self.generation += 1
+
+            rows = np.fromiter((row for _, row in live), dtype=np.int64, count=len(live))
+            with open(self._vectors_path, "wb") as f:
+                for start in range(0, len(rows), _COPY_ROWS):
+                    f.write(np.ascontiguousarray(matrix[rows[start : start + _COPY_ROWS]]).tobytes())  # type:ignore
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._index_path, "wb") as f:
+                f.write(b"".join(digest for digest, _ in live))
+                f.flush()
+                os.fsync(f.fileno())
+            self._write_meta()
+
+            self._index = {digest: row for row, (digest, _) in enumerate(live)}
+            self._rows = len(live)
+            self._matrix = None
+            del matrix
+
+            for file in old_files:
+                try:
+                    file.unlink()
+                except OSError:
+                    pass  # 仍被映射时（Windows）无法删除，下次加载时清理
+
+            return rows_before, self._rows, old_size - self._vectors_path.stat().st_size - len(live) * _DIGEST_SIZE
+
+
+def get_embedding_store(cache_dir: Path, provider: str, api_host: str, model: str) -> EmbeddingStore:
+    """
+    获取（或打开）嵌入模型对应的共享缓存存储
+    """
+    directory = cache_dir / _store_name(provider, api_host, model)
+
+    if (store := _stores.get(directory)) is None:
+        store = EmbeddingStore(directory, provider, api_host, model)
+        _stores[directory] = store
+
+    return store
+
+
+def _migrate_legacy_cache(cache_dir: Path) -> int:
+    """
+    将旧版每个文本一组 `.json` / `.npy` 文件的缓存迁移至新的存储，并删除旧文件
+
+    :return: 迁移的向量数量
+    """
+    batches: dict[tuple[str, str, str], tuple[list[bytes], list[ndarray]]] = {}
+    legacy_files: list[Path] = []
+
+    for meta_path in cache_dir.glob("*.json"):
+        npy_path = meta_path.with_suffix(".npy")
+        legacy_files += [meta_path, npy_path]
+
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            embedding = np.load(npy_path, allow_pickle=False)
+            digest = bytes.fromhex(meta["text_hash"])
+            key = (meta["provider"], meta["api_host"], meta["model"])
+        except Exception as e:
+            logger.warning(f"无法迁移旧版嵌入缓存 {meta_path.name}: {e}")
+            continue
+
+        digests, embeddings = batches.setdefault(key, ([], []))
+        digests.append(digest)
+        embeddings.append(embedding)
+
+    migrated = 0
+    for (provider, api_host, model), (digests, embeddings) in batches.items():
+        store = get_embedding_store(cache_dir, provider, api_host, model)
+        for dim in {embedding.shape[-1] for embedding in embeddings}:
+            selected = [i for i, embedding in enumerate(embeddings) if embedding.shape[-1] == dim]
+            store.append_digests([digests[i] for i in selected], [embeddings[i] for i in selected])
+        migrated += len(digests)
+
+    for file in legacy_files:
+        file.unlink(missing_ok=True)
+
+    return migrated
+
+
+def compact_embedding_stores(cache_dir: Path, max_rows: int = 0) -> CompactReport:
+    """
+    迁移旧版缓存并整理目录下的全部嵌入缓存存储（阻塞操作，应在线程池中调用）
+
+    :param max_rows: 每个存储最多保留的行数，为 0 时不限制
+    """
+    report = CompactReport()
+    if not cache_dir.exists():
+        return report
+
+    report.migrated = _migrate_legacy_cache(cache_dir)
+
+    for meta_path in cache_dir.glob("*/meta.json"):
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            store = get_embedding_store(cache_dir, meta["provider"], meta["api_host"], meta["model"])
+            rows_before, rows_after, reclaimed = store.compact(max_rows)
+        except Exception as e:
+            logger.error(f"整理嵌入缓存 {meta_path.parent.name} 失败: {e}")
+            continue
+
+        report.stores += 1
+        report.rows_before += rows_before
+        report.rows_after += rows_after
+        report.reclaimed += reclaimed
+
+    logger.info(f"嵌入缓存整理完成: {report}")
+    return report
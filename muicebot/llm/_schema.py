@@ -24,6 +24,10 @@ class ModelRequest:
     system: Optional[str] = None
     format: Literal["string", "json"] = "string"
     json_schema: Optional[Type[BaseModel]] = None
+    prompt_tokens: int = 0
+    """估算的提示词 Tokens（由 `Muice` 在裁剪上下文后填写）"""
+    timings: dict[str, float] = field(default_factory=dict)
+    """各准备阶段的耗时（秒）"""
 
 
 @dataclass
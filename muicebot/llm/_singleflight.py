@@ -0,0 +1,142 @@
+"""
+进行中请求合并 (singleflight)
+
+多个插件、挂钩函数或定时任务同时发起完全相同的模型请求或嵌入请求时，只由第一个调用方（leader）实际请求服务商，
+其余调用方等待同一个 Future 并共享结果
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional, Tuple, TypeVar
+
+from nonebot import logger
+
+if TYPE_CHECKING:
+    from ._base import BaseLLM, EmbeddingModel
+    from ._schema import ModelRequest
+
+T = TypeVar("T")
+
+
+@dataclass
+class FlightStats:
+    """
+    请求合并统计
+    """
+
+    executed: int = 0
+    """实际发起的请求数"""
+    shared: int = 0
+    """合并到进行中请求的调用数（即节省的请求数）"""
+
+    @property
+    def total(self) -> int:
+        return self.executed + self.shared
+
+    @property
+    def saved_rate(self) -> float:
+        return self.shared / self.total if self.total else 0.0
+
+
+class SingleFlight:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.stats = FlightStats()
+        self._futures: dict[str, asyncio.Future] = {}
+        """请求键 -> 进行中请求的结果"""
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._futures)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        执行请求，若已有相同键的请求正在进行则等待其结果
+
+        :param key: 请求键
+        :param func: 发起请求的函数
+        :return: (结果, 是否为共享的结果)
+        """
+        while (future := self._futures.get(key)) is not None:
+            self.stats.shared += 1
+            logger.debug(f"{self.name}: 合并到进行中的相同请求 (已节省 {self.stats.shared} 次)")
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                # leader 被取消时重新竞争执行，自身被取消时正常抛出
+                if not future.cancelled():
+                    raise
+                self.stats.shared -= 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        self.stats.executed += 1
+
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # 没有等待方时避免 "exception was never retrieved" 警告
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self._futures.pop(key, None)
+
+
+ask_flight = SingleFlight("ask")
+embed_flight = SingleFlight("embed")
+
+
+def _hash(payload: Any) -> str:
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def request_key(llm: "BaseLLM", request: "ModelRequest") -> Optional[str]:
+    """
+    计算模型请求的规范化哈希
+
+    :return: 请求键。请求包含工具时返回 None（工具调用依赖调用方的会话上下文，不能共享结果）
+    """
+    if request.tools:
+        return None
+
+    def resources(items) -> list:
+        return [(resource.type, resource.path, resource.url) for resource in items]
+
+    return _hash(
+        {
+            "provider": llm.__class__.__name__,
+            "config": llm.config.model_dump(mode="json"),
+            "prompt": request.prompt,
+            "system": request.system,
+            "format": request.format,
+            "json_schema": request.json_schema.model_json_schema() if request.json_schema else None,
+            "history": [(item.message, item.respond, resources(item.resources)) for item in request.history],
+            "resources": resources(request.resources),
+        }
+    )
+
+
+def embedding_key(model: "EmbeddingModel", texts: list[str]) -> str:
+    """
+    计算嵌入请求的规范化哈希
+    """
+    return _hash({"provider": model.__class__.__name__, "config": model.config.model_dump(mode="json"), "texts": texts})
+
+
+def get_flight_stats() -> dict[str, FlightStats]:
+    """
+    获取模型请求与嵌入请求的合并统计
+    """
+    return {flight.name: flight.stats for flight in (ask_flight, embed_flight)}
@@ -0,0 +1,171 @@
+"""
+工具调用循环
+
+各模型加载器在模型请求工具调用时不再递归调用自身，而是在 `while` 循环中使用 `ToolLoop` 记录每一步的耗时与用量，
+并在每轮工具调用前检查步数、Tokens 和截止时间预算，防止异常的工具调用使请求无限循环
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence
+
+from nonebot import logger
+
+from ._config import ModelConfig
+from .utils.tools import function_call_handler
+
+
+@dataclass
+class ToolStep:
+    """
+    工具调用循环中的一步（一次模型请求及其触发的工具调用）
+    """
+
+    index: int
+    """步骤序号（从 1 开始）"""
+    model_time: float = 0.0
+    """模型请求耗时（秒）"""
+    tool_time: float = 0.0
+    """工具执行耗时（秒）"""
+    tokens: int = 0
+    """本步消耗的 Tokens"""
+    tool_calls: int = 0
+    """本步执行的工具调用数量"""
+
+
+class ToolLoop:
+    """
+    工具调用循环的预算与计时器
+    """
+
+    def __init__(self, config: ModelConfig, timings: Optional[dict[str, float]] = None) -> None:
+        """
+        :param config: 模型配置，从中读取 `tool_max_steps`、`tool_token_budget` 和 `tool_loop_timeout`
+        :param timings: 记录各步骤耗时的字典（通常为 `ModelRequest.timings`）
+        """
+        self.max_steps = config.tool_max_steps
+        """最大工具调用轮数"""
+        self.token_budget = config.tool_token_budget
+        """整个循环的 Tokens 预算，为 0 时不限制"""
+        self.deadline = time.monotonic() + config.tool_loop_timeout if config.tool_loop_timeout > 0 else None
+        """截止时间 (`time.monotonic()`)，为 None 时不限制"""
+
+        self.total_tokens = 0
+        """已消耗的 Tokens"""
+        self.steps: List[ToolStep] = []
+        """已开始的步骤"""
+        self.stop_reason: Optional[str] = None
+        """循环被预算终止的原因"""
+
+        self._timings = timings if timings is not None else {}
+        self._step_start = 0.0
+
+    @property
+    def step(self) -> ToolStep:
+        """
+        当前步骤
+        """
+        return self.steps[-1]
+
+    @property
+    def remaining(self) -> Optional[float]:
+        """
+        距截止时间的剩余秒数，不限制时为 None
+        """
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0)
+
+    @property
+    def stop_message(self) -> str:
+        """
+        循环被终止时向用户展示的提示
+
+        预算终止不视为调用失败：各模型加载器在流式与非流式输出中均将此提示追加到已生成的回复之后，
+        并保持 `succeed=True`，使已消耗的用量与对话记录照常保存
+        """
+        return f"（工具调用已终止: {self.stop_reason}）"
+
+    def start_step(self) -> ToolStep:
+        """
+        开始新的一步（在发起模型请求前调用）
+        """
+        self.steps.append(ToolStep(index=len(self.steps) + 1))
+        self._step_start = time.perf_counter()
+        return self.step
+
+    def finish_model(self, tokens: int = 0) -> None:
+        """
+        记录当前步骤的模型请求耗时与用量（在模型响应结束后调用）
+
+        :param tokens: 本次模型请求消耗的 Tokens
+        """
+        step = self.step
+        step.model_time = time.perf_counter() - self._step_start
+        step.tokens = tokens
+        self.total_tokens += tokens
+        self._timings[f"step{step.index}.model"] = step.model_time
+
+    def can_continue(self) -> bool:
+        """
+        检查预算是否允许执行本步请求的工具调用并发起下一次模型请求
+
+        :return: 不允许时返回 False，并记录 `stop_reason`
+        """
+        if len(self.steps) > self.max_steps:
+            self.stop_reason = f"超过最大步数 {self.max_steps}"
+        elif self.token_budget and self.total_tokens >= self.token_budget:
+            self.stop_reason = f"超过 Tokens 预算 {self.token_budget}"
+        elif self.remaining == 0:
+            self.stop_reason = "超过截止时间"
+        else:
+            return True
+
+        logger.warning(f"{self.stop_message} 已执行 {len(self.steps)} 步, 消耗 {self.total_tokens} Tokens")
+        return False
+
+    async def run_tools(self, tool_calls: Sequence[tuple[str, dict]]) -> List[Any]:
+        """
+        并发执行当前步骤请求的全部工具调用，执行时间受截止时间限制
+
+        :param tool_calls: (函数名, 参数) 列表
+        :return: 与调用顺序一致的工具返回值列表
+        """
+        step = self.step
+        step.tool_calls = len(tool_calls)
+        start_time = time.perf_counter()
+
+        tasks = [asyncio.ensure_future(function_call_handler(name, arguments)) for name, arguments in tool_calls]
+        done, pending = await asyncio.wait(tasks, timeout=self.remaining) if tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+
+        results = []
+        for task in tasks:
+            if task in pending:
+                results.append("(Function call timed out: tool loop deadline exceeded)")
+            elif task.exception() is not None:
+                logger.error(f"工具调用失败: {task.exception()}")
+                results.append(f"(Function call failed: {task.exception()})")
+            else:
+                results.append(task.result())
+
+        step.tool_time = time.perf_counter() - start_time
+        self._timings[f"step{step.index}.tools"] = step.tool_time
+        return results
+
+    def finish(self) -> None:
+        """
+        结束循环，输出各步骤耗时
+        """
+        if len(self.steps) > 1:
+            logger.debug(
+                f"工具调用循环结束: {len(self.steps)} 步, {self.total_tokens} Tokens, "
+                + ", ".join(
+                    f"#{s.index}(模型 {s.model_time:.2f}s, 工具 {s.tool_calls} 个 {s.tool_time:.2f}s)"
+                    for s in self.steps
+                )
+            )
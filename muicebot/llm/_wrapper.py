@@ -1,12 +1,12 @@
 from __future__ import annotations
 
 import asyncio
+from dataclasses import replace
 from functools import wraps
 from typing import TYPE_CHECKING, AsyncGenerator, Awaitable, Callable, TypeAlias, Union
 
-from nonebot_plugin_orm import get_scoped_session
-
-from ..database.crud import UsageORM
+from ..config import plugin_config
+from ..database.writer import persistence_queue
 from ..plugin.loader import _get_caller_plugin_name
 from ._schema import (
     EmbeddingsBatchResult,
@@ -14,6 +14,7 @@ from ._schema import (
     ModelRequest,
     ModelStreamCompletions,
 )
+from ._singleflight import ask_flight, embed_flight, embedding_key, request_key
 
 if TYPE_CHECKING:
     from ._base import BaseLLM, EmbeddingModel
@@ -21,8 +22,6 @@ if TYPE_CHECKING:
 ASK_FUNC: TypeAlias = Callable[..., Awaitable[Union[ModelCompletions, AsyncGenerator[ModelStreamCompletions, None]]]]
 EMBED_FUNC: TypeAlias = Callable[..., Awaitable[EmbeddingsBatchResult]]
 
-_usage_write_lock = asyncio.Lock()
-
 
 def record_plugin_usage(func: ASK_FUNC):
     """
@@ -40,9 +39,7 @@ def record_plugin_usage(func: ASK_FUNC):
         if isinstance(response, ModelCompletions):
             total_usage = response.usage if response.usage > 0 else 0
 
-            async with _usage_write_lock:
-                session = get_scoped_session()
-                await UsageORM.save_usage(session, plugin_name, total_usage)
+            await persistence_queue.put_usage(plugin_name, total_usage)
 
             return response
 
@@ -58,15 +55,50 @@ def record_plugin_usage(func: ASK_FUNC):
                     total_usage = chunk.usage if chunk.usage > 0 else 0
                     yield chunk
             finally:
-                async with _usage_write_lock:
-                    session = get_scoped_session()
-                    await UsageORM.save_usage(session, plugin_name, total_usage)
+                await persistence_queue.put_usage(plugin_name, total_usage)
 
         return generator_wrapper()
 
     return wrapper
 
 
+def coalesce_ask(func: ASK_FUNC):
+    """
+    合并进行中的相同模型请求的装饰器（仅非流式且不含工具的请求）
+
+    共享结果的调用方获得用量为 0 的副本，避免重复记录用量
+    """
+
+    @wraps(func)
+    async def wrapper(self: "BaseLLM", request: ModelRequest, *, stream: bool = False):
+        key = request_key(self, request) if plugin_config.enable_request_coalescing and not stream else None
+        if key is None:
+            return await func(self, request, stream=stream)
+
+        response, shared = await ask_flight.do(key, lambda: func(self, request, stream=False))
+        return replace(response, usage=0) if shared else response
+
+    return wrapper
+
+
+def coalesce_embed(func: EMBED_FUNC):
+    """
+    合并进行中的相同嵌入请求的装饰器
+
+    共享结果的调用方获得用量为 0 的副本，避免重复记录用量
+    """
+
+    @wraps(func)
+    async def wrapper(self: "EmbeddingModel", texts: list[str]):
+        if not plugin_config.enable_request_coalescing:
+            return await func(self, texts)
+
+        result, shared = await embed_flight.do(embedding_key(self, texts), lambda: func(self, texts))
+        return replace(result, usage=0) if shared else result
+
+    return wrapper
+
+
 def record_plugin_embedding_usage(func: EMBED_FUNC):
     """
     记录插件嵌入用量的装饰器
@@ -78,9 +110,7 @@ def record_plugin_embedding_usage(func: EMBED_FUNC):
         result = await func(self, texts)
 
         if result.succeed and result.usage > 0:
-            async with _usage_write_lock:
-                session = get_scoped_session()
-                await UsageORM.save_usage(session, plugin_name, result.usage, "embedding")
+            await persistence_queue.put_usage(plugin_name, result.usage, "embedding")
 
         return result
 
@@ -90,22 +120,44 @@ def record_plugin_embedding_usage(func: EMBED_FUNC):
 def cache(func: EMBED_FUNC):
     """
     缓存嵌入向量的装饰器
+
+    命中缓存的文本直接返回，未命中的文本去重后按批次大小分批并发请求，结果按输入顺序重新组装
     """
 
     @wraps(func)
     async def wrapper(self: "EmbeddingModel", texts: list[str]):
-        if not self.enable_embedding_cache:
-            return await func(self, texts)
+        embeddings: dict[str, list[float]] = {}
+        misses: list[str] = []
 
-        results = []
-        for text in texts:
-            embedding = self._load_embedding_from_cache(text)
+        for text in dict.fromkeys(texts):
+            embedding = self._load_embedding_from_cache(text) if self.enable_embedding_cache else None
             if embedding is not None:
-                results.append(embedding)
+                embeddings[text] = embedding
             else:
-                result = await func(self, [text])
-                self._save_to_cache(text, result.embeddings[0])
-                results.append(result.embeddings[0])
-        return EmbeddingsBatchResult(succeed=True, embeddings=results)
+                misses.append(text)
+
+        batch_size = self.config.batch_size or self.max_batch_size
+        batches = [misses[i : i + batch_size] for i in range(0, len(misses), batch_size)]
+        semaphore = asyncio.Semaphore(self.config.max_concurrency)
+
+        async def embed_batch(batch: list[str]) -> int:
+            async with semaphore:
+                result = await func(self, batch)
+
+            if len(result.embeddings) != len(batch):
+                raise RuntimeError(f"嵌入结果数量 ({len(result.embeddings)}) 与请求文本数量 ({len(batch)}) 不一致")
+
+            embeddings.update(zip(batch, result.embeddings))
+            if self.enable_embedding_cache:
+                await self._save_to_cache(batch, result.embeddings)
+
+            return result.usage
+
+        usages = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+
+        known_usages = [usage for usage in usages if usage >= 0]
+        usage = sum(known_usages) if known_usages or not usages else -1
+
+        return EmbeddingsBatchResult(embeddings=[embeddings[text] for text in texts], usage=usage)
 
     return wrapper
@@ -12,6 +12,8 @@ from ..registry import register
 
 @register("azure")
 class Azure(EmbeddingModel):
+    max_batch_size = 256
+
     def __init__(self, config: EmbeddingConfig):
         super().__init__(config)
         self.token = self.config.api_key
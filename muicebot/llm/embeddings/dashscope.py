@@ -11,6 +11,8 @@ from ..registry import register
 
 @register("dashscope")
 class Dashscope(EmbeddingModel):
+    max_batch_size = 10
+
     def __init__(self, config: EmbeddingConfig):
         super().__init__(config)
         self._require("api_key")
@@ -8,6 +8,8 @@ from ..registry import register
 
 @register("gemini")
 class Gemini(EmbeddingModel):
+    max_batch_size = 100
+
     def __init__(self, config: EmbeddingConfig):
         super().__init__(config)
         self._require("api_key", "model")
@@ -8,6 +8,8 @@ from ..registry import register
 
 @register("ollama")
 class Ollama(EmbeddingModel):
+    max_batch_size = 64
+
     def __init__(self, config: EmbeddingConfig):
         super().__init__(config)
         self._require("model")
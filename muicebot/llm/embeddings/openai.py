@@ -1,5 +1,6 @@
 import openai
 
+from ...utils.http import get_http_client, get_http_timeout
 from .._base import EmbeddingModel
 from .._config import EmbeddingConfig
 from .._schema import EmbeddingsBatchResult
@@ -8,6 +9,8 @@ from ..registry import register
 
 @register("openai")
 class OpenAI(EmbeddingModel):
+    max_batch_size = 256
+
     def __init__(self, config: EmbeddingConfig):
         super().__init__(config)
         self._require("api_key")
@@ -15,7 +18,9 @@ class OpenAI(EmbeddingModel):
         self.api_base = self.config.api_host or "https://api.openai.com/v1"
         self.model = self.config.model
 
-        self.client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.api_base, timeout=30)
+        self.client = openai.AsyncOpenAI(
+            api_key=self.api_key, base_url=self.api_base, timeout=get_http_timeout(), http_client=get_http_client()
+        )
 
     async def embed(self, texts: list[str]) -> EmbeddingsBatchResult:
         """
@@ -18,6 +18,7 @@ from azure.ai.inference.models import (
     ImageUrl,
     InputAudio,
     JsonSchemaFormat,
+    StreamingChatResponseToolCallUpdate,
     SystemMessage,
     TextContentItem,
     ToolMessage,
@@ -35,7 +36,7 @@ from .. import (
     ModelStreamCompletions,
     register,
 )
-from ..utils.tools import function_call_handler
+from .._tool_loop import ToolLoop
 
 
 @register("azure")
@@ -121,78 +122,108 @@ class Azure(BaseLLM):
         return messages
 
     def _tool_messages_precheck(self, tool_calls: Optional[List[ChatCompletionsToolCall]] = None) -> bool:
-        if not (tool_calls and len(tool_calls) == 1):
+        if not tool_calls:
             return False
 
-        tool_call = tool_calls[0]
+        return all(isinstance(tool_call, ChatCompletionsToolCall) for tool_call in tool_calls)
 
-        if isinstance(tool_call, ChatCompletionsToolCall):
-            return True
+    @staticmethod
+    def _accumulate_tool_call(
+        function_calls: dict[int, dict[str, str]], tool_call: StreamingChatResponseToolCallUpdate
+    ) -> None:
+        """
+        将流式返回的工具调用增量累积到 `function_calls` 中
 
-        return False
+        优先使用增量中的 `index` 区分各个工具调用；部分服务不返回 `index`，
+        此时以新出现的 `id` 作为新工具调用的开始，其余增量归入最近的工具调用
+        """
+        index = tool_call.get("index")
+        if index is None:
+            known_ids = [call["id"] for call in function_calls.values()]
+            if not function_calls or (tool_call.id and tool_call.id not in known_ids):
+                index = len(function_calls)
+            else:
+                index = max(function_calls)
+
+        function_call = function_calls.setdefault(index, {"id": "", "name": "", "arguments": ""})
+        if tool_call.id:
+            function_call["id"] = tool_call.id
+        if tool_call.function:
+            if tool_call.function.name:
+                function_call["name"] = tool_call.function.name
+            function_call["arguments"] += tool_call.function.arguments or ""
 
     async def _ask_sync(
         self,
         messages: List[ChatRequestMessage],
         tools: List[ChatCompletionsToolDefinition],
         response_format: Optional[JsonSchemaFormat],
-        total_tokens: int = 0,
+        tool_loop: Optional[ToolLoop] = None,
     ) -> ModelCompletions:
         client = ChatCompletionsClient(endpoint=self.endpoint, credential=AzureKeyCredential(self.token))
 
         completions = ModelCompletions()
-        current_total_tokens = total_tokens
+        tool_loop = tool_loop or ToolLoop(self.config)
 
         try:
-            response = await client.complete(
-                messages=messages,
-                model=self.model_name,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                top_p=self.top_p,
-                frequency_penalty=self.frequency_penalty,
-                presence_penalty=self.presence_penalty,
-                stream=False,
-                tools=tools,
-                response_format=response_format,
-            )
-            finish_reason = response.choices[0].finish_reason
-            if response.usage:
-                current_total_tokens += response.usage.total_tokens
-
-            if finish_reason == CompletionsFinishReason.STOPPED:
-                completions.text = response.choices[0].message.content
+            while True:
+                tool_loop.start_step()
+                response = await client.complete(
+                    messages=messages,
+                    model=self.model_name,
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    top_p=self.top_p,
+                    frequency_penalty=self.frequency_penalty,
+                    presence_penalty=self.presence_penalty,
+                    stream=False,
+                    tools=tools,
+                    response_format=response_format,
+                )
+                tool_loop.finish_model(response.usage.total_tokens if response.usage else 0)
+                finish_reason = response.choices[0].finish_reason
 
-            elif finish_reason == CompletionsFinishReason.CONTENT_FILTERED:
-                completions.succeed = False
-                completions.text = "(模型内部错误: 被内容过滤器阻止)"
+                if finish_reason == CompletionsFinishReason.STOPPED:
+                    completions.text = response.choices[0].message.content
 
-            elif finish_reason == CompletionsFinishReason.TOKEN_LIMIT_REACHED:
-                completions.succeed = False
-                completions.text = "(模型内部错误: 达到了最大 token 限制)"
+                elif finish_reason == CompletionsFinishReason.CONTENT_FILTERED:
+                    completions.succeed = False
+                    completions.text = "(模型内部错误: 被内容过滤器阻止)"
 
-            elif finish_reason == CompletionsFinishReason.TOOL_CALLS:
-                tool_calls = response.choices[0].message.tool_calls
-                messages.append(AssistantMessage(tool_calls=tool_calls))
-                if (tool_calls is None) or (not self._tool_messages_precheck(tool_calls=tool_calls)):
+                elif finish_reason == CompletionsFinishReason.TOKEN_LIMIT_REACHED:
                     completions.succeed = False
-                    completions.text = "(模型内部错误: tool_calls 内容为空)"
-                    completions.usage = current_total_tokens
-                    return completions
+                    completions.text = "(模型内部错误: 达到了最大 token 限制)"
 
-                tool_call = tool_calls[0]
-                function_args = json.loads(tool_call.function.arguments.replace("'", '"'))
+                elif finish_reason == CompletionsFinishReason.TOOL_CALLS:
+                    tool_calls = response.choices[0].message.tool_calls
+                    if (tool_calls is None) or (not self._tool_messages_precheck(tool_calls=tool_calls)):
+                        completions.succeed = False
+                        completions.text = "(模型内部错误: tool_calls 内容为空)"
+                        break
+
+                    if not tool_loop.can_continue():
+                        completions.text = (response.choices[0].message.content or "") + tool_loop.stop_message
+                        break
+
+                    messages.append(AssistantMessage(tool_calls=tool_calls))
+                    function_returns = await tool_loop.run_tools(
+                        [
+                            (tool_call.function.name, json.loads(tool_call.function.arguments.replace("'", '"')))
+                            for tool_call in tool_calls
+                        ]
+                    )
 
-                function_return = await function_call_handler(tool_call.function.name, function_args)
+                    # Append the function call result fo the chat history
+                    for tool_call, function_return in zip(tool_calls, function_returns):
+                        messages.append(ToolMessage(tool_call_id=tool_call.id, content=function_return))
 
-                # Append the function call result fo the chat history
-                messages.append(ToolMessage(tool_call_id=tool_call.id, content=function_return))
+                    continue
 
-                return await self._ask_sync(messages, tools, response_format, current_total_tokens)
+                else:
+                    completions.succeed = False
+                    completions.text = "(模型内部错误: 达到了最大 token 限制)"
 
-            else:
-                completions.succeed = False
-                completions.text = "(模型内部错误: 达到了最大 token 限制)"
+                break
 
         except HttpResponseError as e:
             logger.error(f"模型响应失败: {e.status_code} ({e.reason})")
@@ -202,7 +233,8 @@ class Azure(BaseLLM):
 
         finally:
             await client.close()
-            completions.usage = current_total_tokens
+            completions.usage = tool_loop.total_tokens
+            tool_loop.finish()
             return completions
 
     async def _ask_stream(
@@ -210,88 +242,97 @@ class Azure(BaseLLM):
         messages: List[ChatRequestMessage],
         tools: List[ChatCompletionsToolDefinition],
         response_format: Optional[JsonSchemaFormat],
-        total_tokens: int = 0,
+        tool_loop: Optional[ToolLoop] = None,
     ) -> AsyncGenerator[ModelStreamCompletions, None]:
         client = ChatCompletionsClient(endpoint=self.endpoint, credential=AzureKeyCredential(self.token))
-        current_total_tokens = total_tokens
+        tool_loop = tool_loop or ToolLoop(self.config)
 
         try:
-            response = await client.complete(
-                messages=messages,
-                model=self.model_name,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                top_p=self.top_p,
-                frequency_penalty=self.frequency_penalty,
-                presence_penalty=self.presence_penalty,
-                stream=True,
-                tools=tools,
-                model_extras={"stream_options": {"include_usage": True}},  # 需要显式声明获取用量
-                response_format=response_format,
-            )
+            while True:
+                tool_loop.start_step()
+                response = await client.complete(
+                    messages=messages,
+                    model=self.model_name,
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    top_p=self.top_p,
+                    frequency_penalty=self.frequency_penalty,
+                    presence_penalty=self.presence_penalty,
+                    stream=True,
+                    tools=tools,
+                    model_extras={"stream_options": {"include_usage": True}},  # 需要显式声明获取用量
+                    response_format=response_format,
+                )
 
-            tool_call_id: str = ""
-            function_name: str = ""
-            function_args: str = ""
+                function_calls: dict[int, dict[str, str]] = {}
+                """按 index 累积的工具调用: index -> {id, name, arguments}"""
+                is_tool_calls = False
+                step_tokens = 0
 
-            async for chunk in response:
-                stream_completions = ModelStreamCompletions()
+                async for chunk in response:
+                    stream_completions = ModelStreamCompletions()
 
-                if chunk.usage:  # chunk.usage 只会在最后一个包中被提供，此时choices为空
-                    current_total_tokens += chunk.usage.total_tokens if chunk.usage else 0
-                    stream_completions.usage = current_total_tokens
+                    if chunk.usage:  # chunk.usage 只会在最后一个包中被提供，此时choices为空
+                        step_tokens += chunk.usage.total_tokens if chunk.usage else 0
+                        stream_completions.usage = tool_loop.total_tokens + step_tokens
 
-                if not chunk.choices:
-                    yield stream_completions
-                    continue
+                    if not chunk.choices:
+                        yield stream_completions
+                        continue
 
-                finish_reason = chunk.choices[0].finish_reason
+                    finish_reason = chunk.choices[0].finish_reason
 
-                if chunk.choices and chunk.choices[0].get("delta", {}).get("content", ""):
-                    stream_completions.chunk = chunk["choices"][0]["delta"]["content"]
+                    if chunk.choices and chunk.choices[0].get("delta", {}).get("content", ""):
+                        stream_completions.chunk = chunk["choices"][0]["delta"]["content"]
 
-                elif chunk.choices[0].delta.tool_calls is not None:
-                    tool_call = chunk.choices[0].delta.tool_calls[0]
+                    elif chunk.choices[0].delta.tool_calls is not None:
+                        for tool_call in chunk.choices[0].delta.tool_calls:
+                            self._accumulate_tool_call(function_calls, tool_call)
+                        continue
 
-                    if tool_call.function.name is not None:
-                        function_name = tool_call.function.name
-                    if tool_call.id is not None:
-                        tool_call_id = tool_call.id
-                    function_args += tool_call.function.arguments or ""
-                    continue
+                    elif finish_reason == CompletionsFinishReason.CONTENT_FILTERED:
+                        stream_completions.succeed = False
+                        stream_completions.chunk = "(模型内部错误: 被内容过滤器阻止)"
 
-                elif finish_reason == CompletionsFinishReason.CONTENT_FILTERED:
-                    stream_completions.succeed = False
-                    stream_completions.chunk = "(模型内部错误: 被内容过滤器阻止)"
+                    elif finish_reason == CompletionsFinishReason.TOKEN_LIMIT_REACHED:
+                        stream_completions.succeed = False
+                        stream_completions.chunk = "(模型内部错误: 达到了最大 token 限制)"
 
-                elif finish_reason == CompletionsFinishReason.TOKEN_LIMIT_REACHED:
-                    stream_completions.succeed = False
-                    stream_completions.chunk = "(模型内部错误: 达到了最大 token 限制)"
+                    elif finish_reason == CompletionsFinishReason.TOOL_CALLS:
+                        is_tool_calls = True
+                        continue
 
-                elif finish_reason == CompletionsFinishReason.TOOL_CALLS:
-                    messages.append(
-                        AssistantMessage(
-                            tool_calls=[
-                                ChatCompletionsToolCall(
-                                    id=tool_call_id, function=FunctionCall(name=function_name, arguments=function_args)
-                                )
-                            ]
-                        )
-                    )
+                    yield stream_completions
 
-                    function_arg = json.loads(function_args.replace("'", '"'))
+                tool_loop.finish_model(step_tokens)
 
-                    function_return = await function_call_handler(function_name, function_arg)
+                if not is_tool_calls:
+                    break
 
-                    # Append the function call result fo the chat history
-                    messages.append(ToolMessage(tool_call_id=tool_call_id, content=function_return))
+                if not tool_loop.can_continue():
+                    yield ModelStreamCompletions(chunk=tool_loop.stop_message, usage=tool_loop.total_tokens)
+                    break
 
-                    async for content in self._ask_stream(messages, tools, response_format, current_total_tokens):
-                        yield content
+                ordered_calls = [function_calls[index] for index in sorted(function_calls)]
+
+                messages.append(
+                    AssistantMessage(
+                        tool_calls=[
+                            ChatCompletionsToolCall(
+                                id=call["id"], function=FunctionCall(name=call["name"], arguments=call["arguments"])
+                            )
+                            for call in ordered_calls
+                        ]
+                    )
+                )
 
-                    return
+                function_returns = await tool_loop.run_tools(
+                    [(call["name"], json.loads(call["arguments"].replace("'", '"') or "{}")) for call in ordered_calls]
+                )
 
-                yield stream_completions
+                # Append the function call result fo the chat history
+                for call, function_return in zip(ordered_calls, function_returns):
+                    messages.append(ToolMessage(tool_call_id=call["id"], content=function_return))
 
         except HttpResponseError as e:
             logger.error(f"模型响应失败: {e.status_code} ({e.reason})")
@@ -303,6 +344,7 @@ class Azure(BaseLLM):
 
         finally:
             await client.close()
+            tool_loop.finish()
 
     @overload
     async def ask(self, request: ModelRequest, *, stream: Literal[False] = False) -> ModelCompletions: ...
@@ -329,7 +371,9 @@ class Azure(BaseLLM):
         else:
             response_format = None
 
+        tool_loop = ToolLoop(self.config, request.timings)
+
         if stream:
-            return self._ask_stream(messages, tools, response_format)
+            return self._ask_stream(messages, tools, response_format, tool_loop)
 
-        return await self._ask_sync(messages, tools, response_format)
+        return await self._ask_sync(messages, tools, response_format, tool_loop)
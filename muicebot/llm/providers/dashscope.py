@@ -19,7 +19,7 @@ from .. import (
     ModelStreamCompletions,
     register,
 )
-from ..utils.tools import function_call_handler
+from .._tool_loop import ToolLoop
 
 
 @dataclass
@@ -97,8 +97,6 @@ class Dashscope(BaseLLM):
             {"X-DashScope-DataInspection": '{"input":"cip","output":"cip"}'} if self.config.content_security else {}
         )
 
-        self.stream = False
-
     def __build_multi_messages(self, request: ModelRequest) -> dict:
         """
         构建多模态类型
@@ -147,34 +145,30 @@ class Dashscope(BaseLLM):
 
         return messages
 
-    async def _GenerationResponse_handle(
+    def _GenerationResponse_handle(
         self,
-        messages: list,
-        tools: List[dict],
-        response_format: Optional[dict],
         response: GenerationResponse | MultiModalConversationResponse,
-        total_tokens: int,
-    ) -> ModelCompletions:
+        tool_loop: ToolLoop,
+    ) -> Optional[ModelCompletions]:
         """
         处理 Dashscope 的非流式返回对象
 
-        :param message: 总消息列表，用于工具调用
-        :param tools: 工具列表
-        :param response_format: 消息回复格式
         :param response: 迭代器主体
-        :param total_tokens: 整个对话的总 token
+        :param tool_loop: 工具调用循环
+        :return: 模型输出。模型请求工具调用时返回 None
         """
         completions = ModelCompletions()
 
         if response.status_code != 200:
+            tool_loop.finish_model()
             completions.succeed = False
             logger.error(f"模型调用失败: {response.status_code}({response.code})")
             logger.error(f"{response.message}")
             completions.text = f"模型调用失败: {response.status_code}({response.code})"
             return completions
 
-        total_tokens += int(response.usage.total_tokens)
-        completions.usage = total_tokens
+        tool_loop.finish_model(int(response.usage.total_tokens))
+        completions.usage = tool_loop.total_tokens
 
         if response.output.text:
             completions.text = response.output.text
@@ -185,27 +179,27 @@ class Dashscope(BaseLLM):
             completions.text = message_content if isinstance(message_content, str) else message_content[0].get("text")
             return completions
 
-        return await self._tool_calls_handle_sync(messages, tools, response_format, response, total_tokens)
+        if not response.output.choices[0].message.get("tool_calls", []):
+            completions.text = "（警告：模型无输出！）"
+            return completions
+
+        return None
 
     async def _Generator_handle(
         self,
-        messages: list,
-        tools: List[dict],
-        response_format: Optional[dict],
         response: Generator[GenerationResponse, None, None] | Generator[MultiModalConversationResponse, None, None],
-        total_tokens: int = 0,
+        func_stream: FunctionCallStream,
+        tool_loop: ToolLoop,
     ) -> AsyncGenerator[ModelStreamCompletions, None]:
         """
         处理 Dashscope 的流式迭代器
 
-        :param message: 总消息列表，用于工具调用
-        :param tools: 工具列表
-        :param response_format: 消息回复格式
         :param response: 迭代器主体
-        :param total_tokens: 整个对话的总 token
+        :param func_stream: 工具调用流实例
+        :param tool_loop: 工具调用循环
         """
-        func_stream = FunctionCallStream()
         thought_stream = ThoughtStream()
+        total_tokens = 0
 
         for chunk in response:
             logger.debug(chunk)
@@ -217,12 +211,13 @@ class Dashscope(BaseLLM):
                 stream_completions.chunk = f"模型调用失败: {chunk.status_code}({chunk.code})"
                 stream_completions.succeed = False
 
+                tool_loop.finish_model(total_tokens)
                 yield stream_completions
                 return
 
             # 更新 token 消耗
             total_tokens = chunk.usage.total_tokens
-            stream_completions.usage = total_tokens
+            stream_completions.usage = tool_loop.total_tokens + total_tokens
 
             # 优先判断是否是工具调用（OpenAI-style function calling）
             if chunk.output.choices and chunk.output.choices[0].message.get("tool_calls", []):
@@ -241,62 +236,50 @@ class Dashscope(BaseLLM):
             stream_completions.chunk = thought_stream.process_chunk(chunk)
             yield stream_completions
 
-        # 流式处理工具调用响应
-        if func_stream.enable:
-            async for final_chunk in await self._tool_calls_handle_stream(
-                messages, tools, response_format, func_stream, total_tokens
-            ):
-                yield final_chunk
+        tool_loop.finish_model(total_tokens)
 
     async def _tool_calls_handle_sync(
         self,
         messages: List,
-        tools: List[dict],
-        response_format: Optional[dict],
         response: GenerationResponse | MultiModalConversationResponse,
-        total_tokens: int,
-    ) -> ModelCompletions:
+        tool_loop: ToolLoop,
+    ) -> None:
         """
-        处理非流式工具调用流
+        处理非流式工具调用，将工具调用请求与返回结果追加到消息列表中
 
         :param messages: 消息列表
-        :param tools: 工具列表
-        :param response_format: 消息回复格式
-        :param func_stream: 工具调用流实例
-        :param total_tokens: 总 Token 数
+        :param response: 请求工具调用的模型响应
+        :param tool_loop: 工具调用循环
         """
-        tool_call = response.output.choices[0].message.tool_calls[0]
-        tool_call_id = tool_call["id"]
-        function_name = tool_call["function"]["name"]
-        function_args = json.loads(tool_call["function"]["arguments"])
+        tool_calls = response.output.choices[0].message.tool_calls
 
-        function_return = await function_call_handler(function_name, function_args)
+        function_returns = await tool_loop.run_tools(
+            [
+                (tool_call["function"]["name"], json.loads(tool_call["function"]["arguments"] or "{}"))
+                for tool_call in tool_calls
+            ]
+        )
 
         messages.append(response.output.choices[0].message)
-        messages.append({"role": "tool", "content": function_return, "tool_call_id": tool_call_id})
-
-        return await self._ask(messages, tools, response_format, total_tokens)  # type:ignore
+        for tool_call, function_return in zip(tool_calls, function_returns):
+            messages.append({"role": "tool", "content": function_return, "tool_call_id": tool_call["id"]})
 
     async def _tool_calls_handle_stream(
         self,
         messages: List,
-        tools: List[dict],
-        response_format: Optional[dict],
         func_stream: FunctionCallStream,
-        total_tokens: int,
-    ) -> AsyncGenerator[ModelStreamCompletions, None]:
+        tool_loop: ToolLoop,
+    ) -> None:
         """
-        处理流式工具调用流
+        处理流式工具调用，将工具调用请求与返回结果追加到消息列表中
 
         :param messages: 消息列表
-        :param tools: 工具列表
-        :param response_format: 消息回复格式
         :param func_stream: 工具调用流实例
-        :param total_tokens: 总 Token 数
+        :param tool_loop: 工具调用循环
         """
-        function_args = json.loads(func_stream.function_args)
+        function_args = json.loads(func_stream.function_args or "{}")
 
-        function_return = await function_call_handler(func_stream.function_name, function_args)  # type:ignore
+        function_return = (await tool_loop.run_tools([(func_stream.function_name, function_args)]))[0]
 
         messages.append(
             {
@@ -317,20 +300,28 @@ class Dashscope(BaseLLM):
         )
         messages.append({"role": "tool", "content": function_return, "tool_call_id": func_stream.id})
 
-        return await self._ask(messages, tools, response_format, total_tokens)  # type:ignore
-
-    async def _ask(
+    async def _call(
         self,
         messages: list,
         tools: List[dict],
         response_format: Optional[dict],
-        total_tokens: int = 0,
-    ) -> Union[ModelCompletions, AsyncGenerator[ModelStreamCompletions, None]]:
+        stream: bool,
+    ) -> Union[
+        GenerationResponse,
+        MultiModalConversationResponse,
+        Generator[GenerationResponse, None, None],
+        Generator[MultiModalConversationResponse, None, None],
+    ]:
+        """
+        发起一次 Dashscope 模型请求
+
+        :param stream: 是否流式调用（由每次 `ask` 传入，同一实例可能同时处理流式与非流式请求）
+        """
         loop = asyncio.get_event_loop()
 
         # 因为 Dashscope 对于多模态模型的接口不同，所以这里不能统一函数
         if not self.config.multimodal:
-            response = await loop.run_in_executor(
+            return await loop.run_in_executor(
                 None,
                 partial(
                     dashscope.Generation.call,
@@ -341,41 +332,91 @@ class Dashscope(BaseLLM):
                     temperature=self.temperature,
                     top_p=self.top_p,
                     repetition_penalty=self.repetition_penalty,
-                    stream=self.stream,
+                    stream=stream,
                     tools=tools,
                     parallel_tool_calls=True,
                     enable_search=self.enable_search,
-                    incremental_output=self.stream,  # 给他调成一样的：这个参数只支持流式调用时设置为True
+                    incremental_output=stream,  # 给他调成一样的：这个参数只支持流式调用时设置为True
                     headers=self.extra_headers,
                     enable_thinking=self.enable_thinking,
                     thinking_budget=self.thinking_budget,
                     response_format=response_format,
                 ),
             )
-        else:
-            response = await loop.run_in_executor(
-                None,
-                partial(
-                    dashscope.MultiModalConversation.call,
-                    api_key=self.api_key,
-                    model=self.model,
-                    messages=messages,
-                    max_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                    top_p=self.top_p,
-                    repetition_penalty=self.repetition_penalty,
-                    stream=self.stream,
-                    tools=tools,
-                    parallel_tool_calls=True,
-                    enable_search=self.enable_search,
-                    incremental_output=self.stream,
-                    response_format=response_format,
-                ),
-            )
 
-        if isinstance(response, GenerationResponse) or isinstance(response, MultiModalConversationResponse):
-            return await self._GenerationResponse_handle(messages, tools, response_format, response, total_tokens)
-        return self._Generator_handle(messages, tools, response_format, response, total_tokens)
+        return await loop.run_in_executor(
+            None,
+            partial(
+                dashscope.MultiModalConversation.call,
+                api_key=self.api_key,
+                model=self.model,
+                messages=messages,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                top_p=self.top_p,
+                repetition_penalty=self.repetition_penalty,
+                stream=stream,
+                tools=tools,
+                parallel_tool_calls=True,
+                enable_search=self.enable_search,
+                incremental_output=stream,
+                response_format=response_format,
+            ),
+        )
+
+    async def _ask_sync(
+        self,
+        messages: list,
+        tools: List[dict],
+        response_format: Optional[dict],
+        tool_loop: Optional[ToolLoop] = None,
+    ) -> ModelCompletions:
+        tool_loop = tool_loop or ToolLoop(self.config)
+
+        while True:
+            tool_loop.start_step()
+            response = await self._call(messages, tools, response_format, stream=False)
+            completions = self._GenerationResponse_handle(response, tool_loop)  # type:ignore
+            if completions is not None:
+                break
+
+            if not tool_loop.can_continue():
+                completions = ModelCompletions(tool_loop.stop_message, usage=tool_loop.total_tokens)
+                break
+
+            await self._tool_calls_handle_sync(messages, response, tool_loop)  # type:ignore
+
+        tool_loop.finish()
+        return completions
+
+    async def _ask_stream(
+        self,
+        messages: list,
+        tools: List[dict],
+        response_format: Optional[dict],
+        tool_loop: Optional[ToolLoop] = None,
+    ) -> AsyncGenerator[ModelStreamCompletions, None]:
+        tool_loop = tool_loop or ToolLoop(self.config)
+
+        while True:
+            func_stream = FunctionCallStream()
+
+            tool_loop.start_step()
+            response = await self._call(messages, tools, response_format, stream=True)
+            async for chunk in self._Generator_handle(response, func_stream, tool_loop):  # type:ignore
+                yield chunk
+
+            # 流式处理工具调用响应
+            if not func_stream.enable:
+                break
+
+            if not tool_loop.can_continue():
+                yield ModelStreamCompletions(tool_loop.stop_message, usage=tool_loop.total_tokens)
+                break
+
+            await self._tool_calls_handle_stream(messages, func_stream, tool_loop)
+
+        tool_loop.finish()
 
     @overload
     async def ask(self, request: ModelRequest, *, stream: Literal[False] = False) -> ModelCompletions: ...
@@ -388,8 +429,6 @@ class Dashscope(BaseLLM):
     async def ask(
         self, request: ModelRequest, *, stream: bool = False
     ) -> Union[ModelCompletions, AsyncGenerator[ModelStreamCompletions, None]]:
-        self.stream = stream if stream is not None else False
-
         tools = request.tools if request.tools else []
         messages = self._build_messages(request)
         if request.format == "json" and request.json_schema:
@@ -398,4 +437,9 @@ class Dashscope(BaseLLM):
         else:
             response_format = None
 
-        return await self._ask(messages, tools, response_format)
+        tool_loop = ToolLoop(self.config, request.timings)
+
+        if stream:
+            return self._ask_stream(messages, tools, response_format, tool_loop)
+
+        return await self._ask_sync(messages, tools, response_format, tool_loop)
@@ -14,6 +14,7 @@ from google.genai import errors
 from google.genai.types import (
     Content,
     ContentOrDict,
+    FunctionCall,
     GenerateContentConfig,
     GoogleSearch,
     HarmBlockThreshold,
@@ -36,8 +37,8 @@ from .. import (
     ModelStreamCompletions,
     register,
 )
+from .._tool_loop import ToolLoop
 from ..utils.images import get_file_base64
-from ..utils.tools import function_call_handler
 
 
 @register("gemini")
@@ -92,10 +93,11 @@ class Gemini(BaseLLM):
 
         # build tools
         for tool in tools if tools else []:
-            tool = tool["function"]
-            required_parameters = tool["required"]
-            del tool["required"]
-            tool["parameters"]["required"] = required_parameters
+            # 工具描述会被缓存复用，因此不能原地修改
+            tool = dict(tool["function"])
+            required_parameters = tool.pop("required", None)
+            if required_parameters is not None:
+                tool["parameters"] = {**tool["parameters"], "required": required_parameters}
             format_tools.append(tool)
 
         function_tools = Tool(function_declarations=format_tools)  # type:ignore
@@ -145,58 +147,75 @@ class Gemini(BaseLLM):
 
         return messages
 
+    @staticmethod
+    async def _run_function_calls(tool_loop: ToolLoop, function_calls: List[FunctionCall]) -> List[Content]:
+        """
+        并发执行同一轮中的全部函数调用
+
+        :return: 函数调用消息与函数返回消息
+        """
+        function_returns = await tool_loop.run_tools(
+            [(function_call.name or "", function_call.args or {}) for function_call in function_calls]
+        )
+
+        function_response_parts = [
+            Part.from_function_response(name=function_call.name, response={"result": function_return})  # type:ignore
+            for function_call, function_return in zip(function_calls, function_returns)
+        ]
+
+        return [
+            Content(role="model", parts=[Part(function_call=function_call) for function_call in function_calls]),
+            Content(role="user", parts=function_response_parts),
+        ]
+
     async def _ask_sync(
         self,
         messages: list[ContentOrDict],
         tools: Optional[List[dict]],
         response_format: Optional[Type[BaseModel]],
-        total_tokens: int = 0,
+        tool_loop: Optional[ToolLoop] = None,
     ) -> ModelCompletions:
         gemini_config = self._build_gemini_config(tools, response_format)
         completions = ModelCompletions()
+        tool_loop = tool_loop or ToolLoop(self.config)
 
         try:
-            chat = self.client.aio.chats.create(model=self.model_name, config=gemini_config, history=messages[:-1])
-            message = messages[-1].parts  # type:ignore
-            response = await chat.send_message(message=message)  # type:ignore
-            if response.usage_metadata:
-                total_token_count = response.usage_metadata.total_token_count
-                total_tokens += total_token_count if total_token_count else 0
-
-            if response.text:
-                completions.text = response.text
-
-            if (
-                response.candidates
-                and response.candidates[0].content
-                and response.candidates[0].content.parts
-                and response.candidates[0].content.parts[0].inline_data
-                and response.candidates[0].content.parts[0].inline_data.data
-            ):
-                completions.resources = [
-                    Resource(type="image", raw=response.candidates[0].content.parts[0].inline_data.data)
-                ]
+            while True:
+                completions = ModelCompletions()
 
-            if response.function_calls:
-                function_call = response.function_calls[0]
-                function_name = function_call.name
-                function_args = function_call.args
+                tool_loop.start_step()
+                chat = self.client.aio.chats.create(model=self.model_name, config=gemini_config, history=messages[:-1])
+                message = messages[-1].parts  # type:ignore
+                response = await chat.send_message(message=message)  # type:ignore
+                usage_metadata = response.usage_metadata
+                tool_loop.finish_model((usage_metadata.total_token_count or 0) if usage_metadata else 0)
 
-                function_return = await function_call_handler(function_name, function_args)  # type:ignore
+                if response.text:
+                    completions.text = response.text
 
-                function_response_part = Part.from_function_response(
-                    name=function_name,  # type:ignore
-                    response={"result": function_return},
-                )
+                if (
+                    response.candidates
+                    and response.candidates[0].content
+                    and response.candidates[0].content.parts
+                    and response.candidates[0].content.parts[0].inline_data
+                    and response.candidates[0].content.parts[0].inline_data.data
+                ):
+                    completions.resources = [
+                        Resource(type="image", raw=response.candidates[0].content.parts[0].inline_data.data)
+                    ]
 
-                messages.append(Content(role="model", parts=[Part(function_call=function_call)]))
-                messages.append(Content(role="user", parts=[function_response_part]))
+                if response.function_calls:
+                    if not tool_loop.can_continue():
+                        completions.text += tool_loop.stop_message
+                        break
 
-                return await self._ask_sync(messages, tools, response_format, total_tokens)
+                    messages.extend(await self._run_function_calls(tool_loop, response.function_calls))
+                    continue
 
-            completions.text = completions.text or "（警告：模型无输出！）"
-            completions.usage = total_tokens
-            return completions
+                completions.text = completions.text or "（警告：模型无输出！）"
+                break
+
+            completions.usage = tool_loop.total_tokens
 
         except errors.APIError as e:
             error_message = f"API 状态异常: {e.code}({e.response})"
@@ -204,76 +223,75 @@ class Gemini(BaseLLM):
             completions.succeed = False
             logger.error(error_message)
             logger.error(e.message)
-            return completions
 
         except ConnectError:
             error_message = "模型加载器连接超时"
             completions.text = error_message
             completions.succeed = False
             logger.error(error_message)
-            return completions
+
+        tool_loop.finish()
+        return completions
 
     async def _ask_stream(
         self,
         messages: list,
         tools: Optional[List[dict]],
         response_format: Optional[Type[BaseModel]],
-        total_tokens: int = 0,
+        tool_loop: Optional[ToolLoop] = None,
     ) -> AsyncGenerator[ModelStreamCompletions, None]:
         gemini_config = self._build_gemini_config(tools, response_format)
-        try:
-            current_total_tokens = 0
-            stream = await self.client.aio.models.generate_content_stream(
-                model=self.model_name, contents=messages, config=gemini_config
-            )
-            stream = await stream if isinstance(stream, Awaitable) else stream
-            async for chunk in stream:
-                stream_completions = ModelStreamCompletions()
+        tool_loop = tool_loop or ToolLoop(self.config)
 
-                if chunk.text:
-                    stream_completions.chunk = chunk.text
-                    yield stream_completions
-
-                if chunk.usage_metadata and chunk.usage_metadata.total_token_count:
-                    current_total_tokens = chunk.usage_metadata.total_token_count
+        try:
+            while True:
+                current_total_tokens = 0
+                function_calls: List[FunctionCall] = []
 
-                if (
-                    chunk.candidates
-                    and chunk.candidates[0].content
-                    and chunk.candidates[0].content.parts
-                    and chunk.candidates[0].content.parts[0].inline_data
-                    and chunk.candidates[0].content.parts[0].inline_data.data
-                ):
-                    stream_completions.resources = [
-                        Resource(type="image", raw=chunk.candidates[0].content.parts[0].inline_data.data)
-                    ]
-                    yield stream_completions
+                tool_loop.start_step()
+                stream = await self.client.aio.models.generate_content_stream(
+                    model=self.model_name, contents=messages, config=gemini_config
+                )
+                stream = await stream if isinstance(stream, Awaitable) else stream
+                async for chunk in stream:
+                    stream_completions = ModelStreamCompletions()
+
+                    if chunk.text:
+                        stream_completions.chunk = chunk.text
+                        yield stream_completions
+
+                    if chunk.usage_metadata and chunk.usage_metadata.total_token_count:
+                        current_total_tokens = chunk.usage_metadata.total_token_count
+
+                    if (
+                        chunk.candidates
+                        and chunk.candidates[0].content
+                        and chunk.candidates[0].content.parts
+                        and chunk.candidates[0].content.parts[0].inline_data
+                        and chunk.candidates[0].content.parts[0].inline_data.data
+                    ):
+                        stream_completions.resources = [
+                            Resource(type="image", raw=chunk.candidates[0].content.parts[0].inline_data.data)
+                        ]
+                        yield stream_completions
 
-                if chunk.function_calls:
-                    function_call = chunk.function_calls[0]
-                    function_name = function_call.name
-                    function_args = function_call.args
+                    if chunk.function_calls:
+                        function_calls = chunk.function_calls
+                        break
 
-                    function_return = await function_call_handler(function_name, function_args)  # type:ignore
+                tool_loop.finish_model(current_total_tokens)
 
-                    function_response_part = Part.from_function_response(
-                        name=function_name,  # type:ignore
-                        response={"result": function_return},
-                    )
+                if not function_calls:
+                    break
 
-                    messages.append(Content(role="model", parts=[Part(function_call=function_call)]))
-                    messages.append(Content(role="user", parts=[function_response_part]))
+                if not tool_loop.can_continue():
+                    yield ModelStreamCompletions(chunk=tool_loop.stop_message, usage=tool_loop.total_tokens)
+                    break
 
-                    async for final_chunk in self._ask_stream(
-                        messages, tools, response_format, total_tokens + current_total_tokens
-                    ):
-                        yield final_chunk
-                    return
+                messages.extend(await self._run_function_calls(tool_loop, function_calls))
 
             totaltokens_completions = ModelStreamCompletions()
-
-            total_tokens += current_total_tokens
-            totaltokens_completions.usage = total_tokens
+            totaltokens_completions.usage = tool_loop.total_tokens
             yield totaltokens_completions
 
         except errors.APIError as e:
@@ -284,7 +302,6 @@ class Gemini(BaseLLM):
             logger.error(e.message)
             stream_completions.succeed = False
             yield stream_completions
-            return
 
         except ConnectError:
             stream_completions = ModelStreamCompletions()
@@ -293,7 +310,8 @@ class Gemini(BaseLLM):
             logger.error(error_message)
             stream_completions.succeed = False
             yield stream_completions
-            return
+
+        tool_loop.finish()
 
     @overload
     async def ask(self, request: ModelRequest, *, stream: Literal[False] = False) -> ModelCompletions: ...
@@ -309,7 +327,9 @@ class Gemini(BaseLLM):
         messages = self._build_messages(request)
         response_format = request.json_schema if request.format == "json" else None
 
+        tool_loop = ToolLoop(self.config, request.timings)
+
         if stream:
-            return self._ask_stream(messages, request.tools, response_format)
+            return self._ask_stream(messages, request.tools, response_format, tool_loop)
 
-        return await self._ask_sync(messages, request.tools, response_format)
+        return await self._ask_sync(messages, request.tools, response_format, tool_loop)
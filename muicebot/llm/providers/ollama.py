@@ -12,8 +12,8 @@ from .. import (
     ModelStreamCompletions,
     register,
 )
+from .._tool_loop import ToolLoop
 from ..utils.images import get_file_base64
-from ..utils.tools import function_call_handler
 
 
 @register("ollama")
@@ -85,103 +85,122 @@ class Ollama(BaseLLM):
         messages: list,
         tools: List[dict[str, Any]],
         response_format: Optional[dict[str, Any]],
-        total_tokens: int = -1,
+        tool_loop: Optional[ToolLoop] = None,
     ) -> ModelCompletions:
         completions = ModelCompletions()
+        tool_loop = tool_loop or ToolLoop(self.config)
 
         try:
-            response = await self.client.chat(
-                model=self.model,
-                messages=messages,
-                tools=tools,
-                stream=False,
-                format=response_format,
-                options={
-                    "temperature": self.temperature,
-                    "top_k": self.top_k,
-                    "top_p": self.top_p,
-                    "repeat_penalty": self.repeat_penalty,
-                    "presence_penalty": self.presence_penalty,
-                    "frequency_penalty": self.frequency_penalty,
-                },
-            )
-
-            tool_calls = response.message.tool_calls
-
-            if not tool_calls:
-                completions.text = response.message.content or "(警告：模型无返回)"
-                return completions
-
-            for tool in tool_calls:
-                function_name = tool.function.name
-                function_args = tool.function.arguments
-
-                function_return = await function_call_handler(function_name, dict(function_args))
+            while True:
+                tool_loop.start_step()
+                response = await self.client.chat(
+                    model=self.model,
+                    messages=messages,
+                    tools=tools,
+                    stream=False,
+                    format=response_format,
+                    options={
+                        "temperature": self.temperature,
+                        "top_k": self.top_k,
+                        "top_p": self.top_p,
+                        "repeat_penalty": self.repeat_penalty,
+                        "presence_penalty": self.presence_penalty,
+                        "frequency_penalty": self.frequency_penalty,
+                    },
+                )
+                tool_loop.finish_model((response.prompt_eval_count or 0) + (response.eval_count or 0))
+
+                tool_calls = response.message.tool_calls
 
-                messages.append(response.message)
-                messages.append({"role": "tool", "content": str(function_return), "name": tool.function.name})
-                return await self._ask_sync(messages, tools, response_format)
+                if not tool_calls:
+                    completions.text = response.message.content or "(警告：模型无返回)"
+                    break
 
-            completions.text = "模型调用错误：未知错误"
-            completions.succeed = False
-            return completions
+                if not tool_loop.can_continue():
+                    completions.text = (response.message.content or "") + tool_loop.stop_message
+                    break
+
+                function_returns = await tool_loop.run_tools(
+                    [(tool.function.name, dict(tool.function.arguments)) for tool in tool_calls]
+                )
+
+                messages.append(response.message)
+                for tool, function_return in zip(tool_calls, function_returns):
+                    messages.append({"role": "tool", "content": str(function_return), "name": tool.function.name})
 
         except ollama.ResponseError as e:
             error_info = f"模型调用错误: {e.error}"
             logger.error(error_info)
             completions.succeed = False
             completions.text = error_info
-            return completions
+
+        tool_loop.finish()
+        return completions
 
     async def _ask_stream(
         self,
         messages: list,
         tools: List[dict[str, Any]],
         response_format: Optional[dict[str, Any]],
-        total_tokens: int = -1,
+        tool_loop: Optional[ToolLoop] = None,
     ) -> AsyncGenerator[ModelStreamCompletions, None]:
+        tool_loop = tool_loop or ToolLoop(self.config)
+
         try:
-            response = await self.client.chat(
-                model=self.model,
-                messages=messages,
-                tools=tools,
-                stream=True,
-                format=response_format,
-                options={
-                    "temperature": self.temperature,
-                    "top_k": self.top_k,
-                    "top_p": self.top_p,
-                    "repeat_penalty": self.repeat_penalty,
-                    "presence_penalty": self.presence_penalty,
-                    "frequency_penalty": self.frequency_penalty,
-                },
-            )
-
-            async for chunk in response:
-                stream_completions = ModelStreamCompletions()
-
-                tool_calls = chunk.message.tool_calls
-
-                if chunk.message.content:
-                    stream_completions.chunk = chunk.message.content
-                    yield stream_completions
-                    continue
+            while True:
+                step_tokens = 0
+                tool_messages = []
+                """包含工具调用请求的模型消息"""
+                tool_calls = []
+
+                tool_loop.start_step()
+                response = await self.client.chat(
+                    model=self.model,
+                    messages=messages,
+                    tools=tools,
+                    stream=True,
+                    format=response_format,
+                    options={
+                        "temperature": self.temperature,
+                        "top_k": self.top_k,
+                        "top_p": self.top_p,
+                        "repeat_penalty": self.repeat_penalty,
+                        "presence_penalty": self.presence_penalty,
+                        "frequency_penalty": self.frequency_penalty,
+                    },
+                )
+
+                async for chunk in response:
+                    stream_completions = ModelStreamCompletions()
+
+                    if chunk.done:
+                        step_tokens = (chunk.prompt_eval_count or 0) + (chunk.eval_count or 0)
+
+                    if chunk.message.tool_calls:
+                        tool_messages.append(chunk.message)
+                        tool_calls.extend(chunk.message.tool_calls)
+
+                    if chunk.message.content:
+                        stream_completions.chunk = chunk.message.content
+                        yield stream_completions
+
+                tool_loop.finish_model(step_tokens)
 
                 if not tool_calls:
-                    continue
+                    break
 
-                for tool in tool_calls:  # type:ignore
-                    function_name = tool.function.name
-                    function_args = tool.function.arguments
+                if not tool_loop.can_continue():
+                    yield ModelStreamCompletions(chunk=tool_loop.stop_message, usage=tool_loop.total_tokens)
+                    break
 
-                    function_return = await function_call_handler(function_name, dict(function_args))
+                function_returns = await tool_loop.run_tools(
+                    [(tool.function.name, dict(tool.function.arguments)) for tool in tool_calls]
+                )
 
-                    messages.append(chunk.message)  # type:ignore
+                messages.extend(tool_messages)
+                for tool, function_return in zip(tool_calls, function_returns):
                     messages.append({"role": "tool", "content": str(function_return), "name": tool.function.name})
 
-                    async for content in self._ask_stream(messages, tools, response_format):
-                        yield content
-
         except ollama.ResponseError as e:
             stream_completions = ModelStreamCompletions()
             error_info = f"模型调用错误: {e.error}"
@@ -189,7 +208,8 @@ class Ollama(BaseLLM):
             stream_completions.chunk = error_info
             stream_completions.succeed = False
             yield stream_completions
-            return
+
+        tool_loop.finish()
 
     @overload
     async def ask(self, request: ModelRequest, *, stream: Literal[False] = False) -> ModelCompletions: ...
@@ -209,7 +229,9 @@ class Ollama(BaseLLM):
         else:
             format = None
 
+        tool_loop = ToolLoop(self.config, request.timings)
+
         if stream:
-            return self._ask_stream(messages, tools, format)
+            return self._ask_stream(messages, tools, format, tool_loop)
 
-        return await self._ask_sync(messages, tools, format)
+        return await self._ask_sync(messages, tools, format, tool_loop)
@@ -1,7 +1,7 @@
 import base64
 import json
 from io import BytesIO
-from typing import AsyncGenerator, List, Literal, Union, overload
+from typing import AsyncGenerator, List, Literal, Optional, Union, overload
 
 import openai
 from nonebot import logger
@@ -14,6 +14,7 @@ from openai.types.shared_params.response_format_json_schema import (
 
 from muicebot.models import Resource
 
+from ...utils.http import get_http_client, get_http_timeout
 from .. import (
     BaseLLM,
     ModelCompletions,
@@ -22,8 +23,8 @@ from .. import (
     ModelStreamCompletions,
     register,
 )
+from .._tool_loop import ToolLoop
 from ..utils.images import get_file_base64
-from ..utils.tools import function_call_handler
 
 
 @register("openai")
@@ -44,7 +45,9 @@ class Openai(BaseLLM):
         self.audio = self.config.audio if (self.modalities and self.config.audio) else NOT_GIVEN
         self.extra_body = self.config.extra_body
 
-        self.client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.api_base, timeout=30)
+        self.client = openai.AsyncOpenAI(
+            api_key=self.api_key, base_url=self.api_base, timeout=get_http_timeout(), http_client=get_http_client()
+        )
 
     def __build_multi_messages(self, request: ModelRequest) -> dict:
         """
@@ -111,81 +114,97 @@ class Openai(BaseLLM):
         """
         工具调用请求预检
         """
-        # We expect a single tool call
-        if not (message.tool_calls and len(message.tool_calls) == 1):
+        # We expect at least one tool call
+        if not message.tool_calls:
             return False
 
-        # We expect the tool to be a function call
-        tool_call = message.tool_calls[0]
-        if tool_call.type != "function":
-            return False
+        # We expect every tool to be a function call
+        return all(tool_call.type == "function" for tool_call in message.tool_calls)
+
+    @staticmethod
+    async def _run_tool_calls(tool_loop: ToolLoop, tool_calls: List[tuple[str, str, dict]]) -> List[dict]:
+        """
+        并发执行同一轮中的全部工具调用
+
+        :param tool_loop: 工具调用循环
+        :param tool_calls: (tool_call_id, 函数名, 参数) 列表
+        :return: 与调用顺序一致的 tool 消息列表
+        """
+        function_returns = await tool_loop.run_tools([(name, arguments) for _, name, arguments in tool_calls])
 
-        return True
+        return [
+            {"tool_call_id": tool_call_id, "role": "tool", "name": name, "content": function_return}
+            for (tool_call_id, name, _), function_return in zip(tool_calls, function_returns)
+        ]
 
     async def _ask_sync(
         self,
         messages: list,
         tools: Union[List[ChatCompletionToolParam], NotGiven],
         response_format: Union[ResponseFormatJSONSchema, NotGiven],
-        total_tokens: int = 0,
+        tool_loop: Optional[ToolLoop] = None,
     ) -> ModelCompletions:
         completions = ModelCompletions()
+        tool_loop = tool_loop or ToolLoop(self.config)
 
         try:
-            response = await self.client.chat.completions.create(
-                audio=self.audio,
-                model=self.model,
-                modalities=self.modalities,
-                messages=messages,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                stream=False,
-                tools=tools,
-                extra_body=self.extra_body,
-                response_format=response_format,
-            )
-
-            logger.debug(f"OpenAI response: id={response.id}, choices={response.choices}, usage={response.usage}")
-
-            result = ""
-            message = response.choices[0].message  # type:ignore
-            total_tokens += response.usage.total_tokens if response.usage else 0
+            while True:
+                tool_loop.start_step()
+                response = await self.client.chat.completions.create(
+                    audio=self.audio,
+                    model=self.model,
+                    modalities=self.modalities,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    stream=False,
+                    tools=tools,
+                    extra_body=self.extra_body,
+                    response_format=response_format,
+                )
+                tool_loop.finish_model(response.usage.total_tokens if response.usage else 0)
 
-            if (
-                hasattr(message, "reasoning_content")  # type:ignore
-                and message.reasoning_content  # type:ignore
-            ):
-                result += f"<think>{message.reasoning_content}</think>"  # type:ignore
+                logger.debug(f"OpenAI response: id={response.id}, choices={response.choices}, usage={response.usage}")
 
-            if response.choices[0].finish_reason == "tool_calls" and self._tool_call_request_precheck(
-                response.choices[0].message
-            ):
-                messages.append(response.choices[0].message)
-                tool_call = response.choices[0].message.tool_calls[0]  # type:ignore
-                arguments = json.loads(tool_call.function.arguments.replace("'", '"'))
+                result = ""
+                message = response.choices[0].message  # type:ignore
 
-                function_return = await function_call_handler(tool_call.function.name, arguments)
+                if (
+                    hasattr(message, "reasoning_content")  # type:ignore
+                    and message.reasoning_content  # type:ignore
+                ):
+                    result += f"<think>{message.reasoning_content}</think>"  # type:ignore
+
+                if response.choices[0].finish_reason == "tool_calls" and self._tool_call_request_precheck(message):
+                    if not tool_loop.can_continue():
+                        completions.text = result + tool_loop.stop_message
+                        break
+
+                    messages.append(message)
+                    tool_calls = [
+                        (
+                            tool_call.id,
+                            tool_call.function.name,
+                            json.loads((tool_call.function.arguments or "{}").replace("'", '"')),
+                        )
+                        for tool_call in message.tool_calls  # type:ignore
+                    ]
+
+                    messages.extend(await self._run_tool_calls(tool_loop, tool_calls))
+                    continue
 
-                messages.append(
-                    {
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "name": tool_call.function.name,
-                        "content": function_return,
-                    }
-                )
-                return await self._ask_sync(messages, tools, response_format, total_tokens)
+                if message.content:  # type:ignore
+                    result += message.content  # type:ignore
 
-            if message.content:  # type:ignore
-                result += message.content  # type:ignore
+                # 多模态消息处理（目前仅支持 audio 输出）
+                if message.audio:
+                    wav_bytes = base64.b64decode(message.audio.data)
+                    completions.resources = [Resource(type="audio", raw=wav_bytes)]
 
-            # 多模态消息处理（目前仅支持 audio 输出）
-            if response.choices[0].message.audio:
-                wav_bytes = base64.b64decode(response.choices[0].message.audio.data)
-                completions.resources = [Resource(type="audio", raw=wav_bytes)]
+                completions.text = result or "（警告：模型无输出！）"
+                break
 
-            completions.text = result or "（警告：模型无输出！）"
-            completions.usage = total_tokens
+            completions.usage = tool_loop.total_tokens
 
         except openai.APIConnectionError as e:
             error_message = f"API 连接错误: {e}"
@@ -200,6 +219,7 @@ class Openai(BaseLLM):
             logger.error(error_message)
             completions.succeed = False
 
+        tool_loop.finish()
         return completions
 
     async def _ask_stream(
@@ -207,86 +227,98 @@ class Openai(BaseLLM):
         messages: list,
         tools: Union[List[ChatCompletionToolParam], NotGiven],
         response_format: Union[ResponseFormatJSONSchema, NotGiven],
-        total_tokens: int = 0,
+        tool_loop: Optional[ToolLoop] = None,
     ) -> AsyncGenerator[ModelStreamCompletions, None]:
-        is_insert_think_label = False
-        function_id = ""
-        function_name = ""
-        function_arguments = ""
-        audio_string = ""
+        tool_loop = tool_loop or ToolLoop(self.config)
 
         try:
-            response = await self.client.chat.completions.create(
-                audio=self.audio,
-                model=self.model,
-                modalities=self.modalities,
-                messages=messages,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                stream=True,
-                stream_options={"include_usage": True},
-                tools=tools,
-                extra_body=self.extra_body,
-                response_format=response_format,
-            )
-
-            async for chunk in response:
-                stream_completions = ModelStreamCompletions()
-
-                logger.debug(f"OpenAI response: id={chunk.id}, choices={chunk.choices}, usage={chunk.usage}")
-
-                # 获取 usage （最后一个包中返回）
-                if chunk.usage:
-                    total_tokens += chunk.usage.total_tokens
-                    stream_completions.usage = total_tokens
-
-                if not chunk.choices:
-                    yield stream_completions
-                    continue
-
-                # 处理 Function call
-                if chunk.choices[0].delta.tool_calls:
-                    tool_call = chunk.choices[0].delta.tool_calls[0]
-                    if tool_call.id:
-                        function_id = tool_call.id
-                    if tool_call.function:
-                        if tool_call.function.name:
-                            function_name += tool_call.function.name
-                        if tool_call.function.arguments:
-                            function_arguments += tool_call.function.arguments
-
-                delta = chunk.choices[0].delta
-                answer_content = delta.content
-
-                # 处理思维过程 reasoning_content
-                if (
-                    hasattr(delta, "reasoning_content") and delta.reasoning_content  # type:ignore
-                ):
-                    reasoning_content = chunk.choices[0].delta.reasoning_content  # type:ignore
-                    stream_completions.chunk = (
-                        reasoning_content if is_insert_think_label else "<think>" + reasoning_content
-                    )
-                    yield stream_completions
-                    is_insert_think_label = True
-
-                elif answer_content:
-                    stream_completions.chunk = (
-                        answer_content if not is_insert_think_label else "</think>" + answer_content
-                    )
-                    yield stream_completions
-                    is_insert_think_label = False
-
-                # 处理多模态消息 (audio-only) (非标准方法，可能出现问题)
-                if hasattr(chunk.choices[0].delta, "audio"):
-                    audio = chunk.choices[0].delta.audio  # type:ignore
-                    if audio.get("data", None):
-                        audio_string += audio.get("data")
-                    stream_completions.chunk = audio.get("transcript", "")
-                    yield stream_completions
-
-            if function_id:
+            while True:
+                is_insert_think_label = False
+                function_calls: dict[int, dict[str, str]] = {}
+                """按 index 累积的工具调用: index -> {id, name, arguments}"""
+                audio_string = ""
+                step_tokens = 0
+
+                tool_loop.start_step()
+                response = await self.client.chat.completions.create(
+                    audio=self.audio,
+                    model=self.model,
+                    modalities=self.modalities,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    tools=tools,
+                    extra_body=self.extra_body,
+                    response_format=response_format,
+                )
 
-                function_return = await function_call_handler(function_name, json.loads(function_arguments))
+                async for chunk in response:
+                    stream_completions = ModelStreamCompletions()
+
+                    logger.debug(f"OpenAI response: id={chunk.id}, choices={chunk.choices}, usage={chunk.usage}")
+
+                    # 获取 usage （最后一个包中返回）
+                    if chunk.usage:
+                        step_tokens += chunk.usage.total_tokens
+                        stream_completions.usage = tool_loop.total_tokens + step_tokens
+
+                    if not chunk.choices:
+                        yield stream_completions
+                        continue
+
+                    # 处理 Function call
+                    for tool_call in chunk.choices[0].delta.tool_calls or []:
+                        function_call = function_calls.setdefault(
+                            tool_call.index, {"id": "", "name": "", "arguments": ""}
+                        )
+                        if tool_call.id:
+                            function_call["id"] = tool_call.id
+                        if tool_call.function:
+                            if tool_call.function.name:
+                                function_call["name"] += tool_call.function.name
+                            if tool_call.function.arguments:
+                                function_call["arguments"] += tool_call.function.arguments
+
+                    delta = chunk.choices[0].delta
+                    answer_content = delta.content
+
+                    # 处理思维过程 reasoning_content
+                    if (
+                        hasattr(delta, "reasoning_content") and delta.reasoning_content  # type:ignore
+                    ):
+                        reasoning_content = chunk.choices[0].delta.reasoning_content  # type:ignore
+                        stream_completions.chunk = (
+                            reasoning_content if is_insert_think_label else "<think>" + reasoning_content
+                        )
+                        yield stream_completions
+                        is_insert_think_label = True
+
+                    elif answer_content:
+                        stream_completions.chunk = (
+                            answer_content if not is_insert_think_label else "</think>" + answer_content
+                        )
+                        yield stream_completions
+                        is_insert_think_label = False
+
+                    # 处理多模态消息 (audio-only) (非标准方法，可能出现问题)
+                    if audio := getattr(chunk.choices[0].delta, "audio", None):
+                        if audio.get("data", None):
+                            audio_string += audio.get("data")
+                        stream_completions.chunk = audio.get("transcript", "")
+                        yield stream_completions
+
+                tool_loop.finish_model(step_tokens)
+
+                if not function_calls:
+                    break
+
+                if not tool_loop.can_continue():
+                    yield ModelStreamCompletions(chunk=tool_loop.stop_message, usage=tool_loop.total_tokens)
+                    break
+
+                ordered_calls = [function_calls[index] for index in sorted(function_calls)]
 
                 messages.append(
                     {
@@ -294,25 +326,21 @@ class Openai(BaseLLM):
                         "content": None,
                         "tool_calls": [
                             {
-                                "id": function_id,
+                                "id": call["id"],
                                 "type": "function",
-                                "function": {"name": function_name, "arguments": function_arguments},
+                                "function": {"name": call["name"], "arguments": call["arguments"]},
                             }
+                            for call in ordered_calls
                         ],
                     }
                 )
-                messages.append(
-                    {
-                        "tool_call_id": function_id,
-                        "role": "tool",
-                        "content": function_return,
-                    }
+                messages.extend(
+                    await self._run_tool_calls(
+                        tool_loop,
+                        [(call["id"], call["name"], json.loads(call["arguments"] or "{}")) for call in ordered_calls],
+                    )
                 )
 
-                async for chunk in self._ask_stream(messages, tools, response_format, total_tokens):
-                    yield chunk
-                return
-
             # 处理多模态返回
             if audio_string:
                 import numpy as np
@@ -344,6 +372,8 @@ class Openai(BaseLLM):
             stream_completions.succeed = False
             yield stream_completions
 
+        tool_loop.finish()
+
     @overload
     async def ask(self, request: ModelRequest, *, stream: Literal[False] = False) -> ModelCompletions: ...
 
@@ -365,7 +395,9 @@ class Openai(BaseLLM):
         else:
             response_format = NOT_GIVEN
 
+        tool_loop = ToolLoop(self.config, request.timings)
+
         if stream:
-            return self._ask_stream(messages, tools, response_format)  # type:ignore
+            return self._ask_stream(messages, tools, response_format, tool_loop)  # type:ignore
 
-        return await self._ask_sync(messages, tools, response_format)  # type:ignore
+        return await self._ask_sync(messages, tools, response_format, tool_loop)  # type:ignore
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import json
+import math
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ...models import Message
+    from .._schema import ModelRequest
+
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数量（不依赖具体分词器）
+
+    中日韩字符按每字 1 token 计算，其余字符按每 4 个字符 1 token 计算
+
+    :param text: 文本
+    :return: 估算的 token 数量
+    """
+    if not text:
+        return 0
+
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def estimate_message_tokens(message: Message) -> int:
+    """
+    估算一轮对话（用户消息与模型回复）的 token 数量
+    """
+    return estimate_tokens(message.message) + estimate_tokens(message.respond)
+
+
+def estimate_tool_tokens(tool: dict) -> int:
+    """
+    估算工具 schema 的 token 数量
+    """
+    return estimate_tokens(json.dumps(tool, ensure_ascii=False))
+
+
+def estimate_request_tokens(request: ModelRequest) -> int:
+    """
+    估算一次模型请求的提示词 token 数量（不包括多模态资源）
+    """
+    return (
+        estimate_tokens(request.prompt)
+        + estimate_tokens(request.system or "")
+        + sum(estimate_message_tokens(item) for item in request.history)
+        + sum(estimate_tool_tokens(tool) for tool in request.tools or [])
+    )
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    截断文本，使其估算 token 数量不超过 max_tokens
+    """
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
@@ -1,25 +1,54 @@
-from typing import Any
+from typing import Any, Optional
 
 from nonebot import logger
 
-from muicebot.plugin.func_call import get_function_calls
-from muicebot.plugin.mcp import handle_mcp_tool
+from muicebot.plugin.func_call import CachePolicy, get_function_calls, tool_cache
+from muicebot.plugin.func_call._types import ToolResult
+from muicebot.plugin.func_call.caller import Caller
+from muicebot.plugin.mcp import get_mcp_cache_policy, handle_mcp_tool
 
 
 async def function_call_handler(func: str, arguments: dict[str, str] | None = None) -> Any:
     """
     模型 Function Call 请求处理
+
+    配置了缓存策略的工具在 TTL 内以相同参数调用时直接返回缓存结果，不会再次执行。
+    超时、执行失败或未找到函数的结果不写入缓存
     """
     arguments = arguments if arguments and arguments != {"dummy_param": ""} else {}
 
-    if func_caller := get_function_calls().get(func):
+    func_caller = get_function_calls().get(func)
+    policy: Optional[CachePolicy] = func_caller.cache if func_caller else get_mcp_cache_policy(func)
+    cache_key = tool_cache.make_key(arguments, policy) if policy else None
+
+    if cache_key is not None:
+        hit, result = tool_cache.get(func, cache_key)
+        if hit:
+            logger.info(f"Function call {func} 命中缓存, 参数: {arguments}")
+            return result
+
+    result = await _execute(func, func_caller, arguments)
+
+    if policy and cache_key is not None and result.content is not None and not result.failed:
+        tool_cache.set(func, cache_key, result.content, policy)
+
+    return result.content
+
+
+async def _execute(func: str, func_caller: Optional[Caller], arguments: dict[str, str]) -> ToolResult:
+    """
+    执行 Function Call 或 MCP 工具
+    """
+    if func_caller:
         logger.info(f"Function call 请求 {func}, 参数: {arguments}")
         result = await func_caller.run(**arguments)
-        logger.success(f"Function call 成功，返回: {result}")
+        if not result.failed:
+            logger.success(f"Function call 成功，返回: {result.content}")
         return result
 
     if mcp_result := await handle_mcp_tool(func, arguments):
-        logger.success(f"MCP 工具执行成功，返回: {mcp_result}")
+        if not mcp_result.failed:
+            logger.success(f"MCP 工具执行成功，返回: {mcp_result.content}")
         return mcp_result
 
-    return "(Unknown Function)"
+    return ToolResult("(Unknown Function)", failed=True)
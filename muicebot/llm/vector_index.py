@@ -0,0 +1,475 @@
+"""
+向量相似度检索
+
+提供两种基于余弦相似度的向量索引，供插件配合 `EmbeddingModel` 使用:
+
+- `FlatIndex`: 精确检索，以 NumPy 分块矩阵乘法批量计算 top-k，适合较小的集合
+- `IVFIndex`: 近似检索，使用球面 k-means 将向量划分到若干分区，查询时只扫描最相近的 `nprobe` 个分区，适合较大的集合
+
+两种索引都支持添加、删除、保存和加载，并可选择以 float16 存储向量以减少一半的内存占用
+"""
+
+from __future__ import annotations
+
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+from numpy import ndarray
+
+_CHUNK_ROWS = 16384
+"""分块计算相似度时每块的行数"""
+
+VectorDtype = Literal["float32", "float16"]
+Vectors = Union[ndarray, Sequence[Sequence[float]]]
+
+
+class SearchHit(NamedTuple):
+    """
+    检索结果
+    """
+
+    id: str
+    """向量 ID"""
+    score: float
+    """余弦相似度"""
+
+
+def _normalize(vectors: Vectors) -> ndarray:
+    """
+    转换为二维 float32 矩阵并按行归一化
+    """
+    matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def _top_k(scores: ndarray, k: int) -> tuple[ndarray, ndarray]:
+    """
+    获取每行得分最高的 k 个位置（按得分降序）
+
+    :param scores: (查询数, 候选数) 的得分矩阵
+    :return: (位置, 得分)
+    """
+    if k < scores.shape[1]:
+        positions = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        positions = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    top_scores = np.take_along_axis(scores, positions, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(positions, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class VectorIndex(ABC):
+    """
+    向量索引基类
+    """
+
+    kind: str = ""
+    """索引类型（用于保存和加载）"""
+
+    def __init__(self, dim: int, dtype: VectorDtype = "float32") -> None:
+        """
+        :param dim: 向量维度
+        :param dtype: 向量的存储类型。`float16` 占用一半内存，计算时会转换为 float32
+        """
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+
+        self._vectors = np.empty((0, dim), dtype=self.dtype)
+        """归一化后的向量（容量按需倍增，有效行数为 `len(self)`）"""
+        self._ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        """ID -> 行号"""
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self._rows
+
+    @property
+    def ids(self) -> list[str]:
+        return list(self._ids)
+
+    @property
+    def vectors(self) -> ndarray:
+        """
+        有效的向量矩阵（视图）
+        """
+        return self._vectors[: len(self)]
+
+    def add(self, ids: Sequence[str], vectors: Vectors) -> None:
+        """
+        添加向量。ID 已存在时覆盖原有向量
+
+        :param ids: 向量 ID
+        :param vectors: (数量, 维度) 的向量矩阵
+        """
+        matrix = _normalize(vectors)
+        if matrix.shape != (len(ids), self.dim):
+            raise ValueError(f"向量形状 {matrix.shape} 与 ID 数量 {len(ids)} 或索引维度 {self.dim} 不一致")
+
+        new_rows = []
+        for id, vector in zip(ids, matrix):
+            if (row := self._rows.get(id)) is not None:
+                self._vectors[row] = vector
+                self._on_update(row)
+                continue
+
+            row = len(self._ids)
+            if row == len(self._vectors):
+                capacity = max(2 * len(self._vectors), 64)
+                self._vectors = np.resize(self._vectors, (capacity, self.dim))
+            self._vectors[row] = vector
+            self._ids.append(id)
+            self._rows[id] = row
+            new_rows.append(row)
+
+        if new_rows:
+            self._on_add(np.asarray(new_rows))
+
+    def remove(self, ids: Sequence[str]) -> int:
+        """
+        删除向量（将最后一行移动到被删除的位置）
+
+        :return: 实际删除的数量
+        """
+        removed = 0
+        for id in ids:
+            row = self._rows.pop(id, None)
+            if row is None:
+                continue
+
+            last = len(self._ids) - 1
+            last_id = self._ids.pop()
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                self._ids[row] = last_id
+                self._rows[last_id] = row
+            self._on_remove(row, last)
+            removed += 1
+
+        return removed
+
+    def search(self, queries: Vectors, k: int = 5) -> list[list[SearchHit]]:
+        """
+        批量检索与查询向量最相似的 k 个向量
+
+        :param queries: 单个查询向量或 (查询数, 维度) 的矩阵
+        :param k: 每个查询返回的结果数量
+        :return: 每个查询的结果列表（按相似度降序）
+        """
+        matrix = _normalize(queries)
+        if matrix.shape[1] != self.dim:
+            raise ValueError(f"查询向量维度 {matrix.shape[1]} 与索引维度 {self.dim} 不一致")
+        if not len(self) or k <= 0:
+            return [[] for _ in range(len(matrix))]
+
+        return self._search(matrix, min(k, len(self)))
+
+    def _exact_search(self, queries: ndarray, k: int, rows: Optional[ndarray] = None) -> list[list[SearchHit]]:
+        """
+        在全部向量（或指定的行）中精确检索
+        """
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        total = len(self) if rows is None else len(rows)
+
+        for start in range(0, total, _CHUNK_ROWS):
+            if rows is None:
+                chunk_rows = np.arange(start, min(start + _CHUNK_ROWS, total))
+                chunk = self._vectors[start : start + len(chunk_rows)]
+            else:
+                chunk_rows = rows[start : start + _CHUNK_ROWS]
+                chunk = self._vectors[chunk_rows]
+
+            scores = queries @ chunk.astype(np.float32, copy=False).T
+            candidates_rows = np.concatenate([best_rows, np.broadcast_to(chunk_rows, scores.shape)], axis=1)
+            candidates_scores = np.concatenate([best_scores, scores], axis=1)
+            positions, best_scores = _top_k(candidates_scores, min(k, candidates_scores.shape[1]))
+            best_rows = np.take_along_axis(candidates_rows, positions, axis=1)
+
+        return [
+            [SearchHit(self._ids[row], float(score)) for row, score in zip(query_rows, query_scores)]
+            for query_rows, query_scores in zip(best_rows, best_scores)
+        ]
+
+    @abstractmethod
+    def _search(self, queries: ndarray, k: int) -> list[list[SearchHit]]:
+        """
+        检索已归一化的查询向量 (1 <= k <= len(self))
+        """
+        raise NotImplementedError
+
+    def _on_add(self, rows: ndarray) -> None:
+        """
+        添加新行后的回调
+        """
+
+    def _on_update(self, row: int) -> None:
+        """
+        覆盖已有行后的回调
+        """
+
+    def _on_remove(self, row: int, last: int) -> None:
+        """
+        删除行后的回调（`last` 行已被移动到 `row`）
+        """
+
+    def _state(self) -> dict[str, ndarray]:
+        """
+        需要额外保存的状态
+        """
+        return {}
+
+    def _load_state(self, state: dict[str, ndarray]) -> None:
+        """
+        恢复额外保存的状态
+        """
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        保存索引至 `.npz` 文件
+        """
+        np.savez(
+            path,
+            kind=np.array(self.kind),
+            dim=np.array(self.dim),
+            dtype=np.array(self.dtype.name),
+            ids=np.array(self._ids, dtype=str),
+            vectors=self.vectors,
+            **self._state(),
+        )
+
+
+class FlatIndex(VectorIndex):
+    """
+    精确检索索引
+    """
+
+    kind = "flat"
+
+    def _search(self, queries: ndarray, k: int) -> list[list[SearchHit]]:
+        return self._exact_search(queries, k)
+
+
+class IVFIndex(VectorIndex):
+    """
+    倒排分区近似检索索引
+
+    向量数量达到 `train_size` 后首次检索时自动训练分区中心，此前使用精确检索
+    """
+
+    kind = "ivf"
+
+    def __init__(
+        self,
+        dim: int,
+        dtype: VectorDtype = "float32",
+        nlist: int = 0,
+        nprobe: int = 8,
+        train_size: int = 0,
+    ) -> None:
+        """
+        :param nlist: 分区数量，为 0 时训练时按 `sqrt(向量数量)` 确定
+        :param nprobe: 查询时扫描的分区数量，越大召回率越高、速度越慢
+        :param train_size: 自动训练所需的最少向量数量，为 0 时取 `max(39 * nlist, 1024)`
+        """
+        super().__init__(dim, dtype)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size or max(39 * nlist, 1024)
+
+        self.centroids: Optional[ndarray] = None
+        """分区中心，未训练时为 None"""
+        self._assign = np.empty(0, dtype=np.int32)
+        """每一行所属的分区"""
+        self._lists: Optional[tuple[ndarray, ndarray]] = None
+        """倒排表缓存: (按分区排序的行号, 各分区在其中的起始位置)"""
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _assign_rows(self, rows: ndarray) -> ndarray:
+        assert self.centroids is not None
+        assign = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), _CHUNK_ROWS):
+            chunk = self._vectors[rows[start : start + _CHUNK_ROWS]].astype(np.float32, copy=False)
+            assign[start : start + len(chunk)] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return assign
+
+    def train(self, iterations: int = 10, seed: int = 0) -> None:
+        """
+        使用球面 k-means 训练分区中心，并重新划分全部向量
+
+        :param iterations: 迭代次数
+        :param seed: 随机种子
+        """
+        size = len(self)
+        if not size:
+            raise ValueError("无法在空索引上训练")
+
+        nlist = min(self.nlist or max(int(np.sqrt(size)), 1), size)
+        rng = np.random.default_rng(seed)
+        sample_rows = rng.choice(size, size=min(size, 256 * nlist), replace=False)
+        sample = self._vectors[sample_rows].astype(np.float32)
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = _normalize(sums)
+
+        self.nlist = nlist
+        self.centroids = centroids
+        self._assign = np.resize(self._assign, len(self._vectors))
+        self._assign[:size] = self._assign_rows(np.arange(size))
+        self._lists = None
+
+    def _get_lists(self) -> tuple[ndarray, ndarray]:
+        if self._lists is None:
+            assign = self._assign[: len(self)]
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+            self._lists = (order, bounds)
+        return self._lists
+
+    def _search(self, queries: ndarray, k: int) -> list[list[SearchHit]]:
+        if not self.is_trained:
+            if len(self) < self.train_size:
+                return self._exact_search(queries, k)
+            self.train()
+
+        assert self.centroids is not None
+        order, bounds = self._get_lists()
+        nprobe = min(self.nprobe, self.nlist)
+        probes, _ = _top_k(queries @ self.centroids.T, nprobe)
+
+        results = []
+        for query, query_probes in zip(queries, probes):
+            rows = np.concatenate([order[bounds[probe] : bounds[probe + 1]] for probe in query_probes])
+            if not len(rows):
+                results.append([])
+                continue
+            results.append(self._exact_search(query[np.newaxis], min(k, len(rows)), rows)[0])
+
+        return results
+
+    def _on_add(self, rows: ndarray) -> None:
+        if len(self._assign) < len(self._vectors):
+            self._assign = np.resize(self._assign, len(self._vectors))
+        if self.is_trained:
+            self._assign[rows] = self._assign_rows(rows)
+            self._lists = None
+
+    def _on_update(self, row: int) -> None:
+        self._on_add(np.asarray([row]))
+
+    def _on_remove(self, row: int, last: int) -> None:
+        self._assign[row] = self._assign[last]
+        self._lists = None
+
+    def _state(self) -> dict[str, ndarray]:
+        state = {
+            "nprobe": np.array(self.nprobe),
+            "nlist": np.array(self.nlist),
+            "train_size": np.array(self.train_size),
+        }
+        if self.centroids is not None:
+            state["centroids"] = self.centroids
+            state["assign"] = self._assign[: len(self)]
+        return state
+
+    def _load_state(self, state: dict[str, ndarray]) -> None:
+        self.nprobe = int(state["nprobe"])
+        self.nlist = int(state["nlist"])
+        self.train_size = int(state["train_size"])
+        if "centroids" in state:
+            self.centroids = state["centroids"]
+            self._assign = np.array(state["assign"], dtype=np.int32)
+
+
+_INDEX_CLASSES: dict[str, type[VectorIndex]] = {FlatIndex.kind: FlatIndex, IVFIndex.kind: IVFIndex}
+
+
+def create_vector_index(dim: int, expected_size: int = 0, dtype: VectorDtype = "float32") -> VectorIndex:
+    """
+    根据预计的向量数量创建合适的索引
+
+    :param dim: 向量维度
+    :param expected_size: 预计的向量数量。小于 10000 时使用精确检索，否则使用近似检索
+    :param dtype: 向量的存储类型
+    """
+    if expected_size < 10000:
+        return FlatIndex(dim, dtype)
+    return IVFIndex(dim, dtype)
+
+
+def load_vector_index(path: Union[str, Path]) -> VectorIndex:
+    """
+    从 `.npz` 文件加载索引
+    """
+    with np.load(path, allow_pickle=False) as data:
+        state = {key: data[key] for key in data.files}
+
+    index = _INDEX_CLASSES[str(state.pop("kind"))](int(state.pop("dim")), str(state.pop("dtype")))  # type:ignore
+    ids = state.pop("ids").tolist()
+    vectors = state.pop("vectors")
+
+    index._vectors = vectors.astype(index.dtype)
+    index._ids = ids
+    index._rows = {id: row for row, id in enumerate(ids)}
+    index._load_state(state)
+    return index
+
+
+@dataclass
+class RecallReport:
+    """
+    近似检索的召回率与延迟评估结果
+    """
+
+    recall: float
+    """与精确检索结果相比的平均召回率"""
+    latency: float
+    """平均每个查询的检索耗时（毫秒）"""
+    exact_latency: float
+    """精确检索平均每个查询的耗时（毫秒）"""
+
+    def __str__(self) -> str:
+        return f"recall@k={self.recall:.3f}, {self.latency:.3f} ms/query (exact {self.exact_latency:.3f} ms/query)"
+
+
+def evaluate_recall(index: VectorIndex, queries: Vectors, k: int = 10) -> RecallReport:
+    """
+    以精确检索为基准，测量索引的召回率与查询延迟（可用于调整 `IVFIndex.nprobe`）
+
+    :param index: 待评估的索引
+    :param queries: 查询向量
+    :param k: 每个查询的结果数量
+    """
+    matrix = _normalize(queries)
+    exact = FlatIndex(index.dim, index.dtype.name)  # type:ignore
+    exact._vectors, exact._ids, exact._rows = index.vectors, index._ids, index._rows
+
+    start = time.perf_counter()
+    expected = [exact.search(query, k)[0] for query in matrix]
+    exact_latency = (time.perf_counter() - start) * 1000 / len(matrix)
+
+    start = time.perf_counter()
+    actual = [index.search(query, k)[0] for query in matrix]
+    latency = (time.perf_counter() - start) * 1000 / len(matrix)
+
+    hits = sum(len({hit.id for hit in a} & {hit.id for hit in e}) for a, e in zip(actual, expected))
+    total = sum(len(e) for e in expected)
+    return RecallReport(hits / total if total else 1.0, latency, exact_latency)
@@ -0,0 +1,8 @@
+"""
+Muicebot 长期记忆
+"""
+
+from .retrieval import memory_retriever
+from .summary import summary_manager
+
+__all__ = ["memory_retriever", "summary_manager"]
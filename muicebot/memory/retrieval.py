@@ -0,0 +1,224 @@
+"""
+检索式长期记忆
+
+将滑出 `max_history_epoch` 窗口的对话按 (userid, profile) 使用嵌入模型向量化并建立索引。
+索引只在后台根据数据库增量更新，调用模型时仅检索已有的索引，将与当前消息最相关的若干轮早期对话在 Tokens 预算内注入到对话历史开头。
+索引只保存消息 ID，命中的对话从数据库读取；内存中的索引数量受 `memory_max_indexes` 限制，被淘汰的索引下次使用时重建
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from nonebot import logger
+from nonebot_plugin_orm import get_session
+
+from ..config import get_embedding_model_config, plugin_config
+from ..database import MessageORM, UserORM
+from ..llm import EmbeddingModel, FlatIndex, load_embedding_model
+from ..llm.utils.tokens import estimate_message_tokens, estimate_tokens
+from ..models import Message
+
+MEMORY_HISTORY_PROMPT = "我们以前聊过哪些和现在的话题有关的内容？"
+"""作为记忆的合成消息中的用户提示"""
+
+_SYNC_BATCH_SIZE = 256
+"""每次从数据库读取并嵌入的最大对话轮数"""
+_MAX_TURN_CHARS = 1000
+"""嵌入单轮对话时使用的最大字符数"""
+
+_MemoryKey = Tuple[str, str]
+"""(userid, profile)"""
+
+
+class _MemoryIndex:
+    """
+    单个存档的记忆索引
+    """
+
+    def __init__(self) -> None:
+        self.index: Optional[FlatIndex] = None
+        """向量索引（向量 ID 为消息 ID），首次写入时按向量维度创建"""
+        self.last_id = 0
+        """已索引的最大消息 ID"""
+        self.lock = asyncio.Lock()
+
+
+class MemoryRetriever:
+    def __init__(self) -> None:
+        self._indexes: OrderedDict[_MemoryKey, _MemoryIndex] = OrderedDict()
+        """记忆索引，按最近使用排序"""
+        self._tasks: Dict[_MemoryKey, asyncio.Task] = {}
+        """正在运行的索引更新任务"""
+        self._model: Optional[EmbeddingModel] = None
+
+    @property
+    def enabled(self) -> bool:
+        """
+        是否启用检索式记忆（未限制历史轮数时没有对话会滑出窗口）
+        """
+        return plugin_config.enable_memory_retrieval and plugin_config.max_history_epoch > 0
+
+    def _get_model(self) -> EmbeddingModel:
+        if self._model is None:
+            config = get_embedding_model_config(plugin_config.memory_embedding_config)
+            self._model = load_embedding_model(config)
+        return self._model
+
+    @staticmethod
+    def _format_turn(turn: Message) -> str:
+        return f"用户: {turn.message}\n你: {turn.respond}"
+
+    def _get_index(self, key: _MemoryKey) -> _MemoryIndex:
+        """
+        获取（或创建）记忆索引，并淘汰超出数量限制的最久未使用的索引
+        """
+        if (memory := self._indexes.get(key)) is not None:
+            self._indexes.move_to_end(key)
+            return memory
+
+        memory = self._indexes[key] = _MemoryIndex()
+
+        max_indexes = plugin_config.memory_max_indexes
+        while max_indexes > 0 and len(self._indexes) > max_indexes:
+            evicted, _ = self._indexes.popitem(last=False)
+            if (task := self._tasks.pop(evicted, None)) is not None:
+                task.cancel()
+            logger.debug(f"已淘汰用户 {evicted[0]} ({evicted[1]}) 的记忆索引")
+
+        return memory
+
+    async def _sync(self, userid: str, profile: str):
+        """
+        将数据库中新滑出窗口的对话增量加入索引
+        """
+        from ..muice import Muice
+
+        memory = self._get_index((userid, profile))
+
+        async with memory.lock:
+            while True:
+                async with get_session() as session:
+                    turns = await MessageORM.get_evicted_history(
+                        session,
+                        userid,
+                        profile,
+                        after_id=memory.last_id,
+                        window=Muice.get_instance().max_history_epoch,
+                        limit=_SYNC_BATCH_SIZE,
+                    )
+                if not turns:
+                    break
+
+                texts = [self._format_turn(turn)[:_MAX_TURN_CHARS] for turn in turns]
+                result = await self._get_model().embed(texts)
+
+                if memory.index is None:
+                    memory.index = FlatIndex(len(result.embeddings[0]))
+                memory.index.add([str(turn.id) for turn in turns], result.embeddings)
+                memory.last_id = turns[-1].id or memory.last_id
+
+                logger.debug(f"已索引用户 {userid} ({profile}) 的 {len(turns)} 轮早期对话")
+
+    def schedule(self, userid: str, profile: str):
+        """
+        在后台更新记忆索引（同一存档同时只运行一个任务）
+        """
+        if not self.enabled:
+            return
+
+        key = (userid, profile)
+        if (task := self._tasks.get(key)) is not None and not task.done():
+            return
+
+        self._tasks[key] = asyncio.create_task(self._refresh(userid, profile))
+
+    async def _refresh(self, userid: str, profile: str):
+        key = (userid, profile)
+        try:
+            await self._sync(userid, profile)
+        except Exception as e:
+            logger.warning(f"用户 {userid} 的记忆索引更新失败: {e}")
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+
+    async def retrieve(self, userid: str, profile: str, query: str) -> List[Tuple[Message, float]]:
+        """
+        在已有的索引中检索与查询最相关的早期对话，并在后台更新索引（不等待索引更新完成）
+
+        :return: (对话, 相似度) 列表，按相似度降序排列
+        """
+        memory = self._get_index((userid, profile))
+        self.schedule(userid, profile)
+
+        if memory.index is None or not len(memory.index):
+            return []
+
+        result = await self._get_model().embed([query[:_MAX_TURN_CHARS]])
+        hits = memory.index.search(result.embeddings[0], plugin_config.memory_top_k)[0]
+        scores = {int(hit.id): hit.score for hit in hits if hit.score >= plugin_config.memory_min_score}
+        if not scores:
+            return []
+
+        async with get_session() as session:
+            turns = await MessageORM.get_messages_by_ids(session, list(scores))  # type:ignore
+
+        return sorted(((turn, scores[turn.id]) for turn in turns if turn.id), key=lambda item: item[1], reverse=True)
+
+    async def recall(self, userid: str, query: str) -> List[Tuple[Message, float]]:
+        """
+        在用户当前存档中检索与查询相关的早期对话（失败时返回空列表）
+
+        :param query: 当前用户消息
+        """
+        try:
+            async with get_session() as session:
+                profile = await UserORM.get_user_profile(session, userid)
+            return await self.retrieve(userid, profile, query)
+        except Exception as e:
+            logger.warning(f"检索用户 {userid} 的长期记忆失败: {e}")
+            return []
+
+    def build_message(self, turns: List[Tuple[Message, float]], exclude_ids: Optional[set] = None) -> Optional[Message]:
+        """
+        在 `memory_token_budget` 内将检索到的对话构建为合成对话，用于拼接到对话历史开头
+
+        :param turns: `recall` 的检索结果
+        :param exclude_ids: 已在对话历史中的消息 ID
+        """
+        budget = plugin_config.memory_token_budget
+        lines = []
+
+        for turn, _ in turns:
+            if exclude_ids and turn.id in exclude_ids:
+                continue
+
+            line = f"[{turn.time}] {self._format_turn(turn)}"
+            if budget > 0:
+                budget -= estimate_tokens(line)
+                if budget < 0:
+                    break
+            lines.append(line)
+
+        if not lines:
+            return None
+
+        userid, profile = turns[0][0].userid, turns[0][0].profile
+        message = Message(userid=userid, message=MEMORY_HISTORY_PROMPT, respond="\n\n".join(lines), profile=profile)
+        logger.debug(f"已检索到 {len(lines)} 轮相关早期对话 ({estimate_message_tokens(message)} tokens)")
+        return message
+
+    def clear(self, userid: str, profile: Optional[str] = None):
+        """
+        删除记忆索引（适用于 reset 命令，之后将从数据库重建）
+
+        :param profile: (可选)存档名，为空时删除该用户全部存档的索引
+        """
+        for key in [key for key in self._tasks if key[0] == userid and profile in (None, key[1])]:
+            self._tasks.pop(key).cancel()
+        for key in [key for key in self._indexes if key[0] == userid and profile in (None, key[1])]:
+            del self._indexes[key]
+
+
+memory_retriever = MemoryRetriever()
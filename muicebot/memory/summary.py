@@ -0,0 +1,145 @@
+"""
+滚动对话摘要
+
+将滑出 `max_history_epoch` 窗口的对话按 (userid, profile) 压缩为一段摘要，存储在 `Summary` 表中。
+摘要由后台任务使用当前加载的模型增量更新，并在 `Muice._prepare_history` 中代替早期的原始对话
+"""
+
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from nonebot import logger
+from nonebot_plugin_orm import async_scoped_session, get_session
+
+from ..config import plugin_config
+from ..database import MessageORM, SummaryORM
+from ..llm import ModelCompletions, ModelRequest
+from ..models import Message
+
+SUMMARY_SYSTEM_PROMPT = (
+    "你是一个对话记录整理助手。请根据已有的摘要和新增的对话记录，生成一份更新后的对话摘要。"
+    "摘要应以第三人称简洁地记录用户的个人信息、偏好、重要事件以及尚未结束的话题，不要编造内容，"
+    "直接输出摘要正文，不超过 300 字。"
+)
+
+SUMMARY_PROMPT_TEMPLATE = "已有摘要：\n{summary}\n\n新增对话记录：\n{turns}"
+
+SUMMARY_HISTORY_PROMPT = "请简要回顾一下我们之前聊过的内容"
+"""作为摘要的合成消息中的用户提示"""
+
+
+class SummaryManager:
+    def __init__(self) -> None:
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        """正在运行的摘要任务: (userid, profile) -> Task"""
+        self._summaries: Dict[Tuple[str, str], Optional[str]] = {}
+        """摘要内容缓存: (userid, profile) -> content"""
+
+    @property
+    def enabled(self) -> bool:
+        """
+        是否启用对话摘要（未限制历史轮数时没有对话会滑出窗口）
+        """
+        return plugin_config.enable_history_summary and plugin_config.max_history_epoch > 0
+
+    def schedule(self, userid: str, profile: str):
+        """
+        在后台检查并更新对话摘要（同一存档同时只运行一个任务）
+        """
+        if not self.enabled:
+            return
+
+        key = (userid, profile)
+        if (task := self._tasks.get(key)) is not None and not task.done():
+            return
+
+        self._tasks[key] = asyncio.create_task(self._refresh(userid, profile))
+
+    async def get_summary(self, session: async_scoped_session, userid: str, profile: str) -> Optional[str]:
+        """
+        获取对话摘要内容
+        """
+        key = (userid, profile)
+        if key not in self._summaries:
+            summary = await SummaryORM.get_summary(session, userid, profile)
+            self._summaries[key] = summary.content if summary else None
+        return self._summaries[key]
+
+    async def get_summary_message(self, session: async_scoped_session, userid: str, profile: str) -> Optional[Message]:
+        """
+        获取以合成对话形式表示的摘要，用于拼接到对话历史开头
+        """
+        if not self.enabled:
+            return None
+
+        content = await self.get_summary(session, userid, profile)
+        if not content:
+            return None
+
+        return Message(userid=userid, message=SUMMARY_HISTORY_PROMPT, respond=content, profile=profile)
+
+    async def clear(self, session: async_scoped_session, userid: str, profile: Optional[str] = None):
+        """
+        删除对话摘要 (适用于 reset 命令)
+
+        :param profile: (可选)存档名，为空时删除该用户的全部摘要
+        """
+        for key in [key for key in self._tasks if key[0] == userid and profile in (None, key[1])]:
+            self._tasks.pop(key).cancel()
+        for key in [key for key in self._summaries if key[0] == userid and profile in (None, key[1])]:
+            del self._summaries[key]
+
+        await SummaryORM.delete_summary(session, userid, profile)
+
+    @staticmethod
+    def _format_turns(turns: List[Message]) -> str:
+        return "\n".join(f"用户: {turn.message}\n你: {turn.respond}" for turn in turns)
+
+    async def _refresh(self, userid: str, profile: str):
+        from ..muice import Muice
+
+        muice = Muice.get_instance()
+        if not (muice.model and muice.model.is_running):
+            return
+
+        trigger_turns = max(plugin_config.summary_trigger_turns, 1)
+
+        try:
+            async with get_session() as session:
+                summary = await SummaryORM.get_summary(session, userid, profile)
+                evicted = await MessageORM.get_evicted_history(
+                    session,
+                    userid,
+                    profile,
+                    after_id=summary.last_msg_id if summary else 0,
+                    window=muice.max_history_epoch,
+                    limit=trigger_turns,
+                )
+                if len(evicted) < trigger_turns:
+                    return
+
+                prompt = SUMMARY_PROMPT_TEMPLATE.format(
+                    summary=summary.content if summary else "（无）", turns=self._format_turns(evicted)
+                )
+                response = await muice.model.ask(ModelRequest(prompt, system=SUMMARY_SYSTEM_PROMPT), stream=False)
+                if not isinstance(response, ModelCompletions) or not response.succeed or not response.text.strip():
+                    logger.warning(f"用户 {userid} 的对话摘要更新失败: {getattr(response, 'text', '')}")
+                    return
+
+                content = response.text.strip()
+                await SummaryORM.save_summary(session, userid, profile, content, evicted[-1].id or 0)
+                await session.commit()
+
+        except Exception as e:
+            logger.exception(f"用户 {userid} 的对话摘要更新失败: {e}")
+            return
+
+        self._summaries[(userid, profile)] = content
+        logger.debug(f"已更新用户 {userid} ({profile}) 的对话摘要，新增 {len(evicted)} 轮对话")
+
+        # 仍有未摘要的对话时继续处理
+        self._tasks.pop((userid, profile), None)
+        self.schedule(userid, profile)
+
+
+summary_manager = SummaryManager()
@@ -86,6 +86,16 @@ class Message:
     """使用的总 tokens, 若模型加载器不支持则设为-1"""
     profile: str = "_default"
     """消息所属存档"""
+    timestamp: int = 0
+    """整数形式的 Unix 时间戳（秒），为 0 时从 time 计算（time 无法解析时保持为 0）"""
+
+    def __post_init__(self):
+        if not self.timestamp:
+            try:
+                self.timestamp = int(self.format_time.timestamp())
+            except (TypeError, ValueError):
+                # 与迁移脚本一致：旧数据中格式不正确的时间字符串不参与换算
+                pass
 
     @property
     def format_time(self) -> datetime:
@@ -103,4 +113,4 @@ class Message:
         return hash(self.id)
 
     def __lt__(self, other: "Message") -> bool:
-        return self.format_time < other.format_time
+        return (self.timestamp, self.id or 0) < (other.timestamp, other.id or 0)
@@ -1,9 +1,11 @@
+import asyncio
+import heapq
 import os
 import time
-from typing import AsyncGenerator, Optional, Union
+from typing import Any, AsyncGenerator, Awaitable, Optional, Union
 
 from nonebot import logger
-from nonebot_plugin_orm import async_scoped_session
+from nonebot_plugin_orm import async_scoped_session, get_session
 
 from .config import (
     ModelConfig,
@@ -11,7 +13,7 @@ from .config import (
     get_model_config_manager,
     plugin_config,
 )
-from .database import MessageORM
+from .database import MessageORM, UserORM
 from .llm import (
     MODEL_DEPENDENCY_MAP,
     ModelCompletions,
@@ -20,6 +22,14 @@ from .llm import (
     get_missing_dependencies,
     load_model,
 )
+from .llm.utils.tokens import (
+    estimate_message_tokens,
+    estimate_request_tokens,
+    estimate_tokens,
+    estimate_tool_tokens,
+    truncate_to_tokens,
+)
+from .memory import memory_retriever, summary_manager
 from .models import Message, Resource
 from .plugin.func_call import get_function_list
 from .plugin.hook import HookType, hook_manager
@@ -28,6 +38,14 @@ from .templates import generate_prompt_from_template
 from .utils.utils import get_username
 
 
+def _discard_stage_result(task: asyncio.Task):
+    """
+    取出已超时阶段的结果，避免异常未被获取的警告
+    """
+    if not task.cancelled() and (e := task.exception()) is not None:
+        logger.debug(f"已超时的准备阶段执行失败: {e}")
+
+
 class Muice:
     """
     Muice交互类
@@ -195,31 +213,178 @@ class Muice:
         user_history = (
             await self.database.get_user_history(session, userid, self.max_history_epoch) if enable_history else []
         )
+        group_history = (
+            await self.database.get_group_history(session, groupid, self.max_history_epoch) if groupid != "-1" else []
+        )
+
+        # 两个历史流均按消息 ID 升序排列（数据库 ORDER BY id / 缓存按写入顺序追加），尚未落库的消息没有 ID，总是位于末尾。
+        # 从最新的消息开始按 ID 归并（不能按时间戳归并：并发的对话可能不按接收时间的顺序落库），同一条消息优先取群聊历史中的副本
+        merged = heapq.merge(
+            ((item, True) for item in reversed(group_history)),
+            ((item, False) for item in reversed(user_history)),
+            key=lambda pair: (pair[0].id is None, pair[0].id or 0),
+            reverse=True,
+        )
 
-        # 验证多模态资源路径是否可用
-        for item in user_history:
+        final_history: list[Message] = []
+        seen: set = set()
+        # 全局预算与模型预算同时设置时取较小的一方（见两者的配置说明）
+        history_budgets = [plugin_config.max_history_tokens, self.model_config.history_token_budget]
+        remaining_tokens = min((budget for budget in history_budgets if budget > 0), default=0)
+        token_limited = remaining_tokens > 0
+
+        # 更早的对话以摘要形式给出
+        summary = None
+        if enable_history and summary_manager.enabled:
+            profile = await UserORM.get_user_profile(session, userid)
+            summary = await summary_manager.get_summary_message(session, userid, profile)
+            if summary and token_limited:
+                remaining_tokens -= estimate_message_tokens(summary)
+
+        for item, from_group in merged:
+            if self.max_history_epoch and len(final_history) >= self.max_history_epoch:
+                break
+
+            # 尚未落库的消息没有 ID
+            key = item.id if item.id is not None else (item.timestamp, item.userid, item.message, item.respond)
+            if key in seen:
+                continue
+            seen.add(key)
+
+            # 群聊历史构建成 <Username> Message 的格式，避免上下文混乱
+            if from_group:
+                user_name = await get_username(item.userid)
+                item.message = f"<{user_name}> {item.message}"
+
+            if token_limited:
+                remaining_tokens -= estimate_message_tokens(item)
+                if remaining_tokens < 0:
+                    break
+
+            # 验证多模态资源路径是否可用
             item.resources = [
                 resource for resource in item.resources if resource.path and os.path.isfile(resource.path)
             ]
+            final_history.append(item)
 
-        if groupid == "-1":
-            return user_history[-self.max_history_epoch :]
+        if summary:
+            final_history.append(summary)
 
-        group_history = await self.database.get_group_history(session, groupid, self.max_history_epoch)
+        return final_history[::-1]
 
-        for item in group_history:
-            item.resources = [
-                resource for resource in item.resources if resource.path and os.path.isfile(resource.path)
-            ]
+    def _fit_context_window(self, request: ModelRequest):
+        """
+        裁剪模型请求使其不超过上下文窗口，并记录估算的提示词 Tokens
+
+        裁剪顺序: 最早的对话历史 -> 末尾的工具 -> 系统提示。用户提示始终保留
+        """
+        context_window = self.model_config.context_window
+        budget = context_window - self.model_config.max_tokens
+        total = estimate_request_tokens(request)
+
+        if context_window and total > budget:
+            history_trimmed, tools_trimmed = 0, 0
+
+            while request.history and total > budget:
+                total -= estimate_message_tokens(request.history.pop(0))
+                history_trimmed += 1
+
+            while request.tools and total > budget:
+                total -= estimate_tool_tokens(request.tools.pop())
+                tools_trimmed += 1
+
+            if request.system and total > budget:
+                system_tokens = estimate_tokens(request.system)
+                request.system = truncate_to_tokens(request.system, system_tokens - (total - budget)) or None
+                total = estimate_request_tokens(request)
+
+            logger.warning(
+                f"提示词超出上下文窗口 ({context_window} - {self.model_config.max_tokens} tokens)，"
+                f"已裁剪 {history_trimmed} 条历史、{tools_trimmed} 个工具"
+            )
 
-        # 群聊历史构建成 <Username> Message 的格式，避免上下文混乱
-        for item in group_history:
-            user_name = await get_username(item.userid)
-            item.message = f"<{user_name}> {item.message}"
+        request.prompt_tokens = total
 
-        final_history = list(set(user_history + group_history))
+    async def _prepare_request(
+        self, session: async_scoped_session, message: Message, enable_history: bool, enable_plugins: bool
+    ) -> ModelRequest:
+        """
+        并发准备模型请求（提示词、对话历史、工具列表）
+
+        所有阶段共享 `prepare_timeout` 截止时间，超时的阶段使用默认值。
+        访问数据库的阶段使用独立的会话，超时时不会被取消（取消进行中的查询可能使连接不可用），而是在后台完成后丢弃结果
+
+        :param message: 消息
+        :param enable_history: 是否启用历史记录
+        :param enable_plugins: 是否启用工具插件
+        :return: 模型请求
+        """
+        is_private = message.groupid == "-1"
+        timings: dict[str, float] = {}
+
+        async def timed(stage: str, coro: Awaitable[Any]) -> Any:
+            start_time = time.perf_counter()
+            try:
+                return await coro
+            finally:
+                timings[stage] = time.perf_counter() - start_time
+
+        async def get_tools() -> list[dict]:
+            function_list, mcp_list = await asyncio.gather(get_function_list(), get_mcp_list())
+            return function_list + mcp_list
+
+        async def get_history() -> list[Message]:
+            # 不使用调用方的会话：本阶段超时后调用方会立即继续使用该会话写入对话记录
+            async with get_session() as history_session:
+                return await self._prepare_history(history_session, message.userid, message.groupid, enable_history)
+
+        stages: dict[str, asyncio.Task] = {
+            "prompt": asyncio.create_task(
+                timed("prompt", self._prepare_prompt(message.message, message.userid, is_private))
+            )
+        }
+        if enable_history:
+            stages["history"] = asyncio.create_task(timed("history", get_history()))
+        if enable_history and memory_retriever.enabled:
+            stages["memory"] = asyncio.create_task(
+                timed("memory", memory_retriever.recall(message.userid, message.message))
+            )
+        if self.model_config.function_call and enable_plugins:
+            stages["tools"] = asyncio.create_task(timed("tools", get_tools()))
+
+        timeout = plugin_config.prepare_timeout or None
+        done, pending = await asyncio.wait(stages.values(), timeout=timeout)
+
+        if pending:
+            for stage, task in stages.items():
+                if task not in pending:
+                    continue
+                if stage in ("history", "memory"):
+                    task.add_done_callback(_discard_stage_result)
+                else:
+                    task.cancel()
+            timeout_stages = [stage for stage, task in stages.items() if task in pending]
+            logger.warning(f"模型请求准备阶段超时 ({timeout}s): {timeout_stages}，已使用默认值")
+
+        def get_result(stage: str, default: Any) -> Any:
+            task = stages.get(stage)
+            return task.result() if task in done else default
+
+        prompt = get_result("prompt", message.message)
+        history = get_result("history", [])
+        tools = get_result("tools", [])
+
+        # 检索到的早期对话排在最前，超出上下文窗口时最先被裁剪
+        memories = get_result("memory", [])
+        if memories and (memory := memory_retriever.build_message(memories, {item.id for item in history})):
+            history.insert(0, memory)
+
+        system = (self.system_prompt or None) if stages["prompt"] in done else None
+        resources = message.resources if self.model_config.multimodal else []
 
-        return final_history[-self.max_history_epoch :]
+        logger.debug(f"模型请求准备耗时: {timings}")
+
+        return ModelRequest(prompt, history, resources, tools, system, timings=timings)
 
     async def ask(
         self,
@@ -240,27 +405,14 @@ class Muice:
             logger.error("模型未加载")
             return ModelCompletions("模型未加载", succeed=False)
 
-        is_private = message.groupid == "-1"
         logger.info("正在调用模型...")
 
         await hook_manager.run(HookType.BEFORE_PRETREATMENT, message)
 
-        prompt = await self._prepare_prompt(message.message, message.userid, is_private)
-        history = (
-            await self._prepare_history(session, message.userid, message.groupid, enable_history)
-            if enable_history
-            else []
-        )
-        tools = (
-            (await get_function_list() + await get_mcp_list())
-            if self.model_config.function_call and enable_plugins
-            else []
-        )
-        system = self.system_prompt if self.system_prompt else None
-        resources = message.resources if self.model_config.multimodal else []
-
-        model_request = ModelRequest(prompt, history, resources, tools, system)
+        model_request = await self._prepare_request(session, message, enable_history, enable_plugins)
+        history = model_request.history
         await hook_manager.run(HookType.BEFORE_MODEL_COMPLETION, model_request)
+        self._fit_context_window(model_request)
 
         start_time = time.perf_counter()
         logger.debug(f"模型调用参数：Prompt: {message}, History: {history}")
@@ -285,7 +437,9 @@ class Muice:
         await hook_manager.run(HookType.ON_FINISHING_CHAT, message)
 
         if response.succeed:
-            await self.database.add_item(session, message)
+            await self.database.queue_item(session, message)
+            summary_manager.schedule(message.userid, message.profile)
+            memory_retriever.schedule(message.userid, message.profile)
 
         return response
 
@@ -309,27 +463,14 @@ class Muice:
             yield ModelStreamCompletions("模型未加载")
             return
 
-        is_private = message.groupid == "-1"
         logger.info("正在调用模型...")
 
         await hook_manager.run(HookType.BEFORE_PRETREATMENT, message)
 
-        prompt = await self._prepare_prompt(message.message, message.userid, is_private)
-        history = (
-            await self._prepare_history(session, message.userid, message.groupid, enable_history)
-            if enable_history
-            else []
-        )
-        tools = (
-            (await get_function_list() + await get_mcp_list())
-            if self.model_config.function_call and enable_plugins
-            else []
-        )
-        system = self.system_prompt if self.system_prompt else None
-        resources = message.resources if self.model_config.multimodal else []
-
-        model_request = ModelRequest(prompt, history, resources, tools, system)
+        model_request = await self._prepare_request(session, message, enable_history, enable_plugins)
+        history = model_request.history
         await hook_manager.run(HookType.BEFORE_MODEL_COMPLETION, model_request)
+        self._fit_context_window(model_request)
 
         start_time = time.perf_counter()
         logger.debug(f"模型调用参数：Prompt: {message}, History: {history}")
@@ -382,7 +523,9 @@ class Muice:
         await hook_manager.run(HookType.ON_FINISHING_CHAT, message)
 
         if item.succeed:
-            await self.database.add_item(session, message)
+            await self.database.queue_item(session, message)
+            summary_manager.schedule(message.userid, message.profile)
+            memory_retriever.schedule(message.userid, message.profile)
 
     async def refresh(
         self, userid: str, session: async_scoped_session
@@ -414,6 +557,9 @@ class Muice:
         清空历史对话（将用户对话历史记录标记为不可用）
         """
         await self.database.mark_history_as_unavailable(session, userid)
+        profile = await UserORM.get_user_profile(session, userid)
+        await summary_manager.clear(session, userid, profile)
+        memory_retriever.clear(userid, profile)
         return "已成功移除对话历史~"
 
     async def undo(self, userid: str, session: async_scoped_session) -> str:
@@ -1,9 +1,10 @@
+import asyncio
 import os
 import re
 import time
 from datetime import timedelta
 from pathlib import Path
-from typing import AsyncGenerator, Literal
+from typing import AsyncGenerator, Literal, Optional
 from urllib.parse import urlparse
 
 import nonebot_plugin_localstore as store
@@ -36,12 +37,19 @@ from nonebot_plugin_orm import async_scoped_session
 from nonebot_plugin_session import SessionIdType, extract_session
 
 from .config import load_embedding_model_config, plugin_config
+from .database.writer import persistence_queue
 from .llm import ModelCompletions, ModelStreamCompletions
+from .llm._embedding_store import compact_embedding_stores
+from .llm._singleflight import get_flight_stats
 from .models import Message, Resource
 from .muice import Muice
 from .plugin import get_plugins, load_plugins, set_ctx
+from .plugin.func_call import tool_cache
+from .plugin.func_call.utils import shutdown_executors
 from .plugin.mcp import initialize_servers
 from .scheduler import setup_scheduler
+from .utils.http import close_http_clients
+from .utils.media import collect_media_garbage
 from .utils.SessionManager import SessionManager
 from .utils.utils import download_file, get_file_via_adapter, get_version
 
@@ -104,6 +112,8 @@ async def load_bot():
     #     muicebot_plugins_path = Path(__file__).resolve().parent.parent
     #     load_plugins(builtin_plugins_path, base_path=muicebot_plugins_path)
 
+    await persistence_queue.start()
+
     if MCP_CONFIG_PATH.exists():
         logger.info("加载 MCP Server 配置")
         await initialize_servers()
@@ -113,6 +123,15 @@ async def load_bot():
     logger.success("MuiceBot 已准备就绪✨")
 
 
+@driver.on_shutdown
+async def flush_database():
+    if persistence_queue.pending:
+        logger.info(f"正在写入剩余的 {persistence_queue.pending} 条数据库记录...")
+    await persistence_queue.stop()
+    shutdown_executors()
+    await close_http_clients()
+
+
 @driver.on_bot_connect
 async def bot_connected():
     logger.success("Bot 已连接，消息处理进程开始运行✨")
@@ -206,6 +225,20 @@ command_reload = on_alconna(
     permission=SUPERUSER,
 )
 
+command_gc = on_alconna(
+    Alconna(COMMAND_PREFIXES, "gc", meta=CommandMeta("清理未被引用的多模态文件")),
+    priority=10,
+    block=True,
+    permission=SUPERUSER,
+)
+
+command_compact = on_alconna(
+    Alconna(COMMAND_PREFIXES, "compact", meta=CommandMeta("整理嵌入向量缓存")),
+    priority=10,
+    block=True,
+    permission=SUPERUSER,
+)
+
 
 nickname_event = on_alconna(
     Alconna(re.compile(combined_regex), Args["text?", AllParam], separators=""),
@@ -253,6 +286,8 @@ async def handle_command_help():
         "load <config_name> 加载模型\n"
         "profile <profile_name> 切换消息存档\n"
         "reload 重新加载模型配置\n"
+        "gc 清理未被引用的多模态文件\n"
+        "compact 整理嵌入向量缓存\n"
         "（支持的命令前缀：“.”、“/”）"
     )
 
@@ -300,12 +335,23 @@ async def handle_command_status(session: async_scoped_session):
 
     scheduler_status = "运行中" if scheduler and scheduler.running else "未启动"
 
+    cache_stats = tool_cache.get_stats()
+    cache_hits = sum(stats.hits for stats in cache_stats.values())
+    cache_total = sum(stats.total for stats in cache_stats.values())
+    cache_status = f"{cache_hits / cache_total:.0%} ({cache_hits}/{cache_total})" if cache_total else "暂无数据"
+
+    flight_status = ", ".join(
+        f"{name} {stats.shared}/{stats.total}" for name, stats in get_flight_stats().items() if stats.total
+    )
+
     await command_status.finish(
         f"框架已运行: {str(uptime)}\n"
         f"bot已稳定连接: {str(bot_uptime)}\n"
         f"\n"
         f"模型加载器状态: {model_status}\n"
         f"今日模型用量: {today_usage} tokens (总 {total_usage} tokens)\n "
+        f"工具结果缓存命中率: {cache_status}\n"
+        f"合并的重复请求: {flight_status or '暂无数据'}\n"
         f"\n"
         f"定时任务调度器状态: {scheduler_status}\n"
     )
@@ -380,6 +426,22 @@ async def handle_command_reload():
     await UniMessage(result).finish()
 
 
+@command_gc.handle()
+async def handle_command_gc():
+    report = await collect_media_garbage()
+    await UniMessage(f"多模态文件清理完成: {report}").finish()
+
+
+@command_compact.handle()
+async def handle_command_compact():
+    cache_dir = store.get_plugin_data_dir() / "embedding"
+    loop = asyncio.get_running_loop()
+    report = await loop.run_in_executor(
+        None, compact_embedding_stores, cache_dir, plugin_config.embedding_cache_max_rows
+    )
+    await UniMessage(f"嵌入缓存整理完成: {report}").finish()
+
+
 @command_start.handle()
 async def handle_command_start():
     pass
@@ -387,7 +449,7 @@ async def handle_command_start():
 
 def _get_media_filename(media: uniseg.segment.Media, type: Literal["audio", "image", "video", "file"]) -> str:
     """
-    给多模态文件分配一个独一无二的文件名
+    获取多模态文件的文件名（用于确定后缀，实际保存时以文件内容的哈希命名）
     """
     _default_suffix = {"audio": "mp3", "image": "png", "video": "mp4", "file": ""}
 
@@ -400,58 +462,54 @@ def _get_media_filename(media: uniseg.segment.Media, type: Literal["audio", "ima
         _, ext = os.path.splitext(path)
         file_suffix = ext.lstrip(".") if ext else _default_suffix[type]
 
-    file_name = f"{time.time_ns()}.{file_suffix}"
+    file_name = f"{type}.{file_suffix}"
 
     return file_name
 
 
-async def _extract_multi_resource(
-    message: UniMessage, type: Literal["audio", "image", "video", "file"], event: Event
-) -> list[Resource]:
+async def _extract_resource(
+    resource: uniseg.segment.Media, type: Literal["audio", "image", "video", "file"], event: Event
+) -> Optional[Resource]:
     """
     提取单个多模态文件
     """
-    resources = []
-
-    for resource in message:
-        assert isinstance(resource, uniseg.segment.Media)  # 正常情况下应该都是 Media 的子类
-
-        try:
-            if resource.path is not None:
-                path = str(resource.path)
-            elif resource.url is not None:
-                path = await download_file(resource.url, file_name=_get_media_filename(resource, type))
-            elif resource.origin is not None:
-                logger.warning("无法通过通用方式获取文件URL，回退至适配器自有方式...")
-                path = await get_file_via_adapter(resource.origin, event)  # type:ignore
-            else:
-                continue
-
-            if path:
-                resources.append(Resource(type, path=path))
-        except Exception as e:
-            logger.error(f"处理文件失败: {e}")
+    try:
+        if resource.path is not None:
+            path = str(resource.path)
+        elif resource.url is not None:
+            path = await download_file(resource.url, file_name=_get_media_filename(resource, type))
+        elif resource.origin is not None:
+            logger.warning("无法通过通用方式获取文件URL，回退至适配器自有方式...")
+            path = await get_file_via_adapter(resource.origin, event)  # type:ignore
+        else:
+            return None
 
-    return resources
+        return Resource(type, path=path) if path else None
+    except Exception as e:
+        logger.error(f"处理文件失败: {e}")
+        return None
 
 
 async def _extract_multi_resources(message: UniMsg, event: Event) -> list[Resource]:
     """
-    提取多个多模态文件
+    并发提取消息中的全部多模态文件（下载总并发数受 `download_concurrency` 限制）
     """
-    resources = []
-
-    message_audio = message.get(uniseg.Audio) + message.get(uniseg.Voice)
-    message_images = message.get(uniseg.Image)
-    message_file = message.get(uniseg.File)
-    message_video = message.get(uniseg.Video)
-
-    resources.extend(await _extract_multi_resource(message_audio, "audio", event))
-    resources.extend(await _extract_multi_resource(message_file, "file", event))
-    resources.extend(await _extract_multi_resource(message_images, "image", event))
-    resources.extend(await _extract_multi_resource(message_video, "video", event))
-
-    return resources
+    segments: list[tuple[uniseg.segment.Media, Literal["audio", "image", "video", "file"]]] = []
+
+    for type, segment_types in (
+        ("audio", (uniseg.Audio, uniseg.Voice)),
+        ("file", (uniseg.File,)),
+        ("image", (uniseg.Image,)),
+        ("video", (uniseg.Video,)),
+    ):
+        for segment_type in segment_types:
+            for resource in message.get(segment_type):
+                assert isinstance(resource, uniseg.segment.Media)  # 正常情况下应该都是 Media 的子类
+                segments.append((resource, type))  # type:ignore
+
+    results = await asyncio.gather(*(_extract_resource(resource, type, event) for resource, type in segments))
+
+    return [resource for resource in results if resource is not None]
 
 
 async def _send_multi_messages(resource: Resource):
@@ -2,6 +2,7 @@
 Muicebot Function Call Plugin
 """
 
+from .cache import CachePolicy, tool_cache
 from .caller import get_function_calls, get_function_list, on_function_call
 
-__all__ = ["get_function_calls", "get_function_list", "on_function_call"]
+__all__ = ["get_function_calls", "get_function_list", "on_function_call", "CachePolicy", "tool_cache"]
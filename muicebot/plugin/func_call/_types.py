@@ -1,7 +1,16 @@
-from typing import Any, Callable, Coroutine, TypeVar, Union
+from typing import Any, Callable, Coroutine, NamedTuple, TypeVar, Union
 
 SYNC_FUNCTION_CALL_FUNC = Callable[..., str]
 ASYNC_FUNCTION_CALL_FUNC = Callable[..., Coroutine[str, Any, str]]
 FUNCTION_CALL_FUNC = Union[SYNC_FUNCTION_CALL_FUNC, ASYNC_FUNCTION_CALL_FUNC]
 
 F = TypeVar("F", bound=FUNCTION_CALL_FUNC)
+
+
+class ToolResult(NamedTuple):
+    """单次工具调用的结果"""
+
+    content: Any
+    """返回给模型的内容"""
+    failed: bool = False
+    """是否执行失败或超时（失败的结果不会写入缓存）"""
@@ -0,0 +1,147 @@
+"""
+工具调用结果缓存
+
+对于幂等的只读工具（例如获取时间、用户名或 MCP 只读查询），在 TTL 内以相同参数再次调用时直接返回缓存结果，
+缓存键可以按用户、群组或全局划分
+"""
+
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Literal, Optional
+
+from nonebot import logger
+from pydantic import BaseModel, Field
+
+_CacheKey = tuple[str, str]
+"""缓存键: (作用域 ID, 参数 JSON)"""
+
+
+class CachePolicy(BaseModel):
+    """
+    工具调用结果缓存策略
+    """
+
+    ttl: float = Field(default=60, gt=0)
+    """缓存有效时间（秒）"""
+    scope: Literal["user", "group", "global"] = "global"
+    """缓存键的作用域: 按用户 / 按群组（私聊时按用户） / 全局共享"""
+    max_entries: int = Field(default=128, gt=0)
+    """该工具最多缓存的结果数量，超出时淘汰最久未使用的结果"""
+
+
+@dataclass
+class CacheStats:
+    """
+    工具缓存命中统计
+    """
+
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.total if self.total else 0.0
+
+
+def _get_scope_id(scope: Literal["user", "group", "global"]) -> Optional[str]:
+    """
+    获取当前上下文中的作用域 ID，无法获取上下文时返回 None（此时不使用缓存）
+    """
+    if scope == "global":
+        return ""
+
+    from nonebot_plugin_session import SessionIdType, extract_session
+
+    from ..context import get_bot, get_event
+
+    try:
+        session = extract_session(get_bot(), get_event())
+    except LookupError:
+        return None
+
+    if scope == "user":
+        return session.get_id(SessionIdType.USER)
+    return session.get_id(SessionIdType.GROUP)
+
+
+class ToolResultCache:
+    def __init__(self) -> None:
+        self._entries: dict[str, OrderedDict[_CacheKey, tuple[float, Any]]] = {}
+        """工具名称 -> (缓存键 -> (过期时间, 结果))"""
+        self._stats: dict[str, CacheStats] = {}
+        """工具名称 -> 命中统计"""
+
+    def make_key(self, arguments: Optional[dict], policy: CachePolicy) -> Optional[_CacheKey]:
+        """
+        生成缓存键
+
+        :return: 缓存键。参数无法序列化或无法获取作用域时返回 None
+        """
+        scope_id = _get_scope_id(policy.scope)
+        if scope_id is None:
+            return None
+
+        try:
+            arguments_key = json.dumps(arguments or {}, sort_keys=True, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return None
+
+        return (scope_id, arguments_key)
+
+    def get(self, tool: str, key: _CacheKey) -> tuple[bool, Any]:
+        """
+        查询缓存并记录命中统计
+
+        :return: (是否命中, 缓存结果)
+        """
+        stats = self._stats.setdefault(tool, CacheStats())
+        entries = self._entries.get(tool)
+        entry = entries.get(key) if entries else None
+
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del entries[key]  # type:ignore
+            stats.misses += 1
+            return False, None
+
+        entries.move_to_end(key)  # type:ignore
+        stats.hits += 1
+        logger.debug(f"工具 {tool} 命中缓存 (命中率 {stats.hit_rate:.0%})")
+        return True, entry[1]
+
+    def set(self, tool: str, key: _CacheKey, result: Any, policy: CachePolicy) -> None:
+        """
+        写入缓存
+        """
+        entries = self._entries.setdefault(tool, OrderedDict())
+        entries[key] = (time.monotonic() + policy.ttl, result)
+        entries.move_to_end(key)
+
+        while len(entries) > policy.max_entries:
+            entries.popitem(last=False)
+
+    def clear(self, tool: Optional[str] = None) -> None:
+        """
+        清空缓存
+
+        :param tool: 工具名称，为 None 时清空所有工具的缓存
+        """
+        if tool is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(tool, None)
+
+    def get_stats(self) -> dict[str, CacheStats]:
+        """
+        获取各工具的缓存命中统计
+        """
+        return self._stats
+
+
+tool_cache = ToolResultCache()
@@ -8,8 +8,9 @@
 - 用于获取已注册函数调用的实用函数
 """
 
+import asyncio
 import inspect
-from typing import Any, Optional, Type, get_type_hints
+from typing import Any, Callable, Literal, NamedTuple, Optional, Type, get_type_hints
 
 from nonebot import logger
 from nonebot.adapters import Bot, Event
@@ -21,7 +22,8 @@ from typing_extensions import deprecated
 
 from ..context import get_bot, get_event, get_mather
 from ..utils import is_coroutine_callable
-from ._types import ASYNC_FUNCTION_CALL_FUNC, F
+from ._types import ASYNC_FUNCTION_CALL_FUNC, F, ToolResult
+from .cache import CachePolicy
 from .parameter import FunctionCallJsonSchema, Parameter
 from .utils import async_wrap
 
@@ -29,8 +31,78 @@ _caller_data: dict[str, "Caller"] = {}
 """函数注册表，存储所有注册的函数"""
 
 
+def _get_muice() -> Any:
+    from muicebot.muice import Muice
+
+    return Muice.get_instance()
+
+
+class InjectionPlan(NamedTuple):
+    """单个参数的注入方式"""
+
+    name: str
+    """参数名"""
+    kind: Literal["provider", "default", "required"]
+    """注入类型: 依赖提供者 / 默认值 / 必要参数"""
+    value: Any = None
+    """依赖提供者或默认值"""
+
+
+def _compile_injection_plan(function: ASYNC_FUNCTION_CALL_FUNC) -> list[InjectionPlan]:
+    """
+    解析函数签名，生成依赖注入计划
+    """
+    sig = inspect.signature(function)
+    hints = get_type_hints(function)
+
+    plans: list[InjectionPlan] = []
+
+    for name, param in sig.parameters.items():
+        param_type = hints.get(name, None)
+
+        if param_type and isinstance(param_type, type):
+            provider: Optional[Callable[[], Any]] = None
+
+            if issubclass(param_type, Bot):
+                provider = get_bot
+
+            elif issubclass(param_type, Event):
+                provider = get_event
+
+            elif issubclass(param_type, Matcher):
+                provider = get_mather
+
+            elif param_type.__name__ == "Muice":  # Check by type name
+                provider = _get_muice
+
+            # elif param_type and issubclass(param_type, T_State):
+            #     provider = get_state
+
+            if provider is not None:
+                plans.append(InjectionPlan(name, "provider", provider))
+
+        # 填充默认值
+        elif param.default != inspect.Parameter.empty:
+            plans.append(InjectionPlan(name, "default", param.default))
+
+        # 如果参数未提供，则检查是否有默认值
+        else:
+            plans.append(InjectionPlan(name, "required"))
+
+    return plans
+
+
 class Caller:
-    def __init__(self, description: str, params: Optional[Type[BaseModel]] = None, rule: Optional[Rule] = None):
+    def __init__(
+        self,
+        description: str,
+        params: Optional[Type[BaseModel]] = None,
+        rule: Optional[Rule] = None,
+        timeout: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        cpu_bound: bool = False,
+        cache: Optional[CachePolicy] = None,
+    ):
         self._name: str = ""
         """函数名称"""
         self._description: str = description
@@ -41,8 +113,23 @@ class Caller:
         """函数参数字典"""
         self._parameters_model: Optional[Type[BaseModel]] = params
         """函数参数 pydantic 模型"""
-        self.function: ASYNC_FUNCTION_CALL_FUNC
+        self._function: Optional[ASYNC_FUNCTION_CALL_FUNC] = None
         """函数对象"""
+        self._injection_plan: Optional[list[InjectionPlan]] = None
+        """依赖注入计划缓存"""
+        self._schema: Optional[dict[str, Any]] = None
+        """函数描述缓存"""
+
+        self.timeout: Optional[float] = timeout
+        """单次调用超时时间（秒）"""
+        self.concurrency: Optional[int] = concurrency
+        """最大并发调用数"""
+        self.cpu_bound: bool = cpu_bound
+        """是否为 CPU 密集型函数（同步函数将在进程池中执行）"""
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        """并发限制信号量"""
+        self.cache: Optional[CachePolicy] = cache
+        """结果缓存策略，为 None 时不缓存"""
         self.default: dict[str, Any] = {}
         """默认值"""
 
@@ -57,7 +144,7 @@ class Caller:
         if is_coroutine_callable(func):
             self.function = func  # type: ignore
         else:
-            self.function = async_wrap(func)  # type:ignore
+            self.function = async_wrap(func, cpu_bound=self.cpu_bound)  # type:ignore
 
         self._name = func.__name__
 
@@ -72,65 +159,86 @@ class Caller:
         logger.debug(f"Function Call 函数 {self.module_name}.{self._name} 已成功加载")
         return func
 
-    async def _inject_dependencies(self, kwargs: dict) -> dict:
+    @property
+    def function(self) -> ASYNC_FUNCTION_CALL_FUNC:
         """
-        自动解析参数并进行依赖注入
+        函数对象
         """
-        sig = inspect.signature(self.function)
-        hints = get_type_hints(self.function)
+        return self._function  # type:ignore
 
-        inject_args = kwargs.copy()
-
-        for name, param in sig.parameters.items():
-            param_type = hints.get(name, None)
-
-            if param_type and isinstance(param_type, type):
-                if issubclass(param_type, Bot):
-                    inject_args[name] = get_bot()
+    @function.setter
+    def function(self, function: ASYNC_FUNCTION_CALL_FUNC):
+        self._function = function
+        self._injection_plan = None
+        self._schema = None
 
-                elif issubclass(param_type, Event):
-                    inject_args[name] = get_event()
+    @property
+    def parameters_model(self) -> Optional[Type[BaseModel]]:
+        """
+        函数参数 pydantic 模型
+        """
+        return self._parameters_model
 
-                elif issubclass(param_type, Matcher):
-                    inject_args[name] = get_mather()
+    @parameters_model.setter
+    def parameters_model(self, params: Optional[Type[BaseModel]]):
+        self._parameters_model = params
+        self._schema = None
 
-                elif param_type.__name__ == "Muice":  # Check by type name
-                    from muicebot.muice import Muice
+    async def _inject_dependencies(self, kwargs: dict) -> dict:
+        """
+        按照注入计划进行依赖注入（注入计划在首次调用时生成，函数对象变更时失效）
+        """
+        if self._injection_plan is None:
+            self._injection_plan = _compile_injection_plan(self.function)
 
-                    inject_args[name] = Muice.get_instance()
+        inject_args = kwargs.copy()
 
-                # elif param_type and issubclass(param_type, T_State):
-                #     inject_args[name] = get_state()
+        for plan in self._injection_plan:
+            if plan.kind == "provider":
+                inject_args[plan.name] = plan.value()
 
-            # 填充默认值
-            elif param.default != inspect.Parameter.empty:
-                inject_args[name] = kwargs.get(name, param.default)
+            elif plan.kind == "default":
+                inject_args[plan.name] = kwargs.get(plan.name, plan.value)
 
-            # 如果参数未提供，则检查是否有默认值
-            elif name not in inject_args:
-                raise ValueError(f"缺少必要参数: {name}")
+            elif plan.name not in inject_args:
+                raise ValueError(f"缺少必要参数: {plan.name}")
 
         return inject_args
 
     @deprecated("由于此方法缺乏灵活性，请改用 `on_function_call` 中的 params 参数并传入 pydantic 模型")
     def params(self, **kwargs: Parameter) -> "Caller":
         self._parameters.update(kwargs)
+        self._schema = None
         return self
 
-    async def run(self, **kwargs) -> Any:
+    async def run(self, **kwargs) -> ToolResult:
         """
         执行 function call
+
+        :return: 调用结果。超时时 `failed` 为 True
         """
         if self.function is None:
             raise ValueError("未注册函数对象")
 
         inject_args = await self._inject_dependencies(kwargs)
 
-        return await self.function(**inject_args)
+        if self.concurrency and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        try:
+            if self._semaphore is None:
+                return ToolResult(await asyncio.wait_for(self.function(**inject_args), self.timeout))
+            async with self._semaphore:
+                return ToolResult(await asyncio.wait_for(self.function(**inject_args), self.timeout))
+
+        except asyncio.TimeoutError:
+            # 线程/进程池中的任务无法被强制终止，这里只是不再等待其结果
+            logger.warning(f"Function call {self._name} 执行超时 ({self.timeout}s)")
+            return ToolResult(f"(Function call timed out after {self.timeout}s)", failed=True)
 
     def data(self) -> dict[str, Any]:
         """
-        生成函数描述信息
+        生成函数描述信息（结果会被缓存，函数对象或参数模型变更时失效）
 
         Note:
             如果通过 `_parameters_model` 提供了 pydantic 模型，则该模型优先于动态添加的 `_parameters`。
@@ -139,6 +247,11 @@ class Caller:
 
         :return: 可用于 Function_call 的字典
         """
+        if self._schema is None:
+            self._schema = self._generate_schema()
+        return self._schema
+
+    def _generate_schema(self) -> dict[str, Any]:
         if self._parameters_model:
             return {
                 "type": "function",
@@ -172,16 +285,38 @@ class Caller:
         }
 
 
-def on_function_call(description: str, params: Optional[Type[BaseModel]] = None, rule: Optional[Rule] = None) -> Caller:
+def on_function_call(
+    description: str,
+    params: Optional[Type[BaseModel]] = None,
+    rule: Optional[Rule] = None,
+    timeout: Optional[float] = None,
+    concurrency: Optional[int] = None,
+    cpu_bound: bool = False,
+    cache: Optional[CachePolicy] = None,
+) -> Caller:
     """
     返回一个Caller类，可用于装饰一个函数，使其注册为一个可被AI调用的function call函数
 
+    同步函数将在线程池中执行，不会阻塞事件循环
+
     :param description: 函数描述，若为None则从函数的docstring中获取
     :param rule: 启用规则。不满足规则则不启用此 function call
+    :param timeout: (可选)单次调用超时时间（秒），超时后向模型返回超时信息
+    :param concurrency: (可选)最大并发调用数
+    :param cpu_bound: 是否为 CPU 密集型同步函数。为 True 时在进程池中执行，此时函数不能注入 Bot、Event 等依赖
+    :param cache: (可选)结果缓存策略。仅适用于幂等的只读函数，在 TTL 内以相同参数调用时直接返回缓存结果
 
     :return: Caller对象
     """
-    caller = Caller(description=description, params=params, rule=rule)
+    caller = Caller(
+        description=description,
+        params=params,
+        rule=rule,
+        timeout=timeout,
+        concurrency=concurrency,
+        cpu_bound=cpu_bound,
+        cache=cache,
+    )
     return caller
 
 
@@ -1,16 +1,70 @@
-from functools import wraps
-from typing import Any
+import asyncio
+import contextvars
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial, wraps
+from typing import Any, Optional
 
 from ._types import ASYNC_FUNCTION_CALL_FUNC, SYNC_FUNCTION_CALL_FUNC
 
+_thread_pool: Optional[ThreadPoolExecutor] = None
+"""运行同步工具函数的线程池"""
+_process_pool: Optional[ProcessPoolExecutor] = None
+"""运行 CPU 密集型工具函数的进程池"""
 
-def async_wrap(func: SYNC_FUNCTION_CALL_FUNC) -> ASYNC_FUNCTION_CALL_FUNC:
+
+def get_executor(cpu_bound: bool = False) -> Executor:
+    """
+    获取（并在首次调用时创建）工具函数执行器
+
+    :param cpu_bound: 是否为 CPU 密集型函数，为 True 时返回进程池
+    """
+    global _thread_pool, _process_pool
+    from ...config import plugin_config
+
+    if cpu_bound:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=plugin_config.function_call_process_workers or None)
+        return _process_pool
+
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=plugin_config.function_call_max_workers or None, thread_name_prefix="muicebot-function-call"
+        )
+    return _thread_pool
+
+
+def shutdown_executors():
+    """
+    关闭工具函数执行器
     """
-    装饰器，将同步函数包装为异步函数
+    global _thread_pool, _process_pool
+
+    for executor in (_thread_pool, _process_pool):
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    _thread_pool = _process_pool = None
+
+
+def async_wrap(func: SYNC_FUNCTION_CALL_FUNC, cpu_bound: bool = False) -> ASYNC_FUNCTION_CALL_FUNC:
+    """
+    装饰器，将同步函数包装为异步函数，并在工作池中执行以避免阻塞事件循环
+
+    线程池中会复制当前的上下文变量，因此 `get_bot()` 等函数仍然可用；
+    进程池无法传递上下文变量，且函数及其参数必须可被 pickle
+
+    :param cpu_bound: 是否为 CPU 密集型函数，为 True 时在进程池中执行
     """
 
     @wraps(func)
     async def wrapper(*args: Any, **kwargs: Any) -> Any:
-        return func(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        call = partial(func, *args, **kwargs)
+
+        if cpu_bound:
+            return await loop.run_in_executor(get_executor(cpu_bound=True), call)
+
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(get_executor(), context.run, call)
 
     return wrapper
@@ -1,4 +1,5 @@
 import inspect
+from bisect import insort
 from collections import defaultdict
 from typing import (
     Any,
@@ -6,6 +7,7 @@ from typing import (
     Callable,
     Dict,
     List,
+    NamedTuple,
     Optional,
     Union,
     get_args,
@@ -30,54 +32,78 @@ DEPENDENCY_PROVIDERS: dict[type, Callable[[], object]] = {
 }
 
 
-def _match_union(param_type: type, arg: object) -> bool:
-    if get_origin(param_type) is Union:
-        return any(isinstance(arg, t) for t in get_args(param_type))
-    return False
+class InjectionPlan(NamedTuple):
+    """单个参数的注入方式"""
+
+    name: str
+    """参数名"""
+    arg_types: tuple[type, ...]
+    """可接受的 hook_arg 类型（Union 类型展开为多个）"""
+    provider: Optional[Callable[[], object]]
+    """依赖提供者（Bot、Event、Matcher...），在没有匹配的 hook_arg 时使用"""
+
+
+def _compile_injection_plan(function: HOOK_FUNC) -> list[InjectionPlan]:
+    """
+    解析挂钩函数签名，生成依赖注入计划（仅在注册时调用一次）
+    """
+    sig = inspect.signature(function)
+    hints = get_type_hints(function)
+
+    plans: list[InjectionPlan] = []
+
+    for name in sig.parameters:
+        param_type = hints.get(name, None)
+        if not param_type:
+            continue
+
+        if get_origin(param_type) is Union:
+            arg_types = tuple(t for t in get_args(param_type) if isinstance(t, type))
+        elif isinstance(param_type, type):
+            arg_types = (param_type,)
+        else:
+            continue
+
+        provider = None
+        if isinstance(param_type, type):
+            provider = next(
+                (provider for dep_type, provider in DEPENDENCY_PROVIDERS.items() if issubclass(param_type, dep_type)),
+                None,
+            )
+
+        plans.append(InjectionPlan(name, arg_types, provider))
+
+    return plans
 
 
 class HookManager:
     def __init__(self):
         self._hooks: Dict[HookType, List["Hooked"]] = defaultdict(list)
 
-    async def _inject_dependencies(self, function: HOOK_FUNC, *hook_args: HOOK_ARGS) -> dict:
+    @staticmethod
+    def _inject_dependencies(hooked: "Hooked", *hook_args: HOOK_ARGS) -> dict:
         """
-        自动解析参数并进行依赖注入
+        按照注册时生成的注入计划填充参数
         """
-        sig = inspect.signature(function)
-        hints = get_type_hints(function)
-
         inject_args: dict[str, Any] = {}
 
-        for name, param in sig.parameters.items():
-            param_type = hints.get(name, None)
-            if not param_type:
-                continue
-
+        for plan in hooked.injection_plan:
             for hook_arg in hook_args:
-                # 1. Union 类型注入 hook_arg
-                if _match_union(param_type, hook_arg):
-                    inject_args[name] = hook_arg
+                if isinstance(hook_arg, plan.arg_types):
+                    inject_args[plan.name] = hook_arg
                     break
-
-                # 2. 直接匹配 hook_arg
-                if isinstance(hook_arg, param_type):
-                    inject_args[name] = hook_arg
-                    break
-
-                # 3. 依赖提供者匹配（Bot、Event、Matcher...）
-                for dep_type, provider in DEPENDENCY_PROVIDERS.items():
-                    if isinstance(param_type, type) and issubclass(param_type, dep_type):
-                        inject_args[name] = provider()
-                        break
+            else:
+                if plan.provider is not None:
+                    inject_args[plan.name] = plan.provider()
 
         return inject_args
 
     def register(self, hook_type: HookType, hooked: "Hooked"):
         """
-        注册一个挂钩函数
+        注册一个挂钩函数（按优先级有序插入，同优先级保持注册顺序）
         """
-        self._hooks[hook_type].append(hooked)
+        hooked.injection_plan = _compile_injection_plan(hooked.function)
+        insort(self._hooks[hook_type], hooked, key=lambda x: x.priority)
         return hooked
 
     async def run(self, hook_type: HookType, *hook_args: HOOK_ARGS, stream: bool = False):
@@ -88,21 +114,21 @@ class HookManager:
         :param hook_arg: 消息处理流程中对应的数据类
         :param stream: 当前是否为流式状态
         """
-        hookeds = self._hooks[hook_type]
-        hookeds.sort(key=lambda x: x.priority)
+        hookeds = self._hooks.get(hook_type)
+        if not hookeds:
+            return
 
-        bot: Bot = get_bot()
-        event: Event = get_event()
         state: T_State = {}
 
         for hooked in hookeds:
-            args = await self._inject_dependencies(hooked.function, *hook_args)
+            if hooked.stream is not None and hooked.stream == stream:
+                continue
 
-            if (hooked.stream is not None and hooked.stream == stream) or (
-                hooked.rule and not await hooked.rule(bot, event, state)
-            ):
+            # 仅在存在规则时获取 Bot 与 Event
+            if hooked.rule and not await hooked.rule(get_bot(), get_event(), state):
                 continue
 
+            args = self._inject_dependencies(hooked, *hook_args)
             result = hooked.function(**args)
             if isinstance(result, Awaitable):
                 await result
@@ -128,6 +154,8 @@ class Hooked:
 
         self.function: HOOK_FUNC
         """函数对象"""
+        self.injection_plan: list[InjectionPlan] = []
+        """依赖注入计划（注册时生成）"""
 
     def __call__(self, func: HOOK_FUNC) -> HOOK_FUNC:
         """
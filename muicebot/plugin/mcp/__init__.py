@@ -24,6 +24,12 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from .client import cleanup_servers, get_mcp_list, handle_mcp_tool, initialize_servers
+from .client import (
+    cleanup_servers,
+    get_mcp_cache_policy,
+    get_mcp_list,
+    handle_mcp_tool,
+    initialize_servers,
+)
 
-__all__ = ["handle_mcp_tool", "cleanup_servers", "initialize_servers", "get_mcp_list"]
+__all__ = ["handle_mcp_tool", "cleanup_servers", "initialize_servers", "get_mcp_list", "get_mcp_cache_policy"]
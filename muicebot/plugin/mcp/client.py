@@ -3,11 +3,18 @@ from typing import Any, Optional
 
 from nonebot import logger
 
+from ..func_call._types import ToolResult
+from ..func_call.cache import CachePolicy
 from .config import get_mcp_server_config
 from .server import Server, Tool
 
 _servers: list[Server] = list()
 
+_tool_schemas: dict[str, tuple[list[Tool], list[dict[str, Any]]]] = {}
+"""工具 schema 缓存: 服务器名称 -> (工具列表, OpenAI 格式的工具列表)，工具列表刷新后重新生成"""
+_tool_routes: dict[str, Server] = {}
+"""工具路由索引: 工具名称 -> 所属服务器"""
+
 
 async def initialize_servers() -> None:
     """
@@ -25,33 +32,50 @@ async def initialize_servers() -> None:
             raise
 
 
-async def handle_mcp_tool(tool: str, arguments: Optional[dict[str, Any]] = None) -> Optional[str]:
+async def handle_mcp_tool(tool: str, arguments: Optional[dict[str, Any]] = None) -> Optional[ToolResult]:
     """
     处理 MCP Tool 调用
+
+    :return: 调用结果。执行出错时 `failed` 为 True；未找到工具时返回 None
     """
     logger.info(f"执行 MCP 工具: {tool} (参数: {arguments})")
 
-    for server in _servers:
-        server_tools = await server.list_tools()
-        if not any(server_tool.name == tool for server_tool in server_tools):
-            continue
+    server = _tool_routes.get(tool)
+    if server is None or not server.tools_cache_valid():
+        # 路由索引可能已过期，刷新所有服务器的工具列表
+        await get_mcp_list()
+        server = _tool_routes.get(tool)
 
-        try:
-            result = await server.execute_tool(tool, arguments)
+    if server is None:
+        return None  # Not found.
 
-            if isinstance(result, dict) and "progress" in result:
-                progress = result["progress"]
-                total = result["total"]
-                percentage = (progress / total) * 100
-                logger.info(f"工具执行进度: {progress}/{total} ({percentage:.1f}%)")
+    try:
+        result = await server.execute_tool(tool, arguments)
 
-            return f"Tool execution result: {result}"
-        except Exception as e:
-            error_msg = f"Error executing tool: {str(e)}"
-            logger.error(error_msg)
-            return error_msg
+        if isinstance(result, dict) and "progress" in result:
+            progress = result["progress"]
+            total = result["total"]
+            percentage = (progress / total) * 100
+            logger.info(f"工具执行进度: {progress}/{total} ({percentage:.1f}%)")
 
-    return None  # Not found.
+        return ToolResult(f"Tool execution result: {result}")
+    except Exception as e:
+        error_msg = f"Error executing tool: {str(e)}"
+        logger.error(error_msg)
+        return ToolResult(error_msg, failed=True)
+
+
+def get_mcp_cache_policy(tool: str) -> Optional[CachePolicy]:
+    """
+    获取 MCP 工具的结果缓存策略
+
+    :return: 缓存策略。工具未知或未配置缓存时返回 None
+    """
+    server = _tool_routes.get(tool)
+    if server is None:
+        return None
+
+    return server.config.tool_cache.get(tool) or server.config.tool_cache.get("*")
 
 
 async def cleanup_servers() -> None:
@@ -65,6 +89,9 @@ async def cleanup_servers() -> None:
         except Exception as e:
             logger.warning(f"清理 MCP 实例时出现错误: {e}")
 
+    _tool_schemas.clear()
+    _tool_routes.clear()
+
 
 async def transform_json(tool: Tool) -> dict[str, Any]:
     """
@@ -85,14 +112,31 @@ async def transform_json(tool: Tool) -> dict[str, Any]:
     return output
 
 
+def _rebuild_routes(server: Server, tools: list[Tool]):
+    """
+    重建服务器的工具路由，移除该服务器已不再提供的工具
+    """
+    for name in [name for name, routed in _tool_routes.items() if routed is server]:
+        del _tool_routes[name]
+
+    for tool in tools:
+        _tool_routes[tool.name] = server
+
+
 async def get_mcp_list() -> list[dict[str, dict]]:
     """
     获得适用于 OpenAI Tool Call 输入格式的 MCP 工具列表
     """
     all_tools: list[dict[str, dict]] = []
+    servers_tools = await asyncio.gather(*(server.list_tools() for server in _servers))
 
-    for server in _servers:
-        tools = await server.list_tools()
-        all_tools.extend([await transform_json(tool) for tool in tools])
+    for server, tools in zip(_servers, servers_tools):
+        cached = _tool_schemas.get(server.name)
+        if cached is None or cached[0] is not tools:
+            cached = (tools, [await transform_json(tool) for tool in tools])
+            _tool_schemas[server.name] = cached
+            _rebuild_routes(server, tools)
+
+        all_tools.extend(cached[1])
 
     return all_tools
@@ -7,6 +7,8 @@ from nonebot import logger
 from pydantic import BaseModel, Field, ValidationError, model_validator
 from typing_extensions import Self
 
+from ..func_call.cache import CachePolicy
+
 CONFIG_PATH = Path("./configs/mcp.json")
 
 
@@ -23,6 +25,10 @@ class McpConfig(BaseModel):
     """传输方式: stdio, sse, streamable_http"""
     url: str | None = Field(default=None)
     """服务器URL (用于sse和streamable_http传输方式)"""
+    tools_cache_ttl: float = Field(default=300)
+    """工具列表缓存时间（秒），收到 tools/list_changed 通知时立即失效。为 0 时不缓存，为负数时永不过期"""
+    tool_cache: dict[str, CachePolicy] = Field(default_factory=dict)
+    """工具结果缓存策略: 工具名称 -> 缓存策略，`*` 匹配该服务器的所有工具。仅应为只读工具配置"""
 
     @model_validator(mode="after")
     def validate_config(self) -> Self:
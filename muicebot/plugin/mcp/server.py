@@ -1,10 +1,11 @@
 import asyncio
 import logging
 import os
+import time
 from contextlib import AsyncExitStack
 from typing import Any, Optional
 
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.sse import sse_client
 from mcp.client.stdio import stdio_client
 from mcp.client.streamable_http import streamablehttp_client
@@ -50,6 +51,11 @@ class Server:
         self.session: ClientSession | None = None
         self._cleanup_lock: asyncio.Lock = asyncio.Lock()
         self.exit_stack: AsyncExitStack = AsyncExitStack()
+        self._tools: Optional[list[Tool]] = None
+        """工具列表缓存"""
+        self._tools_expire: float = 0
+        """工具列表缓存过期时间 (time.monotonic)"""
+        self._tools_lock: asyncio.Lock = asyncio.Lock()
         self._transport_initializers = {
             "stdio": self._initialize_stdio,
             "sse": self._initialize_sse,
@@ -99,13 +105,40 @@ class Server:
         transport = self.config.type
         initializer = self._transport_initializers[transport]
         read, write = await initializer()
-        session = await self.exit_stack.enter_async_context(ClientSession(read, write))
+        session = await self.exit_stack.enter_async_context(
+            ClientSession(read, write, message_handler=self._message_handler)
+        )
         await session.initialize()
         self.session = session
 
+    async def _message_handler(self, message: Any) -> None:
+        """
+        处理服务器推送的消息：工具列表变更时使缓存失效
+        """
+        if isinstance(message, types.ServerNotification) and isinstance(
+            message.root, types.ToolListChangedNotification
+        ):
+            logging.info(f"MCP Server {self.name} tools changed, invalidating cache.")
+            self.invalidate_tools()
+
+    def invalidate_tools(self) -> None:
+        """
+        使工具列表缓存失效
+        """
+        self._tools = None
+        self._tools_expire = 0
+
+    def tools_cache_valid(self) -> bool:
+        """
+        工具列表缓存是否可用（已缓存且未过期）
+        """
+        if self._tools is None:
+            return False
+        return self.config.tools_cache_ttl < 0 or time.monotonic() < self._tools_expire
+
     async def list_tools(self) -> list[Tool]:
         """
-        从 MCP 服务器获得可用工具列表
+        从 MCP 服务器获得可用工具列表（在 `tools_cache_ttl` 内使用缓存）
 
         :return: 工具列表
 
@@ -114,12 +147,24 @@ class Server:
         if not self.session:
             raise RuntimeError(f"Server {self.name} not initialized")
 
-        tools_response = await self.session.list_tools()
-        tools: list[Tool] = []
+        if self.tools_cache_valid():
+            return self._tools  # type: ignore
+
+        async with self._tools_lock:
+            # 等待锁期间可能已由其他协程刷新
+            if self.tools_cache_valid():
+                return self._tools  # type: ignore
+
+            tools_response = await self.session.list_tools()
+            tools: list[Tool] = []
+
+            for item in tools_response:
+                if isinstance(item, tuple) and item[0] == "tools":
+                    tools.extend(Tool(tool.name, tool.description, tool.inputSchema) for tool in item[1])
 
-        for item in tools_response:
-            if isinstance(item, tuple) and item[0] == "tools":
-                tools.extend(Tool(tool.name, tool.description, tool.inputSchema) for tool in item[1])
+            if self.config.tools_cache_ttl:
+                self._tools = tools
+                self._tools_expire = time.monotonic() + self.config.tools_cache_ttl
 
         return tools
 
@@ -170,5 +215,6 @@ class Server:
             try:
                 await self.exit_stack.aclose()
                 self.session = None
+                self.invalidate_tools()
             except Exception as e:
                 logging.error(f"Error during cleanup of server {self.name}: {e}")
@@ -7,9 +7,10 @@ from nonebot import get_bot, logger
 from nonebot_plugin_alconna.uniseg import Target, UniMessage
 from nonebot_plugin_orm import async_scoped_session
 
-from .config import get_schedule_configs
+from .config import get_schedule_configs, plugin_config
 from .models import Message
 from .muice import Muice
+from .utils.media import collect_media_garbage
 
 
 async def send_message(target_id: str, message: str, probability: float = 1):
@@ -99,6 +100,14 @@ def setup_scheduler(muice: Muice) -> AsyncIOScheduler:
 
         logger.success(f"已注册定时任务: {job_id}")
 
-    if jobs:
+    if plugin_config.media_gc_interval > 0:
+        scheduler.add_job(
+            collect_media_garbage,
+            IntervalTrigger(hours=plugin_config.media_gc_interval),
+            id="media_gc",
+            replace_existing=True,
+        )
+
+    if scheduler.get_jobs():
         scheduler.start()
     return scheduler
@@ -1,7 +1,10 @@
+import os
+from collections import OrderedDict
 from pathlib import Path
+from typing import Optional
 
 import yaml
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, Template
 from jinja2.exceptions import TemplateNotFound
 from nonebot import logger
 
@@ -11,6 +14,18 @@ SEARCH_PATH = ["./templates", Path(__file__).parent.parent / "builtin_templates"
 
 TEMPLATES_CONFIG_PATH = "./configs/templates.yml"
 
+_env = Environment(loader=FileSystemLoader(SEARCH_PATH), autoescape=True, auto_reload=True)
+"""全局模板环境：模板只编译一次，文件 mtime 变化时由 Jinja 自动重新加载"""
+
+_templates_config: Optional[tuple[float, PromptTemplatesConfig]] = None
+"""模板配置缓存: (配置文件 mtime, 模板配置)"""
+
+_RENDER_CACHE_SIZE = 256
+"""渲染结果缓存的最大条目数（按最近使用淘汰）"""
+
+_render_cache: OrderedDict[tuple[str, str, bool], tuple[Template, PromptTemplatesConfig, str]] = OrderedDict()
+"""渲染结果缓存: (模板名, userid, is_private) -> (模板对象, 模板配置, 渲染结果)"""
+
 
 def load_templates_config() -> dict:
     """
@@ -23,12 +38,28 @@ def load_templates_config() -> dict:
         return {}
 
 
+def get_templates_config() -> PromptTemplatesConfig:
+    """
+    获取经过校验的模板配置（仅在配置文件 mtime 变化时重新读取）
+    """
+    global _templates_config
+
+    try:
+        mtime = os.path.getmtime(TEMPLATES_CONFIG_PATH)
+    except OSError:
+        mtime = -1
+
+    if _templates_config is None or _templates_config[0] != mtime:
+        _templates_config = (mtime, PromptTemplatesConfig(**load_templates_config()))
+
+    return _templates_config[1]
+
+
 def load_templates_data(userid: str, is_private: bool = False) -> PromptTemplatesData:
     """
     获取模板数据
     """
-    config = load_templates_config()
-    templates_config = PromptTemplatesConfig(**config)
+    templates_config = get_templates_config()
     return PromptTemplatesData.from_config(templates_config, userid=userid, is_private=is_private)
 
 
@@ -36,17 +67,29 @@ def generate_prompt_from_template(template_name: str, userid: str, is_private: b
     """
     获取提示词
     """
-    env = Environment(loader=FileSystemLoader(SEARCH_PATH), autoescape=True)
-
     if not template_name.endswith((".j2", ".jinja2")):
         template_name += ".jinja2"
     try:
-        template = env.get_template(template_name)
+        template = _env.get_template(template_name)
     except TemplateNotFound:
         logger.error(f"模板文件 {template_name} 未找到!")
         return ""
 
-    templates_data = load_templates_data(userid, is_private)
+    templates_config = get_templates_config()
+
+    # 模板或配置重新加载后对象会发生变化，此时缓存自动失效
+    key = (template_name, userid, is_private)
+    cached = _render_cache.get(key)
+    if cached is not None and cached[0] is template and cached[1] is templates_config:
+        _render_cache.move_to_end(key)
+        return cached[2]
+
+    templates_data = PromptTemplatesData.from_config(templates_config, userid=userid, is_private=is_private)
     prompt = template.render(templates_data.model_dump())
 
+    _render_cache[key] = (template, templates_config, prompt)
+    _render_cache.move_to_end(key)
+    while len(_render_cache) > _RENDER_CACHE_SIZE:
+        _render_cache.popitem(last=False)
+
     return prompt
@@ -0,0 +1,98 @@
+"""
+进程级共享的 HTTP 连接池
+
+OpenAI（及兼容接口）模型加载器与嵌入模型、文件下载和插件商店共用同一组 `httpx.AsyncClient`（按代理地址区分），
+通过 keep-alive 复用 TCP/TLS 连接，避免每条消息都重新握手。
+其余模型 SDK（Gemini、Ollama、Dashscope、Azure）自行管理连接，不使用此连接池。
+
+HTTP/2 依赖 `httpx[http2]`（默认安装）提供的 `h2`，缺失时回退到 HTTP/1.1
+"""
+
+import ssl
+from importlib.util import find_spec
+from typing import Optional
+
+import httpx
+from nonebot import logger
+
+from ..config import plugin_config
+
+_clients: dict[Optional[str], httpx.AsyncClient] = {}
+"""代理地址 -> 共享客户端"""
+_ssl_context: Optional[ssl.SSLContext] = None
+
+
+class _HostTimeoutTransport(httpx.AsyncBaseTransport):
+    """
+    按主机名覆盖请求超时时间的传输层
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, host_timeouts: dict[str, float]) -> None:
+        self._transport = transport
+        self._host_timeouts = {host: httpx.Timeout(timeout).as_dict() for host, timeout in host_timeouts.items()}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if timeout := self._host_timeouts.get(request.url.host):
+            request.extensions["timeout"] = timeout
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _get_ssl_context() -> ssl.SSLContext:
+    global _ssl_context
+
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+        _ssl_context.set_ciphers("DEFAULT")
+
+    return _ssl_context
+
+
+def get_http_timeout() -> httpx.Timeout:
+    """
+    获取默认的请求超时配置
+    """
+    return httpx.Timeout(plugin_config.http_timeout, connect=plugin_config.http_connect_timeout)
+
+
+def get_http_client(proxy: Optional[str] = None) -> httpx.AsyncClient:
+    """
+    获取共享的 HTTP 客户端（首次调用时创建）
+
+    :param proxy: 代理地址，不同的代理使用不同的连接池
+    """
+    if (client := _clients.get(proxy)) is not None and not client.is_closed:
+        return client
+
+    http2 = plugin_config.http2 and find_spec("h2") is not None
+    if plugin_config.http2 and not http2:
+        logger.warning("未安装 h2，共享 HTTP 连接池回退到 HTTP/1.1 (可通过 `pip install httpx[http2]` 安装)")
+    transport: httpx.AsyncBaseTransport = httpx.AsyncHTTPTransport(
+        verify=_get_ssl_context(),
+        http2=http2,
+        proxy=proxy,
+        limits=httpx.Limits(
+            max_connections=plugin_config.http_max_connections,
+            max_keepalive_connections=plugin_config.http_max_keepalive_connections,
+            keepalive_expiry=plugin_config.http_keepalive_expiry,
+        ),
+    )
+    if plugin_config.http_host_timeouts:
+        transport = _HostTimeoutTransport(transport, plugin_config.http_host_timeouts)
+
+    client = httpx.AsyncClient(transport=transport, timeout=get_http_timeout(), follow_redirects=True)
+    _clients[proxy] = client
+
+    logger.debug(f"已创建共享 HTTP 连接池 (代理: {proxy}, HTTP/2: {http2})")
+    return client
+
+
+async def close_http_clients() -> None:
+    """
+    关闭全部共享的 HTTP 客户端
+    """
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
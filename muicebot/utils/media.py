@@ -0,0 +1,82 @@
+"""
+多模态文件清理
+
+`download_file` 以内容哈希命名保存的文件可能被多条消息引用，
+定期扫描仍可用的对话记录 (`Msg.resources`)，删除不再被任何记录引用的文件
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from nonebot import logger
+from nonebot_plugin_orm import get_session
+
+from ..config import plugin_config
+from .utils import FILES_DIR
+
+
+@dataclass
+class MediaGCReport:
+    """
+    多模态文件清理报告
+    """
+
+    removed: int = 0
+    """删除的文件数量"""
+    reclaimed: int = 0
+    """回收的空间（字节）"""
+    kept: int = 0
+    """保留的文件数量"""
+
+    def __str__(self) -> str:
+        return f"删除 {self.removed} 个文件, 回收 {self.reclaimed / 1024 / 1024:.2f} MB, 保留 {self.kept} 个文件"
+
+
+def _remove_unreferenced(referenced: set[str], grace: float) -> MediaGCReport:
+    """
+    删除 `FILES_DIR` 中未被引用且超出保护期的文件
+    """
+    report = MediaGCReport()
+    expire_time = time.time() - grace
+
+    for file in FILES_DIR.iterdir():
+        if not file.is_file():
+            continue
+
+        try:
+            stat = file.stat()
+            if file.name in referenced or stat.st_mtime > expire_time:
+                report.kept += 1
+                continue
+            file.unlink()
+        except OSError as e:
+            logger.warning(f"清理文件 {file.name} 失败: {e}")
+            continue
+
+        report.removed += 1
+        report.reclaimed += stat.st_size
+
+    return report
+
+
+async def collect_media_garbage() -> MediaGCReport:
+    """
+    清理不再被任何可用对话记录引用的多模态文件
+
+    :return: 清理报告
+    """
+    from ..database import MessageORM
+
+    async with get_session() as session:
+        paths = await MessageORM.get_referenced_resources(session)  # type:ignore
+
+    # 以文件名比较，避免数据目录迁移后绝对路径不一致而误删
+    referenced = {Path(path).name for path in paths}
+
+    loop = asyncio.get_running_loop()
+    report = await loop.run_in_executor(None, _remove_unreferenced, referenced, plugin_config.media_gc_grace)
+
+    logger.info(f"多模态文件清理完成: {report}")
+    return report
@@ -1,6 +1,7 @@
+import asyncio
 import base64
+import hashlib
 import os
-import ssl
 import sys
 import time
 from importlib.metadata import PackageNotFoundError, version
@@ -8,9 +9,9 @@ from io import BytesIO
 from mimetypes import guess_type
 from pathlib import Path
 from typing import Optional
+from uuid import uuid4
 
 import fleep
-import httpx
 import nonebot_plugin_localstore as store
 from nonebot import get_bot, logger
 from nonebot.adapters import Event, MessageSegment
@@ -21,6 +22,7 @@ from ..config import plugin_config
 from ..models import Resource
 from ..plugin.context import get_event
 from .adapters import ADAPTER_CLASSES
+from .http import get_http_client
 
 FILES_DIR = store.get_plugin_data_dir() / "files"
 FILES_CACHED_DIR = store.get_plugin_cache_dir() / "files"
@@ -34,6 +36,47 @@ User_Agent = (
     "Chrome/134.0.0.0 Safari/537.36 Edg/134.0.0.0"
 )
 
+_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+_download_semaphore: Optional[asyncio.Semaphore] = None
+"""全局下载并发限制"""
+
+
+def _get_download_semaphore() -> asyncio.Semaphore:
+    global _download_semaphore
+
+    if _download_semaphore is None:
+        _download_semaphore = asyncio.Semaphore(max(plugin_config.download_concurrency, 1))
+
+    return _download_semaphore
+
+
+def _store_download(temp_path: Path, local_path: Path):
+    """
+    将下载完成的临时文件移动到最终位置（已存在相同内容的文件时复用）
+    """
+    if local_path.exists():
+        # 已存在相同内容的文件，刷新修改时间使其重新进入清理保护期
+        temp_path.unlink()
+        os.utime(local_path)
+        logger.debug(f"文件已存在，复用: {local_path.name}")
+    else:
+        os.replace(temp_path, local_path)
+
+
+def _check_content_type(content_type: Optional[str]):
+    """
+    检查 Content-Type 是否在允许下载的列表中
+
+    :raises ValueError: 不允许下载该类型
+    """
+    allowed_types = plugin_config.download_allowed_types
+    if not (content_type and allowed_types):
+        return
+
+    mimetype = content_type.split(";")[0].strip().lower()
+    if not any(mimetype.startswith(allowed.lower()) for allowed in allowed_types):
+        raise ValueError(f"不允许下载的文件类型: {mimetype}")
+
 
 async def download_file(
     file_url: str, file_name: Optional[str] = None, proxy: Optional[str] = None, cache: bool = False
@@ -41,25 +84,58 @@ async def download_file(
     """
     保存文件至本地目录(在未提供后缀的情况下, 默认为.jpg后缀)
 
+    文件以内容的 SHA-256 命名（`{sha256}.{后缀}`），相同内容的文件只会保存一份
+
     :param file_url: 图片在线地址
-    :param file_name: 要保存的文件名
+    :param file_name: 原始文件名（仅用于确定后缀）
     :param proxy: 代理地址
     :param cache: 保存至缓存目录
 
     :return: 保存后的本地目录
-    """
-    ssl_context = ssl.create_default_context()
-    ssl_context.set_ciphers("DEFAULT")
-    file_subfix = file_url.split(".")[-1].lower() if "." in file_url else "jpg"
-    file_name = file_name if file_name else f"{time.time_ns()}.{file_subfix}"
 
-    async with httpx.AsyncClient(proxy=proxy, verify=ssl_context) as client:
-        r = await client.get(file_url, headers={"User-Agent": User_Agent})
-        file_dir = FILES_CACHED_DIR if cache else FILES_DIR
-        local_path = (file_dir / file_name).resolve()
-        with open(local_path, "wb") as file:
-            file.write(r.content)
-        return str(local_path)
+    :raises ValueError: 文件类型不被允许或文件大小超出 `download_max_size`
+    :raises httpx.HTTPError: 下载失败
+    """
+    if file_name:
+        file_subfix = file_name.split(".")[-1].lower() if "." in file_name else ""
+    else:
+        file_subfix = file_url.split(".")[-1].lower() if "." in file_url else "jpg"
+    file_dir = FILES_CACHED_DIR if cache else FILES_DIR
+    temp_path = file_dir / f"{uuid4().hex}.part"
+    sha256 = hashlib.sha256()
+    max_size = plugin_config.download_max_size
+
+    async with _get_download_semaphore():
+        async with get_http_client(proxy).stream("GET", file_url, headers={"User-Agent": User_Agent}) as r:
+            r.raise_for_status()
+            _check_content_type(r.headers.get("Content-Type"))
+
+            content_length = r.headers.get("Content-Length")
+            if max_size and content_length and content_length.isdigit() and int(content_length) > max_size:
+                raise ValueError(f"文件大小 {content_length} 字节超出限制 {max_size} 字节")
+
+            # 文件写入在线程池中进行，避免下载大文件时阻塞事件循环
+            size = 0
+            file = await asyncio.to_thread(open, temp_path, "wb")
+            try:
+                try:
+                    async for chunk in r.aiter_bytes(_DOWNLOAD_CHUNK_SIZE):
+                        size += len(chunk)
+                        if max_size and size > max_size:
+                            raise ValueError(f"文件大小超出限制 {max_size} 字节")
+                        sha256.update(chunk)
+                        await asyncio.to_thread(file.write, chunk)
+                finally:
+                    file.close()
+            except BaseException:
+                temp_path.unlink(missing_ok=True)
+                raise
+
+    file_name = f"{sha256.hexdigest()}.{file_subfix}" if file_subfix else sha256.hexdigest()
+    local_path = (file_dir / file_name).resolve()
+    await asyncio.to_thread(_store_download, temp_path, local_path)
+
+    return str(local_path)
 
 
 async def save_image_as_base64(image_url: str, proxy: Optional[str] = None) -> str:
@@ -69,12 +145,8 @@ async def save_image_as_base64(image_url: str, proxy: Optional[str] = None) -> s
     :image_url: 图片在线地址
     :return: 本地地址
     """
-    ssl_context = ssl.create_default_context()
-    ssl_context.set_ciphers("DEFAULT")
-
-    async with httpx.AsyncClient(proxy=proxy, verify=ssl_context) as client:
-        r = await client.get(image_url, headers={"User-Agent": User_Agent})
-        image_base64 = base64.b64encode(r.content)
+    r = await get_http_client(proxy).get(image_url, headers={"User-Agent": User_Agent})
+    image_base64 = base64.b64encode(r.content)
     return image_base64.decode("utf-8")
 
 
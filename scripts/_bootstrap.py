@@ -0,0 +1,32 @@
+"""
+基准测试脚本的公共初始化
+
+在临时目录中以无驱动模式初始化 NoneBot 并加载 MuiceBot，不读写实际的数据目录
+"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def init_muicebot() -> Path:
+    """
+    初始化 NoneBot 并加载 MuiceBot 插件
+
+    :return: 临时工作目录（用作 localstore 数据目录）
+    """
+    sys.path.insert(0, str(ROOT))
+    workdir = Path(tempfile.mkdtemp(prefix="muicebot-bench-"))
+    os.chdir(workdir)
+    atexit.register(shutil.rmtree, workdir, True)
+
+    import nonebot
+
+    nonebot.init(driver="~none", localstore_use_cwd=True, log_level="WARNING")
+    nonebot.load_plugin("muicebot")
+    return workdir
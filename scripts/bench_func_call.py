@@ -0,0 +1,87 @@
+"""
+Function Call 单次调用开销基准测试
+
+对比 `Caller` 每次调用都重新解析函数签名与生成 JSON Schema（缓存失效，即引入注入计划缓存前的行为）
+与使用缓存时 `run()` 和 `data()` 的单次耗时
+
+用法: python scripts/bench_func_call.py [--iterations 20000]
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from _bootstrap import init_muicebot
+
+
+def measure(func: Callable[[], object], iterations: int) -> float:
+    """
+    :return: 平均每次调用耗时（微秒）
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def measure_async(func: Callable[[], Awaitable[object]], iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000, help="每项测试的调用次数")
+    args = parser.parse_args()
+
+    init_muicebot()
+    from pydantic import BaseModel, Field
+
+    from muicebot.plugin.func_call import get_function_calls, on_function_call
+
+    class WeatherParams(BaseModel):
+        city: str = Field(description="城市名称")
+        days: int = Field(1, description="预报天数")
+        unit: str = Field("celsius", description="温度单位")
+
+    @on_function_call("查询天气", params=WeatherParams)
+    async def weather(city: str, days: int = 1, unit: str = "celsius") -> str:
+        return city
+
+    caller = get_function_calls()["weather"]
+
+    def invalidate():
+        caller._injection_plan = None
+        caller._schema = None
+
+    async def run_uncached():
+        invalidate()
+        await caller.run(city="Beijing")
+
+    def data_uncached():
+        invalidate()
+        caller.data()
+
+    await caller.run(city="Beijing")  # 预热
+    results = {
+        "run()": (
+            await measure_async(run_uncached, args.iterations),
+            await measure_async(lambda: caller.run(city="Beijing"), args.iterations),
+        ),
+        "data()": (
+            measure(data_uncached, args.iterations),
+            measure(caller.data, args.iterations),
+        ),
+    }
+
+    print(f"iterations={args.iterations}\n")
+    print(f"{'':<8}{'uncached us':>13}{'cached us':>11}{'speedup':>9}")
+    for name, (before, after) in results.items():
+        print(f"{name:<8}{before:>13.2f}{after:>11.2f}{before / after:>8.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
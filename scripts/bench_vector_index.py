@@ -0,0 +1,72 @@
+"""
+向量索引召回率与延迟基准测试
+
+在带聚类结构的随机向量上对比 `FlatIndex` 与不同 `nprobe` 下的 `IVFIndex`（float32 / float16），
+输出召回率、单次查询延迟与相对精确检索的加速比
+
+用法: python scripts/bench_vector_index.py [--rows 50000] [--dim 256] [--queries 200] [--k 10]
+"""
+
+import argparse
+import time
+
+import numpy as np
+from _bootstrap import init_muicebot
+
+
+def make_dataset(rows: int, dim: int, queries: int, clusters: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    生成聚类分布的向量与从其附近采样的查询向量（真实的嵌入向量同样是聚类分布）
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(0, clusters, rows)] + 0.3 * rng.normal(size=(rows, dim))
+    query_vectors = vectors[rng.integers(0, rows, queries)] + 0.1 * rng.normal(size=(queries, dim))
+    return vectors.astype(np.float32), query_vectors.astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000, help="索引中的向量数量")
+    parser.add_argument("--dim", type=int, default=256, help="向量维度")
+    parser.add_argument("--queries", type=int, default=200, help="查询数量")
+    parser.add_argument("--k", type=int, default=10, help="每个查询的结果数量")
+    parser.add_argument("--clusters", type=int, default=200, help="数据集的聚类数量")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="IVFIndex 扫描的分区数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    init_muicebot()
+    from muicebot.llm.vector_index import FlatIndex, IVFIndex, evaluate_recall
+
+    vectors, queries = make_dataset(args.rows, args.dim, args.queries, args.clusters, args.seed)
+    ids = [str(i) for i in range(args.rows)]
+    print(f"rows={args.rows} dim={args.dim} queries={args.queries} k={args.k}\n")
+
+    print(f"{'index':<10}{'dtype':<9}{'nprobe':>7}{'recall':>9}{'ms/query':>11}{'speedup':>9}")
+
+    for dtype in ("float32", "float16"):
+        flat = FlatIndex(args.dim, dtype)
+        flat.add(ids, vectors)
+        report = evaluate_recall(flat, queries, args.k)
+        print(f"{'flat':<10}{dtype:<9}{'-':>7}{report.recall:>9.3f}{report.latency:>11.3f}{1:>8.1f}x")
+
+        ivf = IVFIndex(args.dim, dtype)
+        ivf.add(ids, vectors)
+        start = time.perf_counter()
+        ivf.train()
+        train_time = time.perf_counter() - start
+
+        for nprobe in args.nprobe:
+            if nprobe > ivf.nlist:
+                continue
+            ivf.nprobe = nprobe
+            report = evaluate_recall(ivf, queries, args.k)
+            speedup = report.exact_latency / report.latency if report.latency else float("inf")
+            print(f"{'ivf':<10}{dtype:<9}{nprobe:>7}{report.recall:>9.3f}{report.latency:>11.3f}{speedup:>8.1f}x")
+
+        print(f"  (IVFIndex {dtype}: nlist={ivf.nlist}, 训练耗时 {train_time:.2f}s)\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+测试的公共初始化
+
+在临时目录中以无驱动模式初始化 NoneBot 并加载 MuiceBot，数据库与 localstore 数据均写入该目录。
+所有测试共用同一个事件循环（与后台写入队列、数据库连接池绑定），通过 `run` 夹具执行协程
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Awaitable, Callable, TypeVar
+
+import nonebot
+import pytest
+
+T = TypeVar("T")
+
+WORKDIR = Path(tempfile.mkdtemp(prefix="muicebot-test-"))
+os.chdir(WORKDIR)
+
+# `Muice` 初始化时读取模型配置，使用不会发起网络请求的占位配置
+(WORKDIR / "configs").mkdir()
+(WORKDIR / "configs" / "models.yml").write_text(
+    "test:\n  provider: openai\n  model_name: test-model\n  api_key: test-key\n  default: true\n",
+    encoding="utf-8",
+)
+
+nonebot.init(
+    driver="~none",
+    localstore_use_cwd=True,
+    sqlalchemy_database_url=f"sqlite+aiosqlite:///{(WORKDIR / 'muicebot.db').as_posix()}",
+    alembic_startup_check=False,
+    log_level="WARNING",
+)
+nonebot.load_plugin("muicebot")
+
+
+@pytest.fixture(scope="session")
+def run():
+    """在共用的事件循环中执行协程并返回其结果"""
+    loop = asyncio.new_event_loop()
+
+    def _run(awaitable: Awaitable[T]) -> T:
+        return loop.run_until_complete(awaitable)
+
+    yield _run
+
+    from muicebot.database.writer import persistence_queue
+
+    loop.run_until_complete(persistence_queue.stop())
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def database(run: Callable[[Awaitable[T]], T]):
+    """通过 Alembic 迁移脚本创建数据库结构"""
+    from nonebot_plugin_orm import _init_orm, migrate
+    from sqlalchemy.util import greenlet_spawn
+
+    async def _upgrade():
+        _init_orm()
+        with migrate.AlembicConfig() as config:
+            await greenlet_spawn(migrate.upgrade, config)
+
+    run(_upgrade())
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _cleanup_workdir():
+    yield
+
+    from muicebot import config
+
+    if config._model_config_manager is not None:
+        config._model_config_manager.stop_watcher()
+
+    os.chdir(Path(__file__).parent)
+    shutil.rmtree(WORKDIR, True)
@@ -0,0 +1,41 @@
+"""
+检查文件下载：按内容命名并复用相同文件，超出大小限制时清理临时文件
+"""
+
+from pathlib import Path
+
+import httpx
+import pytest
+
+from muicebot.config import plugin_config
+from muicebot.utils import utils
+
+
+@pytest.fixture
+def files_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, headers={"Content-Type": "image/png"}, content=b"x" * 200_000)
+        )
+    )
+    monkeypatch.setattr(utils, "get_http_client", lambda proxy=None: client)
+    monkeypatch.setattr(utils, "FILES_DIR", tmp_path)
+    return tmp_path
+
+
+def test_download_deduplicated(run, files_dir: Path):
+    first = run(utils.download_file("https://example.com/a.png"))
+    second = run(utils.download_file("https://example.com/b.png"))
+
+    assert first == second
+    assert Path(first).read_bytes() == b"x" * 200_000
+    assert [path.name for path in files_dir.iterdir()] == [Path(first).name]
+
+
+def test_download_size_limit(run, files_dir: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(plugin_config, "download_max_size", 100_000)
+
+    with pytest.raises(ValueError):
+        run(utils.download_file("https://example.com/a.png"))
+
+    assert not list(files_dir.iterdir())
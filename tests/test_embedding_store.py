@@ -0,0 +1,151 @@
+"""
+检查嵌入向量缓存存储：追加失败回滚、崩溃后截断、整理（去重与限制行数）以及旧版缓存迁移
+"""
+
+import json
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from muicebot.llm import _embedding_store
+from muicebot.llm._embedding_store import (
+    EmbeddingStore,
+    compact_embedding_stores,
+    get_embedding_store,
+    text_digest,
+)
+
+
+def _open(directory: Path) -> EmbeddingStore:
+    return EmbeddingStore(directory, "Provider", "https://example.com", "model")
+
+
+def test_append_and_reload(tmp_path: Path):
+    store = _open(tmp_path)
+    store.append(["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+
+    assert store.get("a") == [1.0, 2.0]
+    assert store.get("b") == [3.0, 4.0]
+    assert store.get("c") is None
+
+    reloaded = _open(tmp_path)
+    assert reloaded.dim == 2 and len(reloaded) == 2
+    assert reloaded.get("b") == [3.0, 4.0]
+
+
+def test_invalid_embeddings_skipped(tmp_path: Path):
+    store = _open(tmp_path)
+    store.append(["a"], [[1.0, 2.0]])
+    store.append(["b"], [[1.0, 2.0, 3.0]])
+    store.append(["c", "d"], [[1.0, 2.0]])
+
+    assert len(store) == 1 and store.rows == 1
+
+
+def test_failed_append_rolls_back(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    store = _open(tmp_path)
+    store.append(["a"], [[1.0, 2.0]])
+
+    fsync_write = _embedding_store._fsync_write
+
+    def _fail_on_index(path: Path, data: bytes):
+        if path.name.startswith("index-"):
+            raise OSError(28, "No space left on device")
+        fsync_write(path, data)
+
+    monkeypatch.setattr(_embedding_store, "_fsync_write", _fail_on_index)
+    with pytest.raises(OSError):
+        store.append(["b"], [[3.0, 4.0]])
+    monkeypatch.setattr(_embedding_store, "_fsync_write", fsync_write)
+
+    # 向量文件已截断回写入前的长度，之后追加的行与索引对齐
+    assert store._vectors_path.stat().st_size == 2 * 4
+    assert store.get("b") is None
+
+    store.append(["c"], [[5.0, 6.0]])
+    assert store.get("c") == [5.0, 6.0]
+    assert _open(tmp_path).get("c") == [5.0, 6.0]
+
+
+def test_truncated_tail_after_crash(tmp_path: Path):
+    store = _open(tmp_path)
+    store.append(["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+
+    # 模拟写入向量后、写入索引前崩溃
+    with open(store._vectors_path, "ab") as f:
+        f.write(np.array([[9.0, 9.0]], dtype=np.float32).tobytes()[:5])
+
+    reloaded = _open(tmp_path)
+    assert reloaded.rows == 2
+    assert reloaded._vectors_path.stat().st_size == 2 * 2 * 4
+    assert reloaded.get("b") == [3.0, 4.0]
+
+
+def test_concurrent_appends(tmp_path: Path):
+    store = _open(tmp_path)
+    texts = [f"t{i}" for i in range(40)]
+
+    threads = [threading.Thread(target=store.append, args=([text], [[float(i), 0.0]])) for i, text in enumerate(texts)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(store) == 40
+    assert all(store.get(text) == [float(i), 0.0] for i, text in enumerate(texts))
+    assert _open(tmp_path).rows == 40
+
+
+def test_compact_removes_duplicates(tmp_path: Path):
+    store = _open(tmp_path)
+    store.append(["a", "b"], [[1.0, 1.0], [2.0, 2.0]])
+    store.append(["a"], [[3.0, 3.0]])
+    old_files = [store._vectors_path, store._index_path]
+
+    rows_before, rows_after, reclaimed = store.compact()
+
+    assert (rows_before, rows_after) == (3, 2)
+    assert reclaimed == 2 * 4 + 32
+    assert store.generation == 1
+    assert not any(file.exists() for file in old_files)
+    assert store.get("a") == [3.0, 3.0] and store.get("b") == [2.0, 2.0]
+
+    reloaded = _open(tmp_path)
+    assert reloaded.generation == 1
+    assert reloaded.get("a") == [3.0, 3.0]
+
+
+def test_compact_keeps_latest_rows(tmp_path: Path):
+    store = _open(tmp_path)
+    store.append(["a", "b", "c"], [[1.0], [2.0], [3.0]])
+
+    assert store.compact(max_rows=2) == (3, 2, 4 + 32)
+    assert store.get("a") is None
+    assert store.get("c") == [3.0]
+
+    assert store.compact() == (2, 2, 0)
+
+
+def test_migrate_legacy_cache(tmp_path: Path):
+    cache_dir = tmp_path / "embedding"
+    cache_dir.mkdir()
+    meta = {"provider": "Legacy", "api_host": "", "model": "m"}
+    for i, text in enumerate(["x", "y"]):
+        name = f"legacy-{i}"
+        (cache_dir / f"{name}.json").write_text(
+            json.dumps({**meta, "text_hash": text_digest(text).hex()}), encoding="utf-8"
+        )
+        np.save(cache_dir / f"{name}.npy", np.array([float(i), 1.0], dtype=np.float32))
+    (cache_dir / "broken.json").write_text("{", encoding="utf-8")
+
+    report = compact_embedding_stores(cache_dir)
+
+    assert report.migrated == 2
+    assert report.stores == 1
+    assert not list(cache_dir.glob("*.json")) and not list(cache_dir.glob("*.npy"))
+
+    store = get_embedding_store(cache_dir, "Legacy", "", "m")
+    assert store.get("x") == [0.0, 1.0]
+    assert store.get("y") == [1.0, 1.0]
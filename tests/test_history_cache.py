@@ -0,0 +1,150 @@
+"""
+检查对话历史缓存：环形缓冲区、填充期间追加消息的合并与去重，以及失效时取消进行中的填充
+"""
+
+import pytest
+from nonebot_plugin_orm import get_session
+
+from muicebot.config import plugin_config
+from muicebot.database import crud
+from muicebot.database.cache import HistoryCache, history_cache
+from muicebot.database.writer import persistence_queue
+from muicebot.models import Message
+
+
+@pytest.fixture
+def cache(monkeypatch: pytest.MonkeyPatch) -> HistoryCache:
+    monkeypatch.setattr(plugin_config, "max_history_epoch", 3)
+    return HistoryCache()
+
+
+def _message(id, userid: str = "u", groupid: str = "-1", text: str = "") -> Message:
+    return Message(id=id, userid=userid, groupid=groupid, message=text or f"m{id}")
+
+
+def test_disabled_without_history_epoch(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(plugin_config, "max_history_epoch", 0)
+    cache = HistoryCache()
+    assert cache.begin_fill(("u", "_default"), 0) is None
+    assert cache.get_user_history("u", "_default", 0) is None
+
+
+def test_fill_requires_full_window(cache: HistoryCache):
+    assert cache.begin_fill(("u", "_default"), 2) is None
+    assert cache.get_user_history("u", "_default", 4) is None
+
+
+def test_ring_buffer_keeps_latest_messages(cache: HistoryCache):
+    key = ("u", "_default")
+    pending = cache.begin_fill(key, 3)
+    cache.fill_user_history("u", "_default", [_message(1), _message(2)], pending)
+
+    for id in (3, 4):
+        cache.append(_message(id))
+
+    history = cache.get_user_history("u", "_default", 3)
+    assert history is not None
+    assert [item.id for item in history] == [2, 3, 4]
+    assert [item.id for item in cache.get_user_history("u", "_default", 2) or []] == [3, 4]
+
+
+def test_returned_history_is_a_copy(cache: HistoryCache):
+    pending = cache.begin_fill(("u", "_default"), 3)
+    cache.fill_user_history("u", "_default", [_message(1)], pending)
+
+    history = cache.get_user_history("u", "_default", 3)
+    assert history is not None
+    history[0].message = "changed"
+    history[0].resources.append(None)  # type: ignore
+
+    cached = cache.get_user_history("u", "_default", 3)
+    assert cached is not None
+    assert cached[0].message == "m1" and cached[0].resources == []
+
+
+def test_append_during_fill_is_merged(cache: HistoryCache):
+    pending = cache.begin_fill(("u", "_default"), 3)
+
+    # 查询开始后写入的消息：一条在查询前已落库（出现在查询结果中），一条尚未落库
+    committed = cache.append(_message(None, text="committed"))
+    committed.id = 2
+    cache.append(_message(None, text="queued"))
+
+    cache.fill_user_history("u", "_default", [_message(1), _message(2, text="committed")], pending)
+
+    history = cache.get_user_history("u", "_default", 3)
+    assert history is not None
+    assert [item.message for item in history] == ["m1", "committed", "queued"]
+
+
+def test_group_fill_merges_appends(cache: HistoryCache):
+    pending = cache.begin_fill("g", 3)
+    cache.append(_message(None, groupid="g", text="new"))
+    cache.fill_group_history("g", [_message(1, groupid="g")], pending)
+
+    history = cache.get_group_history("g", 3)
+    assert history is not None
+    assert [item.message for item in history] == ["m1", "new"]
+
+
+def test_invalidate_during_fill_cancels_fill(cache: HistoryCache):
+    user_pending = cache.begin_fill(("u", "_default"), 3)
+    group_pending = cache.begin_fill("g", 3)
+
+    cache.invalidate_user("u")
+
+    cache.fill_user_history("u", "_default", [_message(1)], user_pending)
+    cache.fill_group_history("g", [_message(1, groupid="g")], group_pending)
+    assert cache.get_user_history("u", "_default", 3) is None
+    assert cache.get_group_history("g", 3) is None
+
+
+def test_only_first_concurrent_fill_is_used(cache: HistoryCache):
+    first = cache.begin_fill(("u", "_default"), 3)
+    second = cache.begin_fill(("u", "_default"), 3)
+    assert first is second
+
+    cache.fill_user_history("u", "_default", [_message(1)], first)
+    cache.fill_user_history("u", "_default", [_message(9)], second)
+
+    history = cache.get_user_history("u", "_default", 3)
+    assert history is not None
+    assert [item.id for item in history] == [1]
+
+
+def test_end_fill_after_failed_query(cache: HistoryCache):
+    pending = cache.begin_fill(("u", "_default"), 3)
+    cache.end_fill(("u", "_default"), pending)
+
+    # 查询失败后追加的消息不应再被记录，也不应填充缓存
+    cache.append(_message(None))
+    assert pending == []
+    cache.fill_user_history("u", "_default", [_message(1)], pending)
+    assert cache.get_user_history("u", "_default", 3) is None
+
+
+def test_append_during_database_fill(run, database, monkeypatch: pytest.MonkeyPatch):
+    """
+    `get_user_history` 在查询期间（等待写入队列落库时）追加的消息应出现在缓存中，且不与查询结果重复
+    """
+    monkeypatch.setattr(plugin_config, "max_history_epoch", 5)
+    history_cache.clear()
+    userid = "cache-fill-race"
+    flush = persistence_queue.flush
+
+    async def _flush_with_append():
+        # 模拟另一个请求在本次查询进行时完成回复：一条先落库，一条仍在队列中
+        await persistence_queue.put_message(history_cache.append(Message(userid=userid, message="committed")))
+        await flush()
+        history_cache.append(Message(userid=userid, message="queued"))
+
+    async def _load():
+        async with get_session() as session:
+            monkeypatch.setattr(persistence_queue, "flush", _flush_with_append)
+            history = await crud.MessageORM.get_user_history(session, userid, 5)
+            monkeypatch.setattr(persistence_queue, "flush", flush)
+            return history, await crud.MessageORM.get_user_history(session, userid, 5)
+
+    queried, cached = run(_load())
+    assert [item.message for item in queried] == ["committed"]
+    assert [item.message for item in cached] == ["committed", "queued"]
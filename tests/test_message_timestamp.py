@@ -0,0 +1,54 @@
+"""
+检查 `Message.timestamp` 的换算，以及迁移前遗留的、时间格式不正确的对话记录仍可被加载
+"""
+
+from datetime import datetime
+
+from nonebot_plugin_orm import get_session
+from sqlalchemy import text
+
+from muicebot.database import crud
+from muicebot.database.cache import history_cache
+from muicebot.models import Message
+
+
+def test_timestamp_from_time():
+    message = Message(time="2024.01.01 10:00:00")
+    assert message.timestamp == int(datetime(2024, 1, 1, 10).timestamp())
+
+
+def test_malformed_time_keeps_zero_timestamp():
+    assert Message(time="2024-01-01 10:00:00").timestamp == 0
+    assert Message(time=None).timestamp == 0  # type: ignore
+
+
+def test_ordering_uses_timestamp_then_id():
+    early = Message(id=2, time="2024.01.01 10:00:00")
+    late = Message(id=1, time="2024.01.02 10:00:00")
+    same_time = Message(id=3, time="2024.01.01 10:00:00")
+    assert sorted([late, same_time, early]) == [early, same_time, late]
+
+
+def test_legacy_row_with_malformed_time(run, database):
+    userid = "legacy-malformed-time"
+
+    async def _load():
+        async with get_session() as session:
+            # 迁移脚本会跳过无法解析的时间字符串，使这些记录的 timestamp 保持为 NULL
+            for message in ("m", "m2"):
+                await session.execute(
+                    text(
+                        "INSERT INTO muicebot_msg (time, userid, groupid, message, respond, history, profile) "
+                        "VALUES ('2024-01-01 10:00:00', :userid, '-1', :message, 'r', 1, '_default')"
+                    ),
+                    {"userid": userid, "message": message},
+                )
+            await session.commit()
+
+        history_cache.clear()
+        async with get_session() as session:
+            return await crud.MessageORM.get_user_history(session, userid)
+
+    history = run(_load())
+    assert [message.message for message in history] == ["m", "m2"]
+    assert all(message.timestamp == 0 for message in history)
@@ -0,0 +1,95 @@
+"""
+检查用户与群组对话历史的归并：按消息 ID 保持顺序、去重（包括尚未落库、没有 ID 的消息），以及轮数与 Tokens 预算
+"""
+
+from typing import List, Optional
+
+import pytest
+
+from muicebot import muice as muice_module
+from muicebot.config import plugin_config
+from muicebot.models import Message
+from muicebot.muice import Muice
+
+
+def _message(id: Optional[int], userid: str = "u", groupid: str = "g", text: str = "") -> Message:
+    return Message(id=id, userid=userid, groupid=groupid, message=text or f"m{id}", respond="r", timestamp=1000)
+
+
+@pytest.fixture
+def muice(monkeypatch: pytest.MonkeyPatch) -> Muice:
+    async def _get_username(userid: Optional[str] = None) -> str:
+        return userid or ""
+
+    monkeypatch.setattr(muice_module, "get_username", _get_username)
+    muice = Muice.get_instance()
+    monkeypatch.setattr(muice, "max_history_epoch", 0)
+    return muice
+
+
+def _with_history(monkeypatch: pytest.MonkeyPatch, muice: Muice, user: List[Message], group: List[Message]):
+    async def _get_user_history(session, userid, limit=0):
+        return [Message(**item.to_dict()) for item in user]
+
+    async def _get_group_history(session, groupid, limit=0):
+        return [Message(**item.to_dict()) for item in group]
+
+    monkeypatch.setattr(muice.database, "get_user_history", _get_user_history)
+    monkeypatch.setattr(muice.database, "get_group_history", _get_group_history)
+
+
+def test_merge_by_id(run, muice: Muice, monkeypatch: pytest.MonkeyPatch):
+    # 并发的对话可能不按接收时间的顺序落库：按 ID（落库顺序）归并，而非按时间戳
+    user = [_message(1), _message(3, userid="u", text="both"), _message(5)]
+    group = [_message(2, userid="other"), _message(3, userid="u", text="both"), _message(4, userid="other")]
+    for item, timestamp in zip(user + group, (50, 30, 10, 40, 30, 20)):
+        item.timestamp = timestamp
+    _with_history(monkeypatch, muice, user, group)
+
+    history = run(muice._prepare_history(None, "u", "g"))  # type: ignore
+
+    assert [item.id for item in history] == [1, 2, 3, 4, 5]
+    # 同一条消息优先使用群聊历史中的副本（带用户名前缀）
+    assert [item.message for item in history] == ["m1", "<other> m2", "<u> both", "<other> m4", "m5"]
+
+
+def test_unsaved_messages_last_and_deduplicated(run, muice: Muice, monkeypatch: pytest.MonkeyPatch):
+    unsaved = _message(None, text="unsaved")
+    user = [_message(1), unsaved]
+    group = [_message(2, userid="other"), unsaved]
+    _with_history(monkeypatch, muice, user, group)
+
+    history = run(muice._prepare_history(None, "u", "g"))  # type: ignore
+
+    assert [item.id for item in history] == [1, 2, None]
+    assert history[-1].message == "<u> unsaved"
+
+
+def test_private_chat_uses_user_history_only(run, muice: Muice, monkeypatch: pytest.MonkeyPatch):
+    _with_history(monkeypatch, muice, [_message(1, groupid="-1")], [_message(2)])
+
+    history = run(muice._prepare_history(None, "u", "-1"))  # type: ignore
+
+    assert [item.id for item in history] == [1]
+
+
+def test_epoch_limit_keeps_latest(run, muice: Muice, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(muice, "max_history_epoch", 3)
+    _with_history(monkeypatch, muice, [_message(1), _message(3), _message(5)], [_message(2), _message(4)])
+
+    history = run(muice._prepare_history(None, "u", "g"))  # type: ignore
+
+    assert [item.id for item in history] == [3, 4, 5]
+
+
+def test_token_budget_keeps_latest(run, muice: Muice, monkeypatch: pytest.MonkeyPatch):
+    user = [_message(id, text="x" * 200) for id in range(1, 6)]
+    _with_history(monkeypatch, muice, user, [])
+
+    full = run(muice._prepare_history(None, "u", "-1"))  # type: ignore
+    per_message = muice_module.estimate_message_tokens(full[0])
+    monkeypatch.setattr(plugin_config, "max_history_tokens", per_message * 2 + 1)
+
+    history = run(muice._prepare_history(None, "u", "-1"))  # type: ignore
+
+    assert [item.id for item in history] == [4, 5]
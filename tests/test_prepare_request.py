@@ -0,0 +1,78 @@
+"""
+检查模型请求准备阶段：各阶段并发执行，超时阶段使用默认值，访问数据库的阶段超时后在后台完成且不占用调用方的会话
+"""
+
+import asyncio
+import time
+
+import pytest
+from nonebot_plugin_orm import get_session
+from sqlalchemy import select
+
+from muicebot.config import plugin_config
+from muicebot.database.orm_models import User
+from muicebot.models import Message
+from muicebot.muice import Muice
+
+
+@pytest.fixture
+def muice(monkeypatch: pytest.MonkeyPatch) -> Muice:
+    muice = Muice.get_instance()
+    monkeypatch.setattr(muice, "template", None)
+    monkeypatch.setattr(muice.model_config, "function_call", False)
+    return muice
+
+
+def _slow(monkeypatch: pytest.MonkeyPatch, muice: Muice, name: str, delay: float, result, finished: list):
+    async def _stage(*args, **kwargs):
+        await asyncio.sleep(delay)
+        finished.append(name)
+        return result
+
+    monkeypatch.setattr(muice, name, _stage)
+
+
+def test_stages_run_concurrently(run, database, muice: Muice, monkeypatch: pytest.MonkeyPatch):
+    finished: list = []
+    history = [Message(id=1, userid="prepare-concurrent", message="old")]
+    _slow(monkeypatch, muice, "_prepare_prompt", 0.2, "prompt", finished)
+    _slow(monkeypatch, muice, "_prepare_history", 0.2, history, finished)
+
+    async def _prepare():
+        async with get_session() as session:
+            start = time.perf_counter()
+            request = await muice._prepare_request(session, Message(userid="prepare-concurrent"), True, True)
+            return request, time.perf_counter() - start
+
+    request, elapsed = run(_prepare())
+    assert request.prompt == "prompt"
+    assert request.history == history
+    assert set(request.timings) == {"prompt", "history"}
+    assert elapsed < 0.35
+
+
+def test_timed_out_stages(run, database, muice: Muice, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(plugin_config, "prepare_timeout", 0.1)
+    finished: list = []
+    userid = "prepare-timeout"
+    _slow(monkeypatch, muice, "_prepare_prompt", 0.3, "prompt", finished)
+    _slow(monkeypatch, muice, "_prepare_history", 0.3, [Message(id=1, userid=userid)], finished)
+
+    async def _prepare():
+        async with get_session() as session:
+            request = await muice._prepare_request(session, Message(userid=userid, message="hi"), True, True)
+
+            # 调用方的会话在超时后仍可立即使用
+            session.add(User(userid=userid))
+            await session.commit()
+            users = (await session.execute(select(User).where(User.userid == userid))).scalars().all()
+
+        await asyncio.sleep(0.4)
+        return request, users
+
+    request, users = run(_prepare())
+    assert request.prompt == "hi"
+    assert request.history == []
+    assert len(users) == 1
+    # 提示词阶段被取消，对话历史阶段在后台完成
+    assert finished == ["_prepare_history"]
@@ -0,0 +1,111 @@
+"""
+检查 MessageORM / UserORM / UsageORM 的查询均命中索引
+
+数据库结构由 Alembic 迁移脚本创建（`database` 夹具，而非 `Model.metadata.create_all`），
+以确保迁移中建立的索引与 ORM 查询相匹配。
+每条语句都会以 `EXPLAIN QUERY PLAN` 执行，计划中不得出现对表的全表扫描（`SCAN`）。
+"""
+
+import re
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List
+
+import pytest
+from nonebot_plugin_orm import async_scoped_session, get_session
+from sqlalchemy import text
+
+from muicebot.database import crud
+from muicebot.database.cache import history_cache
+from muicebot.database.orm_models import Msg, Usage, User
+from muicebot.models import Message
+
+_Query = Callable[[async_scoped_session], Awaitable[object]]
+
+NOW = datetime.now()
+
+QUERIES: Dict[str, _Query] = {
+    "MessageORM.get_orm_model_by_message": lambda s: crud.MessageORM.get_orm_model_by_message(
+        s, Message(userid="u1", message="m1", respond="r1", timestamp=int(NOW.timestamp()) - 600)
+    ),
+    "MessageORM.get_user_history": lambda s: crud.MessageORM.get_user_history(s, "u1", 10),
+    "MessageORM.get_group_history": lambda s: crud.MessageORM.get_group_history(s, "g1", 10),
+    "MessageORM.get_evicted_history": lambda s: crud.MessageORM.get_evicted_history(s, "u1", "_default", 0, 5),
+    "MessageORM.get_messages_by_ids": lambda s: crud.MessageORM.get_messages_by_ids(s, [1, 2, 3]),
+    "MessageORM.mark_history_as_unavailable(limit)": lambda s: crud.MessageORM.mark_history_as_unavailable(s, "u1", 2),
+    "MessageORM.mark_history_as_unavailable": lambda s: crud.MessageORM.mark_history_as_unavailable(s, "u2"),
+    "UserORM.get_user": lambda s: crud.UserORM.get_user(s, "u1"),
+    "UserORM.set_nickname": lambda s: crud.UserORM.set_nickname(s, "u1", "nick"),
+    "UserORM.set_profile": lambda s: crud.UserORM.set_profile(s, "u1", "_default"),
+    "UserORM.get_user_profile": lambda s: crud.UserORM.get_user_profile(s, "u1"),
+    "UsageORM.get_usage": lambda s: crud.UsageORM.get_usage(s, "p1", "2025.01.01", "chat"),
+    "UsageORM.save_usage": lambda s: crud.UsageORM.save_usage(s, "p1", 10, "chat", "2025.01.01"),
+}
+"""待检查的查询（`get_referenced_resources` 等需遍历全部可用记录的统计查询不在此列）"""
+
+_INDEXED_ACCESS = re.compile(r"^SEARCH muicebot_\w+ USING (COVERING INDEX|INDEX|INTEGER PRIMARY KEY)")
+
+
+async def _seed(session: async_scoped_session):
+    base = int(NOW.timestamp())
+    for i in range(50):
+        userid = f"u{i % 5}"
+        session.add(
+            Msg(
+                time=NOW.strftime("%Y.%m.%d %H:%M:%S"),
+                userid=userid,
+                groupid=f"g{i % 3}" if i % 2 else "-1",
+                message=f"m{i}",
+                respond=f"r{i}",
+                history=int(i % 7 != 0),
+                timestamp=base - i * 600,
+            )
+        )
+    for i in range(5):
+        session.add(User(userid=f"u{i}"))
+        session.add(Usage(plugin=f"p{i}", type="chat", date=f"2025.01.0{i + 1}", tokens=100))
+    await session.commit()
+
+
+def _capture_plans(session: async_scoped_session, plans: List[str]):
+    """替换会话的 `execute`，在执行每条语句前记录其查询计划"""
+    execute = session.execute
+
+    async def explained_execute(statement, *args, **kwargs):
+        compiled = statement.compile(dialect=session.bind.dialect, compile_kwargs={"literal_binds": True})
+        result = await execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+        plans.extend(row[-1] for row in result.all())
+        return await execute(statement, *args, **kwargs)
+
+    session.execute = explained_execute  # type: ignore
+
+
+async def _collect_plans() -> Dict[str, List[str]]:
+    async with get_session() as session:
+        await _seed(session)
+
+    plans: Dict[str, List[str]] = {}
+    for name, query in QUERIES.items():
+        history_cache.clear()
+        plans[name] = []
+        async with get_session() as session:
+            _capture_plans(session, plans[name])
+            await query(session)
+            await session.rollback()
+
+    return plans
+
+
+@pytest.fixture(scope="module")
+def query_plans(run, database) -> Dict[str, List[str]]:
+    return run(_collect_plans())
+
+
+@pytest.mark.parametrize("name", QUERIES)
+def test_query_uses_index(query_plans: Dict[str, List[str]], name: str):
+    plans = query_plans[name]
+    assert plans, f"{name} 未执行任何查询"
+
+    scans = [detail for detail in plans if detail.startswith("SCAN")]
+    assert not scans, f"{name} 存在全表扫描: {scans}"
+
+    assert any(_INDEXED_ACCESS.match(detail) for detail in plans), f"{name} 未命中索引: {plans}"
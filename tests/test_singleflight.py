@@ -0,0 +1,163 @@
+"""
+检查进行中请求合并：相同请求只执行一次、异常传递给所有等待方、取消时的重新竞争，以及请求键的规范化
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from muicebot.config import plugin_config
+from muicebot.llm import _wrapper
+from muicebot.llm._config import ModelConfig
+from muicebot.llm._schema import ModelCompletions, ModelRequest
+from muicebot.llm._singleflight import SingleFlight, request_key
+from muicebot.models import Message
+
+
+class _Backend:
+    """记录调用次数的假请求，在 `release` 被设置前保持进行中"""
+
+    def __init__(self, result="ok", error: Exception | None = None) -> None:
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.result = result
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_concurrent_calls_coalesced(run):
+    flight = SingleFlight("test")
+
+    async def _main():
+        backend = _Backend()
+        tasks = [asyncio.create_task(flight.do("key", backend)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert flight.in_flight == 1
+        backend.release.set()
+        return backend, await asyncio.gather(*tasks)
+
+    backend, results = run(_main())
+    assert backend.calls == 1
+    assert results == [("ok", False)] + [("ok", True)] * 4
+    assert (flight.stats.executed, flight.stats.shared) == (1, 4)
+    assert flight.stats.saved_rate == 0.8
+    assert flight.in_flight == 0
+
+
+def test_distinct_and_sequential_calls_not_coalesced(run):
+    flight = SingleFlight("test")
+
+    async def _main():
+        first, second = _Backend("a"), _Backend("b")
+        tasks = [asyncio.create_task(flight.do("a", first)), asyncio.create_task(flight.do("b", second))]
+        await asyncio.sleep(0)
+        first.release.set()
+        second.release.set()
+        results = await asyncio.gather(*tasks)
+
+        # 已完成的请求不再被共享
+        third = _Backend("c")
+        third.release.set()
+        return results, await flight.do("a", third)
+
+    results, later = run(_main())
+    assert results == [("a", False), ("b", False)]
+    assert later == ("c", False)
+
+
+def test_error_propagated_to_all_callers(run):
+    flight = SingleFlight("test")
+
+    async def _main():
+        backend = _Backend(error=RuntimeError("rate limited"))
+        tasks = [asyncio.create_task(flight.do("key", backend)) for _ in range(3)]
+        await asyncio.sleep(0)
+        backend.release.set()
+        return backend, await asyncio.gather(*tasks, return_exceptions=True)
+
+    backend, results = run(_main())
+    assert backend.calls == 1
+    assert all(isinstance(result, RuntimeError) and str(result) == "rate limited" for result in results)
+    assert flight.in_flight == 0
+
+
+def test_leader_cancelled_follower_retries(run):
+    flight = SingleFlight("test")
+
+    async def _main():
+        backend = _Backend()
+        leader = asyncio.create_task(flight.do("key", backend))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", backend))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        backend.release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return backend, await follower
+
+    backend, result = run(_main())
+    assert result == ("ok", False)
+    assert backend.calls == 2
+    assert (flight.stats.executed, flight.stats.shared) == (2, 0)
+
+
+def test_follower_cancelled_leader_continues(run):
+    flight = SingleFlight("test")
+
+    async def _main():
+        backend = _Backend()
+        leader = asyncio.create_task(flight.do("key", backend))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", backend))
+        await asyncio.sleep(0)
+
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        backend.release.set()
+        return await leader
+
+    assert run(_main()) == ("ok", False)
+
+
+def test_request_key():
+    llm = SimpleNamespace(config=ModelConfig(provider="openai", model_name="m"))
+    history = [Message(message="hi", respond="hello")]
+
+    key = request_key(llm, ModelRequest("prompt", history=history))  # type: ignore
+    assert key == request_key(llm, ModelRequest("prompt", history=list(history), timings={"x": 1.0}))  # type: ignore
+    assert key != request_key(llm, ModelRequest("other", history=history))  # type: ignore
+    assert key != request_key(llm, ModelRequest("prompt"))  # type: ignore
+    assert request_key(llm, ModelRequest("prompt", tools=[{"name": "f"}])) is None  # type: ignore
+
+
+def test_coalesced_ask_shares_usage_once(run, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(plugin_config, "enable_request_coalescing", True)
+    calls = 0
+
+    async def _ask(self, request, stream=False):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return ModelCompletions("reply", usage=42)
+
+    ask = _wrapper.coalesce_ask(_ask)
+    llm = SimpleNamespace(config=ModelConfig(provider="openai", model_name="m"))
+
+    async def _main():
+        return await asyncio.gather(*(ask(llm, ModelRequest("same")) for _ in range(3)))
+
+    responses = run(_main())
+    assert calls == 1
+    assert sorted(response.usage for response in responses) == [0, 0, 42]
+    assert all(response.text == "reply" for response in responses)
@@ -0,0 +1,35 @@
+"""
+检查提示词模板渲染缓存按最近使用淘汰，不随用户数无限增长
+"""
+
+import pytest
+
+from muicebot.templates import loader
+from muicebot.templates.loader import generate_prompt_from_template
+
+
+@pytest.fixture(autouse=True)
+def _small_cache(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(loader, "_RENDER_CACHE_SIZE", 3)
+    loader._render_cache.clear()
+    yield
+    loader._render_cache.clear()
+
+
+def test_render_cache_bounded():
+    for i in range(10):
+        assert generate_prompt_from_template("Muice", f"user{i}", True)
+
+    assert len(loader._render_cache) == 3
+    assert [key[1] for key in loader._render_cache] == ["user7", "user8", "user9"]
+
+
+def test_render_cache_evicts_least_recently_used():
+    first = generate_prompt_from_template("Muice", "a", True)
+    for userid in ("b", "c"):
+        generate_prompt_from_template("Muice", userid, True)
+
+    assert generate_prompt_from_template("Muice", "a", True) is first
+    generate_prompt_from_template("Muice", "d", True)
+
+    assert [key[1] for key in loader._render_cache] == ["c", "a", "d"]
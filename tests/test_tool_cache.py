@@ -0,0 +1,78 @@
+"""
+检查工具结果缓存只依据调用结果的失败标记：超时与执行出错不缓存，内容恰好以 "Error" 开头的正常结果照常缓存
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from muicebot.llm.utils import tools
+from muicebot.plugin.func_call import CachePolicy, tool_cache
+from muicebot.plugin.func_call.caller import Caller
+from muicebot.plugin.mcp import client
+
+
+@pytest.fixture(autouse=True)
+def _registry(monkeypatch: pytest.MonkeyPatch):
+    callers: dict[str, Caller] = {}
+    monkeypatch.setattr(tools, "get_function_calls", lambda: callers)
+    tool_cache.clear()
+    yield callers
+    tool_cache.clear()
+
+
+def _register(callers: dict[str, Caller], name: str, result: str, delay: float = 0, timeout=None) -> list:
+    calls: list = []
+
+    async def _function():
+        calls.append(name)
+        await asyncio.sleep(delay)
+        return result
+
+    caller = Caller("test", timeout=timeout, cache=CachePolicy(ttl=60))
+    caller.function = _function
+    callers[name] = caller
+    return calls
+
+
+def test_error_like_result_cached(run, _registry):
+    calls = _register(_registry, "glossary", "Error executing tool: MCP 工具调用失败时的提示")
+
+    for _ in range(2):
+        assert run(tools.function_call_handler("glossary")).startswith("Error executing tool")
+
+    assert len(calls) == 1
+
+
+def test_timeout_not_cached(run, _registry):
+    calls = _register(_registry, "slow", "done", delay=0.2, timeout=0.05)
+
+    for _ in range(2):
+        assert run(tools.function_call_handler("slow")).startswith("(Function call timed out")
+
+    assert len(calls) == 2
+
+
+def test_unknown_function_not_cached(run, monkeypatch: pytest.MonkeyPatch):
+    async def _handle_mcp_tool(tool, arguments=None):
+        return None
+
+    monkeypatch.setattr(tools, "handle_mcp_tool", _handle_mcp_tool)
+    monkeypatch.setattr(tools, "get_mcp_cache_policy", lambda tool: CachePolicy())
+
+    assert run(tools.function_call_handler("missing")) == "(Unknown Function)"
+    assert not tool_cache._entries
+
+
+def test_mcp_error_flagged(run, monkeypatch: pytest.MonkeyPatch):
+    async def _execute_tool(tool, arguments):
+        raise RuntimeError("connection closed")
+
+    server = SimpleNamespace(tools_cache_valid=lambda: True, execute_tool=_execute_tool)
+    monkeypatch.setitem(client._tool_routes, "remote", server)
+
+    result = run(client.handle_mcp_tool("remote", {}))
+
+    assert result is not None and result.failed
+    assert "connection closed" in result.content
@@ -0,0 +1,121 @@
+"""
+检查工具调用循环的预算（步数、Tokens、截止时间）以及在截止时间内并发执行工具调用
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from muicebot.llm import _tool_loop
+from muicebot.llm._config import ModelConfig
+from muicebot.llm._tool_loop import ToolLoop
+
+
+def _loop(**kwargs) -> ToolLoop:
+    return ToolLoop(ModelConfig(provider="openai", **kwargs))
+
+
+@pytest.fixture
+def tools(monkeypatch: pytest.MonkeyPatch):
+    """以函数名区分的假工具：sleep:<秒数> 休眠后返回，fail 抛出异常，其余原样返回参数"""
+
+    async def _handler(name: str, arguments: dict):
+        if name.startswith("sleep:"):
+            await asyncio.sleep(float(name.split(":")[1]))
+            return name
+        if name == "fail":
+            raise RuntimeError("boom")
+        return arguments
+
+    monkeypatch.setattr(_tool_loop, "function_call_handler", _handler)
+
+
+def test_max_steps():
+    loop = _loop(tool_max_steps=2)
+    for _ in range(2):
+        loop.start_step()
+        loop.finish_model(10)
+        assert loop.can_continue()
+
+    loop.start_step()
+    loop.finish_model(10)
+    assert not loop.can_continue()
+    assert loop.stop_reason == "超过最大步数 2"
+    assert "超过最大步数 2" in loop.stop_message
+
+
+def test_token_budget():
+    loop = _loop(tool_token_budget=100)
+    loop.start_step()
+    loop.finish_model(60)
+    assert loop.can_continue()
+
+    loop.start_step()
+    loop.finish_model(40)
+    assert not loop.can_continue()
+    assert loop.total_tokens == 100
+    assert loop.stop_reason == "超过 Tokens 预算 100"
+
+
+def test_deadline():
+    loop = _loop(tool_loop_timeout=5)
+    loop.start_step()
+    loop.finish_model()
+    assert loop.can_continue()
+    assert loop.remaining is not None and 0 < loop.remaining <= 5
+
+    loop.deadline = time.monotonic() - 1
+    assert loop.remaining == 0
+    assert not loop.can_continue()
+    assert loop.stop_reason == "超过截止时间"
+
+
+def test_no_deadline_by_default():
+    loop = _loop()
+    assert loop.deadline is None and loop.remaining is None
+
+
+def test_timings_recorded(run, tools):
+    timings: dict[str, float] = {}
+    loop = ToolLoop(ModelConfig(provider="openai"), timings)
+    loop.start_step()
+    loop.finish_model(5)
+    run(loop.run_tools([("echo", {"a": 1})]))
+    loop.finish()
+
+    assert set(timings) == {"step1.model", "step1.tools"}
+    assert loop.step.tool_calls == 1
+
+
+def test_run_tools_concurrently(run, tools):
+    loop = _loop()
+    loop.start_step()
+
+    start = time.perf_counter()
+    results = run(loop.run_tools([("sleep:0.2", {}), ("sleep:0.2", {}), ("echo", {"x": 1})]))
+    elapsed = time.perf_counter() - start
+
+    assert results == ["sleep:0.2", "sleep:0.2", {"x": 1}]
+    assert elapsed < 0.35
+
+
+def test_run_tools_under_deadline(run, tools):
+    loop = _loop(tool_loop_timeout=0.2)
+    loop.start_step()
+
+    start = time.perf_counter()
+    results = run(loop.run_tools([("sleep:5", {}), ("echo", {"x": 1}), ("fail", {})]))
+    elapsed = time.perf_counter() - start
+
+    assert results[0].startswith("(Function call timed out")
+    assert results[1] == {"x": 1}
+    assert results[2] == "(Function call failed: boom)"
+    assert elapsed < 1
+    assert not loop.can_continue()
+
+
+def test_run_no_tools(run, tools):
+    loop = _loop()
+    loop.start_step()
+    assert run(loop.run_tools([])) == []
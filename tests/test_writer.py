@@ -0,0 +1,155 @@
+"""
+检查后台写入队列：提交后回填 ID、失败重试与丢弃，以及调用方被取消时 `flush` 仍完成写入
+"""
+
+import asyncio
+from typing import List
+
+import pytest
+from nonebot_plugin_orm import get_session
+from sqlalchemy import select
+
+from muicebot.config import plugin_config
+from muicebot.database import writer
+from muicebot.database.cache import history_cache
+from muicebot.database.orm_models import Msg
+from muicebot.database.writer import PersistenceQueue
+from muicebot.models import Message
+
+
+@pytest.fixture
+def queue(run, database, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(writer, "_RETRY_BASE_DELAY", 0.001)
+    queue = PersistenceQueue()
+    yield queue
+    run(queue.stop())
+
+
+async def _stored(userid: str) -> List[Msg]:
+    async with get_session() as session:
+        return list((await session.execute(select(Msg).where(Msg.userid == userid).order_by(Msg.id))).scalars())
+
+
+def _fail_times(queue: PersistenceQueue, monkeypatch: pytest.MonkeyPatch, times: int) -> List[int]:
+    """使 `_commit` 前 `times` 次失败，返回记录每次调用的列表"""
+    commit = queue._commit
+    calls: List[int] = []
+
+    async def _commit(batch):
+        calls.append(len(batch))
+        if len(calls) <= times:
+            raise RuntimeError("database is locked")
+        await commit(batch)
+
+    monkeypatch.setattr(queue, "_commit", _commit)
+    return calls
+
+
+def test_ids_backfilled_in_order(run, queue: PersistenceQueue):
+    userid = "writer-backfill"
+    messages = [Message(userid=userid, message=f"m{i}") for i in range(5)]
+
+    async def _write():
+        for message in messages:
+            await queue.put_message(message)
+        await queue.flush()
+        return await _stored(userid)
+
+    rows = run(_write())
+    assert [row.message for row in rows] == [f"m{i}" for i in range(5)]
+    assert [message.id for message in messages] == [row.id for row in rows]
+    assert queue.pending == 0
+
+
+def test_backfilled_id_visible_in_cache(run, queue: PersistenceQueue, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(plugin_config, "max_history_epoch", 3)
+    history_cache.clear()
+    userid = "writer-cache-id"
+    pending = history_cache.begin_fill((userid, "_default"), 3)
+    history_cache.fill_user_history(userid, "_default", [], pending)
+
+    async def _write():
+        await queue.put_message(history_cache.append(Message(userid=userid, message="m")))
+        await queue.flush()
+        return await _stored(userid)
+
+    rows = run(_write())
+    cached = history_cache.get_user_history(userid, "_default", 3)
+    assert cached is not None
+    assert [item.id for item in cached] == [rows[0].id]
+
+
+def test_retry_until_committed(run, queue: PersistenceQueue, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(plugin_config, "db_write_max_retries", 3)
+    calls = _fail_times(queue, monkeypatch, 2)
+    userid = "writer-retry"
+
+    async def _write():
+        await queue.put_message(Message(userid=userid, message="m"))
+        await queue.flush()
+        return await _stored(userid)
+
+    rows = run(_write())
+    assert calls == [1, 1, 1]
+    assert [row.message for row in rows] == ["m"]
+
+
+def test_discard_after_retries(run, queue: PersistenceQueue, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(plugin_config, "db_write_max_retries", 1)
+    monkeypatch.setattr(plugin_config, "max_history_epoch", 3)
+    calls = _fail_times(queue, monkeypatch, 10)
+    userid = "writer-discard"
+
+    history_cache.clear()
+    pending = history_cache.begin_fill((userid, "_default"), 3)
+    history_cache.fill_user_history(userid, "_default", [], pending)
+
+    async def _write():
+        await queue.put_message(history_cache.append(Message(userid=userid, message="m")))
+        await queue.flush()
+        return await _stored(userid)
+
+    assert run(_write()) == []
+    assert calls == [1, 1]
+    assert queue.pending == 0
+    # 缓存中的消息已无法落库，缓存需失效以便之后从数据库重新读取
+    assert history_cache.get_user_history(userid, "_default", 3) is None
+
+
+def test_flush_completes_when_caller_cancelled(run, queue: PersistenceQueue, monkeypatch: pytest.MonkeyPatch):
+    commit = queue._commit
+    started = asyncio.Event()
+
+    async def _slow_commit(batch):
+        started.set()
+        await asyncio.sleep(0.05)
+        await commit(batch)
+
+    monkeypatch.setattr(queue, "_commit", _slow_commit)
+    userid = "writer-cancel"
+
+    async def _write():
+        await queue.put_message(Message(userid=userid, message="m"))
+        task = asyncio.create_task(queue.flush())
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # 再次 flush 时等待被屏蔽的写入完成
+        await queue.flush()
+        return await _stored(userid)
+
+    assert [row.message for row in run(_write())] == ["m"]
+
+
+def test_stop_writes_remaining_records(run, queue: PersistenceQueue):
+    userid = "writer-stop"
+
+    async def _write():
+        for i in range(3):
+            await queue.put_message(Message(userid=userid, message=f"m{i}"))
+        await queue.stop()
+        return await _stored(userid)
+
+    assert [row.message for row in run(_write())] == ["m0", "m1", "m2"]